@@ -1,28 +1,38 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context
 import mysql.connector
 from mysql.connector import Error
 import sys
-import string
 import pandas as pd
 import nltk
-from nltk.corpus import stopwords
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import warnings
 from collections import defaultdict
 import os
 from werkzeug.utils import secure_filename
 import shutil
 from datetime import datetime
+import time
 import json
 import PyPDF2
 import google.cloud.vision as vision
 from scan.pdf_text_extractor import process_pdf_pypdf2
-from scan.enhanced_evaluator import EnhancedEvaluator
+from scan.ocr_backends import warm_up_ocr_backend
+from scan.llm_client import get_llm_client, llm_health
+from scan.grading_jobs import get_job_manager
+from scan.tracing import render_metrics, render_gauge
 
 warnings.filterwarnings("ignore")
 nltk.download("stopwords")
 
+# Load the OCR model/client at start-up instead of on the first upload. With a
+# pre-forking server each worker imports this module, so models load once per worker.
+if os.getenv("PRELOAD_OCR_MODELS", "0") == "1":
+    warm_up_ocr_backend()
+
+# Resume grading jobs interrupted by a restart now instead of on the first
+# request that touches them (under the debug reloader, only in the serving child)
+if __name__ != '__main__' or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+    get_job_manager()
+
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
 
@@ -190,43 +200,6 @@ if not test_db_connection():
 elif not init_db():
     print("Failed to initialize database. Please check your MySQL configuration.")
 
-# Set English stopwords
-EN_STOPWORDS = set(stopwords.words("english"))
-
-def preprocess_text(text):
-    # Convert to lowercase
-    text = text.lower()
-    # Remove punctuation
-    text = text.translate(str.maketrans('', '', string.punctuation))
-    # Remove stopwords
-    words = text.split()
-    words = [word for word in words if word not in EN_STOPWORDS]
-    return ' '.join(words)
-
-def enhanced_sentence_match(expected_answer, student_answer):
-    """Calculate similarity between expected and student answers using TF-IDF and cosine similarity"""
-    # Preprocess both answers
-    expected_processed = preprocess_text(expected_answer)
-    student_processed = preprocess_text(student_answer)
-    
-    # Create TF-IDF vectorizer
-    vectorizer = TfidfVectorizer()
-    
-    try:
-        # Create TF-IDF matrix
-        tfidf_matrix = vectorizer.fit_transform([expected_processed, student_processed])
-        
-        # Calculate cosine similarity
-        similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
-        
-        # Convert similarity to a score out of 10
-        score = similarity * 10
-        
-        return score
-    except Exception as e:
-        print(f"Error in similarity calculation: {str(e)}")
-        return 0.0
-
 # Admin login route
 @app.route('/')
 def index():
@@ -1090,6 +1063,11 @@ def upload_reference():
 
 @app.route('/generate_results', methods=['POST'])
 def generate_results():
+    """Queue grading of every uploaded answer sheet and return the job id straight away.
+
+    Poll /generate_results/<job_id> for progress and results. Pass ?wait=1 to
+    block until the job finishes and get the results in this response instead.
+    """
     try:
         # Check if required files exist
         answer_sheets_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'answer_sheets')
@@ -1109,39 +1087,34 @@ def generate_results():
         results_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'results')
         os.makedirs(results_dir, exist_ok=True)
         
-        # Initialize the evaluator
-        evaluator = EnhancedEvaluator()
+        # Grade every sheet in the background; sheets overlap and share the Ollama connection pool
+        student_files = os.listdir(answer_sheets_dir)
+        sheet_paths = [os.path.join(answer_sheets_dir, student_file) for student_file in student_files]
+        jobs = get_job_manager()
+        job_id = jobs.submit(sheet_paths, answer_key_path, results_dir)
         
-        results = []
-        # Process each student's answer sheet
-        for student_file in os.listdir(answer_sheets_dir):
-            student_file_path = os.path.join(answer_sheets_dir, student_file)
-            
-            # Create output file path for this student
-            output_file = os.path.join(results_dir, f"{os.path.splitext(student_file)[0]}_results.json")
-            
-            # Process the answer sheet
-            evaluator.process_answer_sheet(student_file_path, answer_key_path, output_file)
-            
-            # Read the results
-            with open(output_file, 'r', encoding='utf-8') as f:
-                student_results = json.load(f)
-            
-            # Calculate total score
-            total_score = sum(float(result['score']) for result in student_results)
-            max_score = len(student_results) * 10  # Assuming each question is out of 10
-            
-            results.append({
-                'student_file': student_file,
-                'total_score': f"{total_score}/{max_score}",
-                'detailed_results': student_results
-            })
+        if request.args.get('wait') == '1':
+            # Poll without the per-question results and read them once the job has finished
+            while jobs.status(job_id, include_results=False)['status'] in ('queued', 'running'):
+                time.sleep(1)
+            status = jobs.status(job_id)
+            return jsonify({
+                'success': status['status'] == 'completed',
+                'message': 'Results generated successfully!' if status['status'] == 'completed'
+                           else f"Grading job {status['status']}",
+                'job_id': job_id,
+                'reused': status['reused'],
+                'results': status['results']
+            }), 200
         
         return jsonify({
             'success': True,
-            'message': 'Results generated successfully!',
-            'results': results
-        }), 200
+            'message': 'Grading started',
+            'job_id': job_id,
+            'sheets': len(sheet_paths),
+            'status_url': url_for('generate_results_status', job_id=job_id),
+            'stream_url': url_for('stream_generate_results', job_id=job_id)
+        }), 202
         
     except Exception as e:
         return jsonify({
@@ -1149,6 +1122,108 @@ def generate_results():
             'message': f'Error generating results: {str(e)}'
         }), 500
 
+@app.route('/generate_results/<job_id>')
+def generate_results_status(job_id):
+    """Per-sheet progress, ETA and the results graded so far for a grading job."""
+    # ?results=0 skips the per-question results (use the stream and sheet endpoints for those)
+    status = get_job_manager().status(job_id, include_results=request.args.get('results') != '0')
+    if status is None:
+        return jsonify({'success': False, 'message': 'Unknown grading job'}), 404
+    return jsonify({'success': True, **status}), 200
+
+@app.route('/generate_results/<job_id>/stream')
+def stream_generate_results(job_id):
+    """Stream each sheet's summary as soon as it is graded.
+
+    Server-Sent Events by default; ?format=ndjson gives one JSON object per
+    line instead. Summaries carry a detail_url for the per-question results,
+    which are fetched only when needed. The last message reports the job's
+    final status.
+    """
+    jobs = get_job_manager()
+    if jobs.job_state(job_id) is None:
+        return jsonify({'success': False, 'message': 'Unknown grading job'}), 404
+    ndjson = request.args.get('format') == 'ndjson'
+
+    def encode(event, data):
+        if ndjson:
+            return json.dumps({'event': event, **data}) + '\n'
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def generate():
+        for sheet in jobs.iter_finished_sheets(job_id):
+            if sheet['status'] == 'done':
+                sheet['detail_url'] = url_for('generate_results_sheet', job_id=job_id, position=sheet['position'])
+            yield encode('sheet', sheet)
+        status = jobs.status(job_id, include_results=False)
+        yield encode('end', {'status': status['status'], 'progress': status['progress'],
+                             'reused': status['reused'], 'error': status['error']})
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/x-ndjson' if ndjson else 'text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/generate_results/<job_id>/sheets/<int:position>')
+def generate_results_sheet(job_id, position):
+    """Per-question results of one graded sheet."""
+    sheet = get_job_manager().sheet_results(job_id, position)
+    if sheet is None:
+        return jsonify({'success': False, 'message': 'Sheet not graded'}), 404
+    return jsonify({'success': True, **sheet}), 200
+
+@app.route('/generate_results/<job_id>', methods=['DELETE'])
+def purge_generate_results(job_id):
+    """Delete a finished grading job and its stored results."""
+    if not get_job_manager().purge(job_id):
+        return jsonify({'success': False, 'message': 'Job not found or still running'}), 409
+    return jsonify({'success': True, 'message': 'Job deleted'}), 200
+
+@app.route('/generate_results/<job_id>/cancel', methods=['POST'])
+def cancel_generate_results(job_id):
+    """Stop a grading job; sheets already being graded still finish."""
+    if not get_job_manager().cancel(job_id):
+        return jsonify({'success': False, 'message': 'Job is not running'}), 409
+    return jsonify({'success': True, 'message': 'Cancellation requested'}), 200
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics: per-stage latency histograms, cache/fallback/error counters and LLM circuit state."""
+    get_llm_client()
+    health = llm_health()
+    states = [({'endpoint': endpoint, 'state': state}, 1 if status['state'] == state else 0)
+              for endpoint, status in health.items() for state in ('closed', 'half_open', 'open')]
+    body = render_metrics() + render_gauge('llm_circuit_state', 'Circuit breaker state of each Ollama endpoint',
+                                           states)
+    # Load balancing across pooled endpoints (only reported when several endpoints are configured)
+    pooled = {endpoint: status for endpoint, status in health.items() if 'dispatched' in status}
+    if pooled:
+        body += render_gauge('llm_outstanding_requests', 'Requests in flight on each pooled Ollama endpoint',
+                             [({'endpoint': endpoint}, status['outstanding']) for endpoint, status in pooled.items()])
+        body += render_gauge('llm_dispatched_total', 'Requests the pool sent to each Ollama endpoint',
+                             [({'endpoint': endpoint}, status['dispatched']) for endpoint, status in pooled.items()],
+                             kind='counter')
+        body += render_gauge('llm_retried_elsewhere_total',
+                             'Requests moved to another endpoint after this one could not be reached',
+                             [({'endpoint': endpoint}, status['retried_elsewhere'])
+                              for endpoint, status in pooled.items()],
+                             kind='counter')
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/llm_health')
+def llm_health_status():
+    """Circuit breaker state and load of the Ollama endpoint(s) used for grading.
+
+    Answers 503 only when no endpoint can take requests; endpoints whose
+    circuit is not closed are listed under 'degraded'.
+    """
+    get_llm_client()  # make sure the configured endpoints are reported even before any grading
+    health = llm_health()
+    degraded = sorted(endpoint for endpoint, status in health.items() if status['state'] != 'closed')
+    usable = any(status['state'] != 'open' for status in health.values())
+    state = 'down' if not usable else ('degraded' if degraded else 'ok')
+    return jsonify({'success': usable, 'state': state, 'degraded': degraded,
+                    'endpoints': health}), 200 if usable else 503
+
 @app.route('/upload_answer_sheet', methods=['GET', 'POST'])
 def upload_answer_sheet():
     if request.method == 'POST':
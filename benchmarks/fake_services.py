@@ -0,0 +1,195 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import base64
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.generate_sheets import decode_page_marker
+
+class ServiceStats:
+    def __init__(self):
+        self.requests = 0
+        self.items = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def add(self, items: int = 1, error: bool = False) -> None:
+        with self._lock:
+            self.requests += 1
+            self.items += items
+            self.errors += int(error)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"requests": self.requests, "items": self.items, "errors": self.errors}
+
+class FakeService:
+    """Latency and error injection shared by the fake servers.
+
+    Each request sleeps ``latency + item_latency * items`` seconds scaled by a
+    random factor in [1 - jitter, 1 + jitter], and fails with probability
+    ``error_rate``. At most ``parallel`` requests are served at once; the rest
+    queue, like a model server with a fixed number of slots.
+    """
+
+    def __init__(self, latency: float = 0.0, item_latency: float = 0.0, jitter: float = 0.3,
+                 error_rate: float = 0.0, parallel: int = 4, seed: int = 0):
+        self.latency = latency
+        self.item_latency = item_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stats = ServiceStats()
+        self._slots = threading.BoundedSemaphore(max(1, parallel))
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def serve(self, items: int) -> bool:
+        """Wait out the simulated work; returns False if this request should fail."""
+        with self._rng_lock:
+            factor = self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+            fail = self._rng.random() < self.error_rate
+        with self._slots:
+            time.sleep(max(0.0, (self.latency + self.item_latency * items) * factor))
+        self.stats.add(items, fail)
+        return not fail
+
+def _handler(routes):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, body: Dict) -> None:
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _dispatch(self, method: str) -> None:
+            route = routes.get((method, self.path.split('?')[0]))
+            if route is None:
+                self._reply(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            status, body = route(payload)
+            self._reply(status, body)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+class FakeVision(FakeService):
+    """Stand-in for the Vision REST API's images:annotate.
+
+    Pages are identified by the marker generate_sheets draws on them, and the
+    page's text is returned from the corpus, so OCR output is exact and free.
+    """
+
+    def __init__(self, corpus: Dict[str, str], **options):
+        super().__init__(**options)
+        self.corpus = corpus
+
+    def annotate(self, payload: Dict):
+        requests = payload.get("requests", [])
+        if not self.serve(len(requests)):
+            return 503, {"error": {"code": 503, "message": "Injected Vision error", "status": "UNAVAILABLE"}}
+        responses = []
+        for request in requests:
+            image = Image.open(io.BytesIO(base64.b64decode(request["image"]["content"])))
+            text = self.corpus.get(str(decode_page_marker(image)), "")
+            responses.append({"fullTextAnnotation": {"text": text}})
+        return 200, {"responses": responses}
+
+    def routes(self):
+        return {("POST", "/v1/images:annotate"): self.annotate,
+                ("GET", "/stats"): lambda payload: (200, self.stats.snapshot())}
+
+class FakeOllama(FakeService):
+    """Stand-in for Ollama's /api/generate and /api/tags.
+
+    Scores are derived from a hash of the prompt, so repeated runs grade the
+    same answers the same way. Batched prompts ("### Item N" blocks) get one
+    result per item; latency grows with the number of items graded.
+    """
+
+    def generate(self, payload: Dict):
+        prompt = payload.get("prompt", "")
+        items = re.findall(r"^### Item (\d+)$", prompt, re.MULTILINE)
+        if not self.serve(max(1, len(items))):
+            return 500, {"error": "Injected model error"}
+
+        def grade(text: str) -> Dict:
+            score = int(hashlib.sha256(text.encode('utf-8')).hexdigest(), 16) % 11
+            return {"score": score, "feedback": f"Synthetic feedback for a score of {score}/10."}
+
+        if items:
+            blocks = re.split(r"^### Item \d+$", prompt, flags=re.MULTILINE)[1:]
+            response = {"results": [{"id": int(number), **grade(block)} for number, block in zip(items, blocks)]}
+        else:
+            response = {**grade(prompt), "suggestions": ["Add more detail."]}
+        return 200, {"model": payload.get("model"), "response": json.dumps(response), "done": True}
+
+    def routes(self):
+        return {("POST", "/api/generate"): self.generate,
+                ("GET", "/api/tags"): lambda payload: (200, {"models": [{"name": "mistral:latest"}]}),
+                ("GET", "/stats"): lambda payload: (200, self.stats.snapshot())}
+
+def start_server(service, port: int = 0, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve ``service`` on a daemon thread; port 0 picks a free port (see server.server_address)."""
+    server = ThreadingHTTPServer((host, port), _handler(service.routes()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"fake-{type(service).__name__}", daemon=True).start()
+    return server
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Run fake Vision and Ollama servers for benchmarks")
+    parser.add_argument("--corpus", required=True, help="corpus.json written by generate_sheets.py")
+    parser.add_argument("--vision-port", type=int, default=0)
+    parser.add_argument("--ollama-port", type=int, default=0)
+    parser.add_argument("--ocr-latency", type=float, default=0.5, help="seconds per Vision request")
+    parser.add_argument("--ocr-error-rate", type=float, default=0.0)
+    parser.add_argument("--ocr-parallel", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds per Ollama request")
+    parser.add_argument("--llm-item-latency", type=float, default=0.5, help="extra seconds per batched answer")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-parallel", type=int, default=4, help="requests Ollama serves at once")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    vision = start_server(FakeVision(corpus, latency=args.ocr_latency, error_rate=args.ocr_error_rate,
+                                     parallel=args.ocr_parallel, seed=args.seed), args.vision_port)
+    ollama = start_server(FakeOllama(latency=args.llm_latency, item_latency=args.llm_item_latency,
+                                     error_rate=args.llm_error_rate, parallel=args.llm_parallel,
+                                     seed=args.seed), args.ollama_port)
+    # First line tells a parent process where the servers are listening
+    print(json.dumps({"vision": f"http://127.0.0.1:{vision.server_address[1]}",
+                      "ollama": f"http://127.0.0.1:{ollama.server_address[1]}"}), flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
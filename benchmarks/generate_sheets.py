@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import random
+import textwrap
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageDraw
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scan.answer_key import get_answer_key
+
+DEFAULT_ANSWER_KEY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "answer_key.docx")
+CORPUS_NAME = "corpus.json"
+
+# Scanned pages are A4 at 150 dpi; the page id is drawn as a row of black/white
+# blocks across the top so the fake Vision server can tell which page it was sent
+PAGE_SIZE = (1240, 1754)
+PAGE_DPI = 150
+MARKER_BITS = 24
+MARKER_X, MARKER_Y, MARKER_STEP, MARKER_SIZE = 0.04, 0.01, 0.03, 0.02
+LINES_PER_PAGE = 55
+LINE_WIDTH = 90
+
+# How students answered: (kind, probability)
+ANSWER_MIX = (("full", 0.4), ("partial", 0.3), ("off_topic", 0.15), ("blank", 0.15))
+
+def marker_boxes(width: int, height: int) -> List[tuple]:
+    """Pixel boxes of the page-id marker bits, most significant bit first."""
+    boxes = []
+    for bit in range(MARKER_BITS):
+        left = (MARKER_X + bit * MARKER_STEP) * width
+        top = MARKER_Y * height
+        boxes.append((int(left), int(top), int(left + MARKER_SIZE * width), int(top + MARKER_SIZE * height)))
+    return boxes
+
+def decode_page_marker(image: Image.Image) -> int:
+    """Read the page id back from a rendered page, at whatever resolution it was rasterized."""
+    gray = image.convert('L')
+    value = 0
+    for left, top, right, bottom in marker_boxes(*gray.size):
+        dark = gray.getpixel(((left + right) // 2, (top + bottom) // 2)) < 128
+        value = (value << 1) | int(dark)
+    return value
+
+def _plain(text: str) -> str:
+    """ASCII-friendly text that the built-in PDF font and the answer splitter both handle."""
+    for old, new in (('’', "'"), ('‘', "'"), ('“', '"'), ('”', '"'),
+                     ('–', '-'), ('—', '-'), ('?', '.')):
+        text = text.replace(old, new)
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+def student_answer(rng: random.Random, ideal: str, other_ideals: List[str]) -> str:
+    """One synthetic answer: a near copy, a truncated copy, another question's answer, or nothing."""
+    roll, kind = rng.random(), ANSWER_MIX[-1][0]
+    for name, probability in ANSWER_MIX:
+        if roll < probability:
+            kind = name
+            break
+        roll -= probability
+    words = ideal.split()
+    if kind == "full":
+        return ' '.join(word for word in words if rng.random() > 0.1)
+    if kind == "partial":
+        return ' '.join(words[:max(1, int(len(words) * rng.uniform(0.3, 0.6)))])
+    if kind == "off_topic" and other_ideals:
+        other = rng.choice(other_ideals).split()
+        rng.shuffle(other)
+        return ' '.join(other[:max(5, len(other) // 3)])
+    return ""
+
+def sheet_lines(questions: List[str], answers: List[str]) -> List[str]:
+    """The text lines of a sheet: each question's first line followed by the wrapped answer."""
+    lines = []
+    for question, answer in zip(questions, answers):
+        lines.append(_plain(question.split('\n')[0].strip()))
+        for line in textwrap.wrap(_plain(answer), LINE_WIDTH):
+            # Keep answer lines from looking like the start of a new question
+            lines.append(f"- {line}" if line[:1].isdigit() or line[:1] in "Qq" else line)
+        lines.append("")
+    return lines
+
+def _paginate(lines: List[str]) -> List[List[str]]:
+    return [lines[start:start + LINES_PER_PAGE] for start in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+
+def write_scanned_pdf(path: str, pages: List[List[str]], first_page_id: int) -> None:
+    """Image-only PDF (no text layer, like a scan) with each page's id in its marker."""
+    images = []
+    for offset, lines in enumerate(pages):
+        image = Image.new('L', PAGE_SIZE, 255)
+        draw = ImageDraw.Draw(image)
+        page_id = first_page_id + offset
+        for bit, box in enumerate(marker_boxes(*PAGE_SIZE)):
+            if page_id >> (MARKER_BITS - 1 - bit) & 1:
+                draw.rectangle(box, fill=0)
+        for number, line in enumerate(lines):
+            draw.text((int(0.06 * PAGE_SIZE[0]), int(0.05 * PAGE_SIZE[1]) + number * 28), line, fill=0)
+        images.append(image)
+    images[0].save(path, "PDF", resolution=PAGE_DPI, save_all=True, append_images=images[1:])
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def write_digital_pdf(path: str, pages: List[List[str]]) -> None:
+    """Minimal PDF with a Helvetica text layer, so pages take the embedded-text route."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    page_refs = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 14 TL 50 800 Td\n" + "".join(f"({_pdf_escape(line)}) '\n" for line in lines) + "ET"
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_refs.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(page_refs)} >>"
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode('latin-1')
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def generate_sheets(out_dir: str, count: int, answer_key_path: str = DEFAULT_ANSWER_KEY,
+                    kind: str = "scanned", seed: int = 0) -> Dict:
+    """Write ``count`` answer sheets for the key's questions to ``out_dir``.
+
+    ``kind`` is "scanned" (image-only pages, read by OCR) or "digital" (text
+    layer). Sheets are reproducible for a given seed. The text of every
+    scanned page is saved to ``corpus.json`` by page id for the fake Vision
+    server. Returns {"sheets": [paths], "corpus": path, "pages": n}.
+    """
+    if kind not in ("scanned", "digital"):
+        raise ValueError(f"Unknown sheet kind '{kind}'; expected scanned or digital")
+    answer_key = get_answer_key(answer_key_path)
+    if answer_key is None or not len(answer_key):
+        raise ValueError(f"No questions found in {answer_key_path}")
+    questions, ideals = list(answer_key.questions), list(answer_key.ideal_answers)
+
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    corpus: Dict[str, str] = {}
+    sheets = []
+    for number in range(count):
+        answers = [student_answer(rng, ideal, ideals[:position] + ideals[position + 1:])
+                   for position, ideal in enumerate(ideals)]
+        pages = _paginate(sheet_lines(questions, answers))
+        path = os.path.join(out_dir, f"sheet_{number:04d}.pdf")
+        if kind == "scanned":
+            first_page_id = len(corpus)
+            for offset, lines in enumerate(pages):
+                corpus[str(first_page_id + offset)] = '\n'.join(lines)
+            write_scanned_pdf(path, pages, first_page_id)
+        else:
+            write_digital_pdf(path, pages)
+        sheets.append(path)
+
+    corpus_path = os.path.join(out_dir, CORPUS_NAME)
+    with open(corpus_path, 'w', encoding='utf-8') as f:
+        json.dump(corpus, f)
+    return {"sheets": sheets, "corpus": corpus_path, "pages": len(corpus)}
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate synthetic answer sheets from an answer key")
+    parser.add_argument("out_dir")
+    parser.add_argument("count", type=int)
+    parser.add_argument("--answer-key", default=DEFAULT_ANSWER_KEY)
+    parser.add_argument("--kind", choices=("scanned", "digital"), default="scanned")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    generated = generate_sheets(args.out_dir, args.count, args.answer_key, args.kind, args.seed)
+    print(f"Wrote {len(generated['sheets'])} {args.kind} sheets to {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
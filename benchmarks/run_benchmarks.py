@@ -0,0 +1,248 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+from benchmarks.generate_sheets import generate_sheets, DEFAULT_ANSWER_KEY
+
+SCENARIOS = (1, 50, 500)
+# "evaluator" calls EnhancedEvaluator.process_answer_sheets; "web" posts to /generate_results?wait=1
+TARGETS = ("evaluator", "web")
+RESULT_PREFIX = "BENCHMARK_RESULT "
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+def sheet_latencies(trace_path: str) -> Dict[str, float]:
+    """Per-sheet latency (first span start to last span end), keyed by sheet file name.
+
+    Works for every grading path, since all of them tag their spans with the sheet name.
+    """
+    bounds: Dict[str, List[float]] = {}
+    if not os.path.exists(trace_path):
+        return {}
+    with open(trace_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                span = json.loads(line)
+            except ValueError:
+                continue
+            sheet = span["attributes"].get("sheet")
+            if sheet is None:
+                continue
+            end = span["start"] + span["duration"]
+            first, last = bounds.get(sheet, (span["start"], end))
+            bounds[sheet] = [min(first, span["start"]), max(last, end)]
+    return {sheet: last - first for sheet, (first, last) in bounds.items()}
+
+def peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def run_child(config: Dict) -> Dict:
+    """Grade one scenario in this (fresh) process and measure it."""
+    sheets, answer_key_path, work_dir = config["sheets"], config["answer_key"], config["work_dir"]
+    if config["target"] == "evaluator":
+        from scan.enhanced_evaluator import EnhancedEvaluator
+        evaluator = EnhancedEvaluator()
+        start = time.perf_counter()
+        results = evaluator.process_answer_sheets(sheets, answer_key_path, os.path.join(work_dir, "results"))
+        # A sheet that could not be graded comes back with no results
+        graded = {os.path.basename(path) for path, sheet_results in results.items() if sheet_results}
+    else:
+        import admin
+        upload_dir = os.path.join(work_dir, "uploads")
+        for folder, files in (("answer_sheets", sheets), ("answer_keys", [answer_key_path])):
+            os.makedirs(os.path.join(upload_dir, folder), exist_ok=True)
+            for path in files:
+                shutil.copy(path, os.path.join(upload_dir, folder, os.path.basename(path)))
+        admin.app.config['UPLOAD_FOLDER'] = upload_dir
+        client = admin.app.test_client()
+        start = time.perf_counter()
+        response = client.post('/generate_results?wait=1')
+        if response.status_code != 200 or not (response.get_json() or {}).get('success'):
+            raise RuntimeError(f"/generate_results answered {response.status_code}: {response.get_data(as_text=True)[:500]}")
+        # The job's results list holds the sheets that finished grading
+        graded = {entry['student_file'] for entry in response.get_json()['results']}
+    seconds = time.perf_counter() - start
+
+    # Graded sheets come from the grading call itself; the trace only supplies their latencies
+    latencies = sheet_latencies(os.environ["TRACE_LOG"])
+    values = [latencies[sheet] for sheet in graded if sheet in latencies]
+    return {
+        "sheets": len(sheets),
+        "graded": len(graded),
+        "failed": len(sheets) - len(graded),
+        "seconds": seconds,
+        "sheets_per_min": len(graded) / seconds * 60 if seconds else 0.0,
+        "p50_seconds": percentile(values, 0.5),
+        "p95_seconds": percentile(values, 0.95),
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+def _service_stats(url: str) -> Dict:
+    with urllib.request.urlopen(f"{url}/stats", timeout=10) as response:
+        return json.load(response)
+
+def start_fake_services(corpus_path: str, options: List[str]) -> Tuple[subprocess.Popen, Dict[str, str]]:
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, "benchmarks", "fake_services.py"),
+                                "--corpus", corpus_path] + options,
+                               stdout=subprocess.PIPE, text=True, cwd=REPO_ROOT)
+    line = process.stdout.readline()
+    if not line:
+        process.wait()
+        raise RuntimeError("Fake services failed to start")
+    return process, json.loads(line)
+
+def run_scenario(count: int, target: str, sheets: List[str], answer_key_path: str,
+                 services: Dict[str, str], base_dir: str) -> Dict:
+    """Grade the first ``count`` sheets in a subprocess with fresh caches and stores."""
+    work_dir = tempfile.mkdtemp(prefix=f"{target}_{count}_", dir=base_dir)
+    env = dict(os.environ,
+               OCR_BACKEND="vision",
+               VISION_API_ENDPOINT=services["vision"],
+               OLLAMA_ENDPOINTS=f"{services['ollama']}/api/generate",
+               RESULTS_DB=os.path.join(work_dir, "results.sqlite3"),
+               GRADING_CACHE_PATH=os.path.join(work_dir, "grading.sqlite3"),
+               GRADING_JOBS_DB=os.path.join(work_dir, "jobs.sqlite3"),
+               OCR_CACHE_DIR=os.path.join(work_dir, "ocr"),
+               EMBEDDING_CACHE_DIR=os.path.join(work_dir, "embeddings"),
+               TRACE_LOG=os.path.join(work_dir, "trace.jsonl"))
+    config = {"target": target, "sheets": sheets[:count], "answer_key": answer_key_path, "work_dir": work_dir}
+    before = {name: _service_stats(url) for name, url in services.items()}
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(config)],
+                             env=env, cwd=REPO_ROOT, capture_output=True, text=True)
+    after = {name: _service_stats(url) for name, url in services.items()}
+    with open(os.path.join(work_dir, "output.log"), 'w', encoding='utf-8') as f:
+        f.write(process.stdout + process.stderr)
+
+    result = {"scenario": count, "target": target, "work_dir": work_dir}
+    lines = [line for line in process.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+    if process.returncode != 0 or not lines:
+        result["error"] = (process.stderr or process.stdout).strip().splitlines()[-1:] or ["no output"]
+        result["error"] = result["error"][0]
+    else:
+        result.update(json.loads(lines[-1][len(RESULT_PREFIX):]))
+    for name in services:
+        result[f"{name}_requests"] = after[name]["requests"] - before[name]["requests"]
+        result[f"{name}_injected_errors"] = after[name]["errors"] - before[name]["errors"]
+    return result
+
+def print_report(results: List[Dict]) -> None:
+    def number(value, digits=2):
+        return "-" if value is None else f"{value:.{digits}f}"
+
+    print(f"\n{'sheets':>6} {'target':<10} {'graded':>6} {'seconds':>8} {'sheets/min':>10} "
+          f"{'p50 s':>7} {'p95 s':>7} {'peak RSS MB':>11} {'LLM reqs':>8} {'OCR reqs':>8}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['scenario']:>6} {result['target']:<10} failed: {result['error']}")
+            continue
+        rss = result["peak_rss_bytes"] / (1024 * 1024) if result["peak_rss_bytes"] else None
+        print(f"{result['scenario']:>6} {result['target']:<10} {result['graded']:>6} {number(result['seconds'], 1):>8} "
+              f"{number(result['sheets_per_min'], 1):>10} {number(result['p50_seconds']):>7} "
+              f"{number(result['p95_seconds']):>7} {number(rss, 0):>11} {result['ollama_requests']:>8} "
+              f"{result['vision_requests']:>8}")
+
+def compare_to_baseline(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """Describe every scenario that got slower than the baseline by more than ``tolerance``."""
+    previous = {(result["scenario"], result["target"]): result for result in baseline if "error" not in result}
+    regressions = []
+    for result in results:
+        old = previous.get((result["scenario"], result["target"]))
+        if old is None:
+            continue
+        name = f"{result['scenario']} sheets via {result['target']}"
+        if "error" in result:
+            regressions.append(f"{name}: failed ({result['error']})")
+            continue
+        if result["sheets_per_min"] < old["sheets_per_min"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['sheets_per_min']:.1f} sheets/min "
+                               f"(baseline {old['sheets_per_min']:.1f})")
+        if old["p95_seconds"] and result["p95_seconds"] and result["p95_seconds"] > old["p95_seconds"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_seconds']:.2f}s (baseline {old['p95_seconds']:.2f}s)")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--child"]:
+        print(RESULT_PREFIX + json.dumps(run_child(json.loads(argv[1]))), flush=True)
+        return 0
+
+    parser = argparse.ArgumentParser(
+        description="Offline grading benchmark with fake Vision and Ollama servers",
+        epilog="Other flags (--ocr-latency, --llm-latency, --llm-error-rate, ...) are passed to fake_services.py. "
+               "Grading settings such as GRADING_MODE or GRADING_PIPELINE are taken from the environment.")
+    parser.add_argument("--scenarios", default=",".join(map(str, SCENARIOS)), help="sheet counts, comma-separated")
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--answer-key", default=DEFAULT_ANSWER_KEY)
+    parser.add_argument("--kind", choices=("scanned", "digital"), default="scanned",
+                        help="scanned sheets go through Poppler and OCR; digital ones have a text layer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="keep sheets, logs and traces here (default: a temporary directory)")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="results JSON of an earlier run; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown against the baseline")
+    args, service_options = parser.parse_known_args(argv)
+
+    scenarios = [int(count) for count in args.scenarios.split(",") if count.strip()]
+    targets = [target.strip() for target in args.targets.split(",") if target.strip()]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(sorted(unknown))}")
+    if args.kind == "scanned":
+        from scan.pdf_text_extractor import POPPLER_PATH
+        if not os.path.exists(POPPLER_PATH):
+            print(f"Error: Poppler not found at {POPPLER_PATH}; set POPPLER_PATH or use --kind digital")
+            return 2
+
+    base_dir = args.work_dir or tempfile.mkdtemp(prefix="grading_benchmark_")
+    os.makedirs(base_dir, exist_ok=True)
+    print(f"Generating {max(scenarios)} {args.kind} sheets in {base_dir}")
+    generated = generate_sheets(os.path.join(base_dir, "sheets"), max(scenarios), args.answer_key,
+                                args.kind, args.seed)
+    services_process, services = start_fake_services(generated["corpus"], service_options)
+    results = []
+    try:
+        for count in scenarios:
+            for target in targets:
+                print(f"Running {count} sheet(s) via {target}...", flush=True)
+                results.append(run_scenario(count, target, generated["sheets"], args.answer_key,
+                                            services, base_dir))
+    finally:
+        services_process.terminate()
+        services_process.wait()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+    if not args.work_dir:
+        print(f"Logs and traces kept in {base_dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
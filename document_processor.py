@@ -1,22 +1,14 @@
-from paddleocr import PaddleOCR
 import os
 from typing import Dict, List, Tuple
 import requests
 import json
+from scan.model_registry import get_paddle_ocr
 
 class DocumentProcessor:
     def __init__(self):
-        # Initialize PaddleOCR with handwriting recognition model
-        self.ocr = PaddleOCR(
-            use_angle_cls=True,
-            lang="en",
-            rec_model_dir=None  # Will auto-download
-        )
-        
-        # Download handwriting model if not already downloaded
-        print("Initializing OCR model...")
-        self.ocr.download_model('rec_en_server_handwritten')
-        print("OCR model initialized successfully!")
+        # Shared handwriting-capable PaddleOCR model; loaded once per process
+        # (from models/paddleocr when bundled) instead of once per instance
+        self.ocr = get_paddle_ocr(handwritten=True)
         
         # Mistral API endpoint (you'll need to replace this with your actual endpoint)
         self.mistral_api_endpoint = "YOUR_MISTRAL_API_ENDPOINT"
@@ -1,13 +1,26 @@
-from docx import Document
-import requests
+import os
 import re
+import sys
 from typing import Dict, List, Tuple
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scan.answer_key import get_answer_key
+
+# "Q1. <question>" followed by "A1. <answer>", as in the original docx regex
+QA_PATTERN = re.compile(r"Q\d+\.\s*(.*?)\nA\d+\.\s*(.*)", re.DOTALL)
+
 def load_answer_key(docx_path: str) -> Dict[str, str]:
-    doc = Document(docx_path)
-    full_text = "\n".join(p.text for p in doc.paragraphs)
-    qa_pairs = re.findall(r"Q\d+\.\s*(.*?)\nA\d+\.\s*(.*?)(?=\nQ\d+\.|\Z)", full_text, re.DOTALL)
-    return {q.strip(): a.strip() for q, a in qa_pairs}
+    # Same compiled (and memoized) key the evaluator grades against, with the
+    # Q/A numbering stripped; blocks that are not "Qn. ... An. ..." pairs are skipped
+    answer_key = get_answer_key(docx_path)
+    if answer_key is None:
+        return {}
+    qa_pairs = {}
+    for question, ideal_answer in answer_key.items():
+        match = QA_PATTERN.match(f"{question}\n{ideal_answer}")
+        if match:
+            qa_pairs[match.group(1).strip()] = match.group(2).strip()
+    return qa_pairs
 
 def grade_answer(question: str, student_answer: str, ideal_answer: str) -> Tuple[float, str]:
     # Simple keyword matching for initial testing
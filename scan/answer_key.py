@@ -0,0 +1,178 @@
+import os
+import re
+import hashlib
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+@dataclass(frozen=True, eq=False)
+class CompiledAnswerKey:
+    """Parsed, read-only answer key shared by every grader in the process.
+
+    ``ideal_tokens`` holds the lowercased word set of each ideal answer (what
+    basic_evaluation compares against) and ``ideal_vectors`` the same sets as
+    a binary questions x vocabulary CSR matrix over ``vocabulary``.
+    """
+    key_id: str
+    source_path: str
+    questions: Tuple[str, ...]
+    ideal_answers: Tuple[str, ...]
+    ideal_tokens: Tuple[FrozenSet[str], ...]
+    vocabulary: Mapping[str, int]
+    ideal_vectors: sparse.csr_matrix
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def items(self) -> List[Tuple[str, str]]:
+        """(question, ideal_answer) pairs in key order."""
+        return list(zip(self.questions, self.ideal_answers))
+
+# A "Q1." paragraph starts a new question even without a blank paragraph before it
+QUESTION_START = re.compile(r"Q\d+\.")
+
+def _parse_sections(content: str) -> Tuple[List[str], List[str]]:
+    """Blank-line separated sections: first line is the question, the rest the ideal answer."""
+    questions, ideal_answers = [], []
+    for section in content.split('\n\n'):
+        lines = section.strip().split('\n')
+        if not lines:
+            continue
+        question = lines[0].strip()
+        if not question:
+            continue
+        questions.append(question)
+        ideal_answers.append('\n'.join(lines[1:]).strip())
+    return questions, ideal_answers
+
+def _parse_docx(path: str) -> Tuple[List[str], List[str]]:
+    """First paragraph of each block is the question; blocks end at a blank or "Q<n>." paragraph."""
+    from docx import Document
+    questions, ideal_answers = [], []
+    q = None
+    a = []
+    for para in Document(path).paragraphs:
+        text = para.text.strip()
+        if not text:
+            # Blank line: treat as delimiter between Q&A pairs
+            if q and a:
+                questions.append(q)
+                ideal_answers.append('\n'.join(a).strip())
+                q = None
+                a = []
+            continue
+        if q is not None and QUESTION_START.match(text):
+            # Numbered question right after the previous answer
+            if a:
+                questions.append(q)
+                ideal_answers.append('\n'.join(a).strip())
+            q = None
+            a = []
+        if q is None:
+            q = text
+        else:
+            a.append(text)
+    # Add last Q&A if present
+    if q and a:
+        questions.append(q)
+        ideal_answers.append('\n'.join(a).strip())
+    return questions, ideal_answers
+
+def _parse_pdf(path: str) -> Tuple[List[str], List[str]]:
+    import PyPDF2
+    with open(path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        content = '\n'.join(page.extract_text() or '' for page in reader.pages)
+    return _parse_sections(content)
+
+def _parse_text(path: str) -> Tuple[List[str], List[str]]:
+    for encoding in ['utf-8', 'latin1', 'cp1252']:
+        try:
+            with open(path, 'r', encoding=encoding) as f:
+                return _parse_sections(f.read())
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("Failed to decode answer key with any encoding")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased whitespace tokens, matching basic_evaluation."""
+    return text.lower().split()
+
+def compile_answer_key(path: str, key_id: Optional[str] = None) -> CompiledAnswerKey:
+    """Parse a .docx/.pdf/.txt answer key into a CompiledAnswerKey (no memoization)."""
+    lower = path.lower()
+    if lower.endswith('.docx'):
+        questions, ideal_answers = _parse_docx(path)
+    elif lower.endswith('.pdf'):
+        questions, ideal_answers = _parse_pdf(path)
+    else:
+        questions, ideal_answers = _parse_text(path)
+    if key_id is None:
+        with open(path, 'rb') as f:
+            key_id = hashlib.sha256(f.read()).hexdigest()
+
+    ideal_tokens = tuple(frozenset(tokenize(answer)) for answer in ideal_answers)
+    vocabulary: Dict[str, int] = {}
+    rows, cols = [], []
+    for row, tokens in enumerate(ideal_tokens):
+        for token in sorted(tokens):
+            rows.append(row)
+            cols.append(vocabulary.setdefault(token, len(vocabulary)))
+    ideal_vectors = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(len(ideal_answers), len(vocabulary)))
+    for array in (ideal_vectors.data, ideal_vectors.indices, ideal_vectors.indptr):
+        array.flags.writeable = False
+
+    return CompiledAnswerKey(
+        key_id=key_id,
+        source_path=os.path.abspath(path),
+        questions=tuple(questions),
+        ideal_answers=tuple(ideal_answers),
+        ideal_tokens=ideal_tokens,
+        vocabulary=MappingProxyType(vocabulary),
+        ideal_vectors=ideal_vectors,
+    )
+
+_by_stat: Dict[Tuple[str, int, int], str] = {}
+_by_hash: Dict[str, CompiledAnswerKey] = {}
+_lock = threading.Lock()
+
+def get_answer_key(path: str) -> Optional[CompiledAnswerKey]:
+    """Return the compiled answer key for ``path``, parsing it at most once per content.
+
+    Lookups first hit a (path, mtime, size) index, so an unchanged file is not
+    even re-read; a changed stat falls back to the SHA-256 of the bytes, so
+    copies of the same key share one compiled object. Returns None (after
+    printing the error) if the key cannot be parsed.
+    """
+    abs_path = os.path.abspath(path)
+    try:
+        st = os.stat(abs_path)
+    except OSError as e:
+        print(f"Error loading answer key: {str(e)}")
+        return None
+    stat_key = (abs_path, st.st_mtime_ns, st.st_size)
+    with _lock:
+        key_id = _by_stat.get(stat_key)
+        if key_id is not None and key_id in _by_hash:
+            return _by_hash[key_id]
+    try:
+        with open(abs_path, 'rb') as f:
+            key_id = hashlib.sha256(f.read()).hexdigest()
+        with _lock:
+            compiled = _by_hash.get(key_id)
+        if compiled is None:
+            compiled = compile_answer_key(abs_path, key_id)
+            print(f"Compiled answer key {os.path.basename(abs_path)}: {len(compiled)} questions")
+    except Exception as e:
+        print(f"Error loading answer key: {str(e)}")
+        return None
+    with _lock:
+        compiled = _by_hash.setdefault(key_id, compiled)
+        _by_stat[stat_key] = key_id
+    return compiled
@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scan.result_files import file_sha256
+from scan.results_store import get_results_store
+
+# Grading processes used by grade_directory; each has its own OCR client and LLM pool
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+MANIFEST_NAME = "manifest.jsonl"
+
+def load_manifest(manifest_path: str) -> Dict[str, Dict]:
+    """Completed entries keyed by input hash; a line cut short by a crash is ignored."""
+    entries = {}
+    if not os.path.exists(manifest_path):
+        return entries
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                entries[entry["input"]] = entry
+            except (ValueError, KeyError, TypeError):
+                continue
+    return entries
+
+_evaluator = None
+
+def _init_worker() -> None:
+    global _evaluator
+    from scan.enhanced_evaluator import EnhancedEvaluator
+    _evaluator = EnhancedEvaluator()
+
+def _grade_sheet(sheet_path: str, answer_key_path: str, output_file: str) -> Tuple[int, int]:
+    """Grade one sheet in a worker process; returns the number of graded and fallback-graded questions."""
+    results = _evaluator.process_answer_sheet(sheet_path, answer_key_path, output_file)
+    return len(results), sum(1 for result in results if result.get("grading_tier") == "fallback")
+
+def grading_settings() -> str:
+    """Grader and OCR settings of the evaluators the workers create (part of each manifest key)."""
+    from scan.enhanced_evaluator import EnhancedEvaluator
+    evaluator = EnhancedEvaluator()
+    return f"{evaluator.grader_version()}|{evaluator.ocr_settings()}"
+
+def grade_directory(sheets_dir: str, answer_key_path: str, results_dir: str,
+                    workers: int = BATCH_WORKERS) -> Dict[str, int]:
+    """Grade every PDF in ``sheets_dir`` across a process pool, resuming from the manifest.
+
+    ``<results_dir>/manifest.jsonl`` gets one line per finished sheet, mapping
+    the hash of the sheet, the answer key and the grading settings (model,
+    grading mode, cascade, scorer, OCR) to its result file. Sheets already
+    listed (with their results still in the results store) are skipped, so an
+    interrupted run picks up where it stopped; changing a setting regrades
+    them. A sheet with answers graded by the fallback scorer is not listed,
+    so the next run asks the LLM again. Returns counts of graded, skipped
+    and failed sheets, and of graded sheets left out for having fallbacks.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    store = get_results_store()
+    manifest_path = os.path.join(results_dir, MANIFEST_NAME)
+    done = load_manifest(manifest_path)
+    key_hash = file_sha256(answer_key_path)
+    settings = grading_settings()
+
+    pending = []
+    skipped = 0
+    for name in sorted(os.listdir(sheets_dir)):
+        if not name.lower().endswith('.pdf'):
+            continue
+        sheet_path = os.path.join(sheets_dir, name)
+        input_hash = hashlib.sha256(f"{file_sha256(sheet_path)}:{key_hash}:{settings}".encode('utf-8')).hexdigest()
+        entry = done.get(input_hash)
+        if entry is not None and (store.has_sheet(store.sheet_name(entry["result"])) or
+                                  os.path.exists(entry["result"])):
+            skipped += 1
+            continue
+        output_file = os.path.join(results_dir, f"{os.path.splitext(name)[0]}_results.json")
+        pending.append((input_hash, sheet_path, output_file))
+
+    total = len(pending)
+    print(f"Grading {total} sheets with {workers} workers ({skipped} already done)")
+    graded = failed = incomplete = 0
+    start = time.time()
+    with open(manifest_path, 'a', encoding='utf-8') as manifest, \
+            ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_worker) as executor:
+        futures = {executor.submit(_grade_sheet, sheet_path, answer_key_path, output_file):
+                   (input_hash, sheet_path, output_file)
+                   for input_hash, sheet_path, output_file in pending}
+        for future in as_completed(futures):
+            input_hash, sheet_path, output_file = futures[future]
+            try:
+                questions, fallbacks = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Error grading {sheet_path}: {str(e)}")
+                continue
+            graded += 1
+            if fallbacks:
+                # Not recorded as done: the next run regrades the answers the LLM could not
+                incomplete += 1
+                print(f"[{graded + failed}/{total}] {os.path.basename(sheet_path)} graded with "
+                      f"{fallbacks}/{questions} fallback answers; it will be retried on the next run")
+                continue
+            manifest.write(json.dumps({"input": input_hash, "sheet": sheet_path, "result": output_file,
+                                       "questions": questions, "finished": time.time()}) + "\n")
+            manifest.flush()
+            os.fsync(manifest.fileno())
+            rate = graded / (time.time() - start) * 60
+            print(f"[{graded + failed}/{total}] {os.path.basename(sheet_path)} graded - {rate:.1f} sheets/min")
+
+    elapsed = time.time() - start
+    if graded:
+        print(f"Batch complete: {graded} graded, {skipped} skipped, {failed} failed in {elapsed:.1f}s "
+              f"({graded / elapsed * 60:.1f} sheets/min)")
+    else:
+        print(f"Batch complete: {graded} graded, {skipped} skipped, {failed} failed")
+    if incomplete:
+        print(f"{incomplete} graded sheet(s) had fallback answers and were not marked done")
+    return {"graded": graded, "skipped": skipped, "failed": failed, "incomplete": incomplete}
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 3:
+        print("Usage: python batch_grading.py <sheets_dir> <answer_key_path> <results_dir> [workers]")
+        return
+    sheets_dir, answer_key_path, results_dir = argv[:3]
+    workers = int(argv[3]) if len(argv) > 3 else BATCH_WORKERS
+    if not os.path.isdir(sheets_dir):
+        print(f"Error: directory {sheets_dir} does not exist.")
+        return
+    if not os.path.exists(answer_key_path):
+        print(f"Error: Answer key file {answer_key_path} does not exist.")
+        return
+    grade_directory(sheets_dir, answer_key_path, results_dir, workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+import sys
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scan.answer_key import CompiledAnswerKey, tokenize
+
+# What the evaluator grades when a sheet has fewer answers than the key has questions
+MISSING_ANSWER = "No answer provided."
+
+def feedback_for_score(score: float) -> str:
+    """Canned feedback used by the keyword-overlap scorer."""
+    if score >= 8:
+        return "Excellent answer! Shows good understanding of the topic."
+    elif score >= 6:
+        return "Good answer, but could be more detailed."
+    elif score >= 4:
+        return "Basic understanding shown, but needs improvement."
+    else:
+        return "Answer needs significant improvement."
+
+def answer_matrix(answer_key: CompiledAnswerKey, student_answers: Sequence[Sequence[str]]) -> sparse.csr_matrix:
+    """Binary (students * questions) x vocabulary matrix of the answers' word sets.
+
+    Row ``s * num_questions + q`` holds student ``s``'s answer to question ``q``.
+    Words that never occur in an ideal answer cannot overlap, so they are dropped.
+    """
+    num_questions = len(answer_key)
+    vocabulary = answer_key.vocabulary
+    indptr = [0]
+    indices: List[int] = []
+    for answers in student_answers:
+        for q in range(num_questions):
+            answer = answers[q] if q < len(answers) else MISSING_ANSWER
+            columns = {vocabulary[token] for token in tokenize(answer) if token in vocabulary}
+            indices.extend(columns)
+            indptr.append(len(indices))
+    return sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32), np.array(indices, dtype=np.int64), np.array(indptr)),
+        shape=(len(student_answers) * num_questions, len(vocabulary)))
+
+def overlap_scores(answer_key: CompiledAnswerKey, student_answers: Sequence[Sequence[str]]) -> np.ndarray:
+    """Keyword-overlap scores for a whole class as a students x questions array.
+
+    Each cell equals ``basic_evaluation``'s score for that answer:
+    ``min(10, |answer words & ideal words| / |ideal words| * 10)``, 0 when the
+    ideal answer is empty. All overlaps are computed with one sparse
+    element-wise product against the key's precomputed ideal vectors.
+    """
+    num_students, num_questions = len(student_answers), len(answer_key)
+    if num_students == 0 or num_questions == 0:
+        return np.zeros((num_students, num_questions))
+    answers = answer_matrix(answer_key, student_answers)
+    ideal_rows = answer_key.ideal_vectors[np.tile(np.arange(num_questions), num_students)]
+    common = np.asarray(answers.multiply(ideal_rows).sum(axis=1), dtype=np.float64).reshape(
+        num_students, num_questions)
+    ideal_sizes = np.array([len(tokens) for tokens in answer_key.ideal_tokens], dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.where(ideal_sizes > 0, common / ideal_sizes * 10, 0.0)
+    return np.minimum(10, scores)
+
+def batch_basic_evaluation(answer_key: CompiledAnswerKey,
+                           student_answers: Sequence[Sequence[str]]) -> List[List[Tuple[float, str]]]:
+    """(score, feedback) for every student and question, matching basic_evaluation."""
+    scores = overlap_scores(answer_key, student_answers)
+    return [[(float(score), feedback_for_score(score)) for score in row] for row in scores]
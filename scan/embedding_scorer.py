@@ -0,0 +1,134 @@
+import os
+import re
+import sys
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scan.answer_key import CompiledAnswerKey
+from scan.batch_scorer import MISSING_ANSWER
+from scan.model_registry import register_model, get_model
+
+# Small sentence-embedding model run on CPU, and how many texts to encode per forward pass
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Ideal-answer embeddings are stored here as <model>/<answer key hash>.npy
+EMBEDDING_CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "embeddings"))
+
+def _load_sentence_transformer(model_name: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device="cpu")
+
+def _warm_up_sentence_transformer(model):
+    model.encode(["warm up"], batch_size=1, show_progress_bar=False)
+
+class EmbeddingScorer:
+    """Semantic scores from cosine similarity of sentence embeddings (CPU only).
+
+    Ideal-answer embeddings are computed once per answer key and kept both in
+    memory and on disk, keyed by the key's content hash. Student answers are
+    encoded in batches and every question is scored with one matrix product.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 cache_dir: str = EMBEDDING_CACHE_DIR):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.cache_dir = os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name))
+        self.registry_name = f"sentence-transformer:{model_name}"
+        register_model(self.registry_name, lambda: _load_sentence_transformer(model_name),
+                       fork_safe=False, warm_up=_warm_up_sentence_transformer)
+        self._ideal: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Unit-length float32 embeddings, one row per text."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        embeddings = get_model(self.registry_name).encode(
+            list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+            normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def ideal_embeddings(self, answer_key: CompiledAnswerKey) -> np.ndarray:
+        """Questions x dimensions embeddings of the key's ideal answers, cached by key hash."""
+        with self._lock:
+            cached = self._ideal.get(answer_key.key_id)
+        if cached is not None:
+            return cached
+
+        path = os.path.join(self.cache_dir, f"{answer_key.key_id}.npy")
+        embeddings = None
+        try:
+            if os.path.exists(path):
+                embeddings = np.load(path)
+                if embeddings.shape[0] != len(answer_key):
+                    embeddings = None
+        except Exception as e:
+            print(f"Error reading embedding cache: {str(e)}")
+            embeddings = None
+
+        if embeddings is None:
+            embeddings = self.encode(answer_key.ideal_answers)
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, embeddings)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"Error writing embedding cache: {str(e)}")
+
+        embeddings.flags.writeable = False
+        with self._lock:
+            return self._ideal.setdefault(answer_key.key_id, embeddings)
+
+    def score_answers(self, answer_key: CompiledAnswerKey,
+                      student_answers: Sequence[Sequence[str]]) -> np.ndarray:
+        """Scores out of 10 as a students x questions array.
+
+        Each student's answers are in question order. All answers are encoded
+        in one batched call, then question ``q``'s column is ``answers_q @
+        ideal_q``. Negative cosine similarities score 0, and blank or missing
+        answers (encoded as MISSING_ANSWER to keep the batch rectangular) and
+        empty ideal answers score 0 like basic_evaluation.
+        """
+        num_students, num_questions = len(student_answers), len(answer_key)
+        if num_students == 0 or num_questions == 0:
+            return np.zeros((num_students, num_questions))
+        ideal = self.ideal_embeddings(answer_key)
+        # Question-major order, so each question's answers are contiguous after encoding
+        answered = np.array([[q < len(answers) and bool(answers[q].strip()) and
+                              answers[q].strip() != MISSING_ANSWER for answers in student_answers]
+                             for q in range(num_questions)])
+        texts = [answers[q] if answered[q, s] else MISSING_ANSWER
+                 for q in range(num_questions) for s, answers in enumerate(student_answers)]
+        encoded = self.encode(texts).reshape(num_questions, num_students, -1)
+
+        scores = np.empty((num_students, num_questions))
+        for q in range(num_questions):
+            scores[:, q] = encoded[q] @ ideal[q]
+        scores = np.clip(scores, 0.0, 1.0) * 10
+        empty_ideal = np.array([not answer.strip() for answer in answer_key.ideal_answers])
+        scores[:, empty_ideal] = 0.0
+        scores[~answered.T] = 0.0
+        return scores
+
+    def score_sheet(self, answer_key: CompiledAnswerKey, answers: Sequence[str]) -> List[float]:
+        """Scores out of 10 for one student's answers, in question order."""
+        return [float(score) for score in self.score_answers(answer_key, [answers])[0]]
+
+_scorers: Dict[str, EmbeddingScorer] = {}
+_scorers_lock = threading.Lock()
+
+def get_embedding_scorer(model_name: Optional[str] = None) -> EmbeddingScorer:
+    """Return the process-wide scorer for ``model_name`` (EMBEDDING_MODEL by default)."""
+    model_name = model_name or EMBEDDING_MODEL
+    with _scorers_lock:
+        if model_name not in _scorers:
+            _scorers[model_name] = EmbeddingScorer(model_name)
+        return _scorers[model_name]
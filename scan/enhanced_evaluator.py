@@ -4,21 +4,127 @@ os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.join(os.path.dirname(__fi
 
 import sys
 import json
-from typing import Dict, List, Tuple
-import requests
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
 
 # Add parent directory to path to import ml_project
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from scan.pdf_text_extractor import process_pdf
+from scan.pdf_text_extractor import (process_pdf_hybrid, join_page_texts, TextExtractionError,
+                                     EMBEDDED_TEXT_MIN_CHARS, EMBEDDED_TEXT_MIN_QUALITY)
+from scan.ocr_backends import OCR_BACKEND, get_ocr_backend
+from scan.llm_client import get_llm_client, OLLAMA_ENDPOINTS, CircuitOpenError
+from scan.grading_cache import get_grading_cache, purge_stale_grades, normalize_text
+from scan.answer_key import get_answer_key
+from scan.batch_scorer import batch_basic_evaluation, feedback_for_score, MISSING_ANSWER
+from scan.text_similarity import enhanced_sentence_match
+from scan.embedding_scorer import get_embedding_scorer, EMBEDDING_MODEL
+from scan.result_files import file_sha256, read_results_file, write_results_file
+from scan.results_store import get_results_store
+from scan import tracing
+from scan.grading_pipeline import GradingPipeline, SHEET_CANCELLED
 # from ml_project.test import evaluate_student_answers
 
+# Bump whenever the grading prompt in get_mistral_feedback (or the batched
+# prompt in _grade_chunk) changes; cached grades from other versions are no
+# longer used (remove them with --purge-grading-cache)
+GRADING_PROMPT_VERSION = "1"
+BATCH_PROMPT_VERSION = "batch-1"
+QUESTION_MAJOR_PROMPT_VERSION = "question-major-1"
+# Bump when grading logic changes so stored results are regraded
+# (2: LLM fallbacks are recorded with the "fallback" tier instead of "llm")
+GRADER_VERSION = "2"
+
+# "single": one request per question; "batch": all of a sheet's questions in as
+# few JSON-constrained requests as the token budget allows; "question_major":
+# answers regrouped by question (across every sheet in process_answer_sheets)
+# and graded back to back with a shared prompt prefix
+GRADING_MODE = os.getenv("GRADING_MODE", "single")
+# How long Ollama keeps the model (and its prompt cache) loaded between requests
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+# Approximate prompt+output tokens packed into one batched request, and the
+# context window requested from Ollama for it
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET", "3000"))
+BATCH_NUM_CTX = int(os.getenv("BATCH_NUM_CTX", "8192"))
+# Output tokens reserved per question in a batch (score + feedback)
+BATCH_OUTPUT_TOKENS_PER_ITEM = 150
+
+# Tiered grading (GRADING_CASCADE=1): empty and verbatim answers, and answers
+# on which the keyword overlap (basic_evaluation) and TF-IDF scores both sit at
+# or below CASCADE_LOW or at or above CASCADE_HIGH, are graded without the LLM.
+# Only answers in between are sent to Mistral. Off by default: keyword overlap
+# is divided by the whole ideal answer's word set, so short correct answers to
+# long ideal answers can fall below CASCADE_LOW; tune the bands on real
+# sheets before turning it on.
+GRADING_CASCADE = os.getenv("GRADING_CASCADE", "0") == "1"
+CASCADE_LOW = float(os.getenv("CASCADE_LOW", "1.5"))
+CASCADE_HIGH = float(os.getenv("CASCADE_HIGH", "9.0"))
+# "fallback" counts escalated answers graded by basic_evaluation because the LLM
+# circuit was open or the request failed; those grades are never cached or reused
+CASCADE_TIERS = ("empty", "exact", "lexical", "llm", "fallback")
+
+# How answers are scored: "llm" (the cascade above, escalating to Mistral),
+# "embedding" (cosine similarity of sentence embeddings, offline and CPU only)
+# or "lexical" (keyword overlap only)
+GRADING_SCORER = os.getenv("GRADING_SCORER", "llm")
+GRADING_SCORERS = ("llm", "embedding", "lexical")
+
+# Answer sheets graded at the same time by process_answer_sheets
+SHEET_MAX_WORKERS = int(os.getenv("SHEET_MAX_WORKERS", "2"))
+# In "question_major" mode a question's answers are graded in runs of at most
+# this many, so one question's answers can occupy several LLM slots at once
+QUESTION_MAJOR_CHUNK_SIZE = int(os.getenv("QUESTION_MAJOR_CHUNK_SIZE", "8"))
+# Run grade_sheets (and so process_answer_sheets and grading jobs) as a staged
+# rasterize -> OCR -> segment -> grade pipeline (see scan.grading_pipeline)
+# instead of one thread per sheet
+GRADING_PIPELINE = os.getenv("GRADING_PIPELINE", "0") == "1"
+# Results go to the results store (scan.results_store); set RESULTS_JSON_FILES=1 to
+# also write each sheet's <sheet>_results.json as before
+RESULTS_JSON_FILES = os.getenv("RESULTS_JSON_FILES", "0") == "1"
+
+class FallbackGrade(tuple):
+    """A (score, feedback) from basic_evaluation standing in for the LLM, so it can be recorded as such."""
+
+    def __new__(cls, score: float, feedback: str):
+        return super().__new__(cls, (score, feedback))
+
 class EnhancedEvaluator:
-    def __init__(self):
-        # Initialize Ollama endpoint
-        self.ollama_endpoint = "http://localhost:11434/api/generate"
+    def __init__(self, ocr_backend: str = OCR_BACKEND,
+                 ollama_endpoint: Union[str, Sequence[str]] = OLLAMA_ENDPOINTS,
+                 grading_mode: str = GRADING_MODE, cascade: bool = GRADING_CASCADE,
+                 scorer: str = GRADING_SCORER):
+        # Initialize Ollama endpoint(s); the pooled client is shared by every evaluator in the
+        # process, and several endpoints are load-balanced
+        self.ollama_endpoint = ollama_endpoint
+        self.llm_client = get_llm_client(ollama_endpoint)
         self.model = "mistral"  # or your specific model name
-
+        # Grades persist across runs, keyed on the model and prompt version
+        self.grading_cache = get_grading_cache()
+        self.grading_mode = grading_mode
+        # Which tier graded each answer, across every sheet this evaluator handled
+        self.cascade = cascade
+        self.tier_counts = Counter()
+        self._tier_lock = threading.Lock()
+        if scorer not in GRADING_SCORERS:
+            raise ValueError(f"Unknown scorer '{scorer}'; expected one of {', '.join(GRADING_SCORERS)}")
+        self.scorer = scorer
+        # Graded sheets, also searched for earlier grades of the same sheet content
+        self.results_store = get_results_store()
+        self.write_result_files = RESULTS_JSON_FILES
+        self.last_reuse: Dict = {}
+        self.last_errors: Dict[str, str] = {}
+        # OCR engine for pages without a usable text layer ("vision" or "paddle")
+        self.ocr_backend = ocr_backend
+
+    def purge_stale_grades(self) -> int:
+        """Drop this model's cached grades from older prompt versions; returns how many were removed."""
+        return purge_stale_grades(self.model, [GRADING_PROMPT_VERSION, BATCH_PROMPT_VERSION,
+                                               QUESTION_MAJOR_PROMPT_VERSION])
+
+    @tracing.traced("segment")
     def extract_answers_from_text(self, text):
         """Extract answers from OCR text, capturing the answer from the start of the question until the next question is found."""
         lines = text.split('\n')
@@ -40,7 +146,17 @@ class EnhancedEvaluator:
         return answers
 
     def get_mistral_feedback(self, question: str, student_answer: str, ideal_answer: str) -> Tuple[float, str]:
-        """Get feedback from Mistral model running on Ollama."""
+        """Get feedback from Mistral model running on Ollama (cached across runs)."""
+        cache_key = self.grading_cache.make_key(self.model, GRADING_PROMPT_VERSION,
+                                                question, ideal_answer, student_answer)
+        try:
+            cached = self.grading_cache.get(cache_key)
+        except Exception as e:
+            print(f"Error reading grading cache: {str(e)}")
+            cached = None
+        if cached is not None:
+            return cached
+
         prompt = f"""You are an expert teacher evaluating a student's answer. Please evaluate the following:
 
 Question: {question}
@@ -60,26 +176,366 @@ Format your response as JSON with these fields:
 }}"""
 
         try:
-            response = requests.post(
-                self.ollama_endpoint,
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False
-                }
-            )
-            response.raise_for_status()
+            result = self.llm_client.generate(self.model, prompt)
 
             # Parse the response
-            result = response.json()
             evaluation = json.loads(result['response'])
+            score, feedback = evaluation['score'], evaluation['feedback']
+        except CircuitOpenError:
+            # Ollama is known to be down; skip straight to the fallback without logging each question
+            return self.fallback_grade(student_answer, ideal_answer, "circuit_open")
+        except Exception as e:
+            print(f"Error getting Mistral feedback: {str(e)}")
+            # Fallback to basic evaluation (never cached or reused, so the next run retries the model)
+            return self.fallback_grade(student_answer, ideal_answer, "llm_error")
+
+        try:
+            self.grading_cache.put(cache_key, self.model, GRADING_PROMPT_VERSION, score, feedback)
+        except Exception as e:
+            print(f"Error writing grading cache: {str(e)}")
+        return score, feedback
+
+    def grade_answer(self, question: str, student_answer: str, ideal_answer: str) -> Tuple[float, str]:
+        """Grade one answer with Mistral, falling back to basic_evaluation on any error."""
+        try:
+            return self.get_mistral_feedback(question, student_answer, ideal_answer)
+        except Exception:
+            return self.fallback_grade(student_answer, ideal_answer, "llm_error")
+
+    def fallback_grade(self, student_answer: str, ideal_answer: str,
+                       reason: Optional[str] = None) -> FallbackGrade:
+        """basic_evaluation in place of the LLM, counted under ``reason`` and marked as a fallback."""
+        if reason is not None:
+            tracing.count("grading_fallbacks_total", reason=reason)
+        return FallbackGrade(*self.basic_evaluation(student_answer, ideal_answer))
+
+    def grade_answers(self, items: List[Tuple[str, str, str]]) -> List[Tuple[float, str]]:
+        """Grade (question, student_answer, ideal_answer) triples concurrently.
+
+        Requests go through the shared Ollama client, which caps how many are in
+        flight; results come back in the same order as ``items``. In "batch"
+        and "question_major" grading modes this delegates to
+        grade_answers_batched and grade_answers_question_major.
+        """
+        if not items:
+            return []
+        if self.grading_mode == "batch":
+            return self.grade_answers_batched(items)
+        if self.grading_mode == "question_major":
+            return self.grade_answers_question_major(items)
+        workers = min(len(items), self.llm_client.max_concurrency)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(tracing.propagate(lambda item: self.grade_answer(*item)), items))
+
+    def cheap_grade(self, student_answer: str, ideal_answer: str) -> Optional[Tuple[str, float, str]]:
+        """Grade an answer without the LLM when the outcome is clear-cut.
+
+        Returns (tier, score, feedback), or None when the answer falls in the
+        uncertainty band between CASCADE_LOW and CASCADE_HIGH and needs the model.
+        """
+        student = normalize_text(student_answer)
+        if not student or student == normalize_text(MISSING_ANSWER):
+            return "empty", 0, "No answer provided."
+        if student == normalize_text(ideal_answer):
+            return "exact", 10, feedback_for_score(10)
+        overlap_score, feedback = self.basic_evaluation(student_answer, ideal_answer)
+        if overlap_score <= CASCADE_LOW or overlap_score >= CASCADE_HIGH:
+            tfidf_score = enhanced_sentence_match(ideal_answer, student_answer)
+            if overlap_score <= CASCADE_LOW and tfidf_score <= CASCADE_LOW:
+                return "lexical", overlap_score, feedback
+            if overlap_score >= CASCADE_HIGH and tfidf_score >= CASCADE_HIGH:
+                return "lexical", overlap_score, feedback
+        return None
+
+    def grade_answers_cascade(self, items: List[Tuple[str, str, str]]) -> List[Tuple[float, str, str]]:
+        """Grade (question, student_answer, ideal_answer) triples, escalating only uncertain ones.
+
+        Returns (score, feedback, tier) per item in the order of ``items``,
+        where tier is one of CASCADE_TIERS. Escalated answers go through
+        grade_answers (and so honour the single/batch grading mode), or
+        straight to basic_evaluation while the LLM circuit breaker is open;
+        answers the LLM could not grade get the "fallback" tier. With the
+        cascade disabled every answer is escalated.
+        """
+        graded: Dict[int, Tuple[float, str, str]] = {}
+        escalated = []
+        for index, (question, student_answer, ideal_answer) in enumerate(items):
+            decided = self.cheap_grade(student_answer, ideal_answer) if self.cascade else None
+            if decided is not None:
+                tier, score, feedback = decided
+                graded[index] = (score, feedback, tier)
+            else:
+                escalated.append(index)
+        if escalated and not self.llm_client.available():
+            tracing.count("grading_fallbacks_total", len(escalated), reason="circuit_open")
+            for index in escalated:
+                _, student_answer, ideal_answer = items[index]
+                score, feedback = self.basic_evaluation(student_answer, ideal_answer)
+                graded[index] = (score, feedback, "fallback")
+        else:
+            llm_grades = self.grade_answers([items[index] for index in escalated])
+            for index, grade in zip(escalated, llm_grades):
+                graded[index] = (grade[0], grade[1], "fallback" if isinstance(grade, FallbackGrade) else "llm")
+
+        tiers = Counter(tier for _, _, tier in graded.values())
+        with self._tier_lock:
+            self.tier_counts.update(tiers)
+        for tier, answers in tiers.items():
+            tracing.count("grading_answers_total", answers, tier=tier)
+        return [graded[index] for index in range(len(items))]
+
+    def grade_answers_offline(self, answer_key_path: str, student_answers: List[str]) -> List[Tuple[float, str, str]]:
+        """Score one sheet's answers (in question order) without the LLM.
+
+        Uses the "embedding" or "lexical" scorer; returns (score, feedback,
+        tier) per question, where tier is the scorer name.
+        """
+        answer_key = get_answer_key(answer_key_path)
+        if answer_key is None:
+            return []
+        if self.scorer == "embedding":
+            try:
+                scores = get_embedding_scorer().score_sheet(answer_key, student_answers)
+                tracing.count("grading_answers_total", len(scores), tier="embedding")
+                return [(score, feedback_for_score(score), "embedding") for score in scores]
+            except Exception as e:
+                print(f"Error computing embedding scores: {str(e)}")
+                tracing.count("grading_errors_total", stage="embedding")
+        tracing.count("grading_answers_total", len(answer_key), tier="lexical")
+        return [(score, feedback, "lexical")
+                for score, feedback in batch_basic_evaluation(answer_key, [student_answers])[0]]
+
+    def cascade_stats(self) -> Dict:
+        """Answers graded by each tier so far, as counts and fractions."""
+        with self._tier_lock:
+            counts = {tier: self.tier_counts.get(tier, 0) for tier in CASCADE_TIERS}
+        total = sum(counts.values())
+        return {
+            "counts": counts,
+            "fractions": {tier: count / total if total else 0.0 for tier, count in counts.items()},
+            "total": total,
+        }
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """Rough token count (about four characters per token for English)."""
+        return len(text) // 4 + 1
+
+    def _pack_batches(self, items: List[Tuple[int, Tuple[str, str, str]]],
+                      token_budget: int) -> List[List[Tuple[int, Tuple[str, str, str]]]]:
+        """Split indexed items into chunks whose estimated size fits ``token_budget``."""
+        chunks, current, used = [], [], 0
+        for index, item in items:
+            cost = self._estimate_tokens(''.join(item)) + BATCH_OUTPUT_TOKENS_PER_ITEM
+            if current and used + cost > token_budget:
+                chunks.append(current)
+                current, used = [], 0
+            current.append((index, item))
+            used += cost
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _parse_batch_response(self, response: str, expected_ids: List[int]) -> Optional[Dict[int, Tuple[float, str]]]:
+        """Parse the model's JSON into {id: (score, feedback)}; None if anything is missing or invalid."""
+        try:
+            data = json.loads(response)
+        except (TypeError, ValueError):
+            return None
+        if isinstance(data, dict):
+            data = data.get("results")
+        if not isinstance(data, list):
+            return None
+        parsed = {}
+        for entry in data:
+            if not isinstance(entry, dict):
+                return None
+            try:
+                entry_id = int(entry["id"])
+                score = min(10.0, max(0.0, float(entry["score"])))
+                feedback = str(entry["feedback"])
+            except (KeyError, TypeError, ValueError):
+                return None
+            parsed[entry_id] = (score, feedback)
+        if any(expected_id not in parsed for expected_id in expected_ids):
+            return None
+        return parsed
+
+    def _grade_chunk(self, chunk: List[Tuple[int, Tuple[str, str, str]]]) -> Dict[int, Tuple[float, str]]:
+        """Grade a chunk in one JSON-constrained request, halving it when the output is malformed.
+
+        Only malformed or incomplete output is retried in halves; when the
+        request itself fails (connection error, timeout, open circuit) the
+        whole chunk falls back to basic_evaluation, since smaller requests
+        would fail the same way.
+        """
+        blocks = []
+        for number, (_, (question, student_answer, ideal_answer)) in enumerate(chunk, start=1):
+            blocks.append(f"""### Item {number}
+Question: {question}
+Ideal Answer: {ideal_answer}
+Student's Answer: {student_answer}""")
+        items_text = '\n\n'.join(blocks)
+        prompt = f"""You are an expert teacher evaluating students' answers. Grade every item below independently by comparing the student's answer with the ideal answer.
 
-            return evaluation['score'], evaluation['feedback']
+{items_text}
+
+Respond with JSON only, in exactly this form, with one entry per item:
+{{
+    "results": [
+        {{"id": <item number>, "score": <number between 0 and 10>, "feedback": "<detailed feedback>"}}
+    ]
+}}"""
 
+        parsed = None
+        try:
+            result = self.llm_client.generate(self.model, prompt, format="json",
+                                              options={"num_ctx": BATCH_NUM_CTX})
+            parsed = self._parse_batch_response(result.get('response'), list(range(1, len(chunk) + 1)))
+        except CircuitOpenError:
+            tracing.count("grading_fallbacks_total", len(chunk), reason="circuit_open")
+            return {index: self.fallback_grade(item[1], item[2]) for index, item in chunk}
+        except requests.RequestException as e:
+            print(f"Error getting batched Mistral feedback: {str(e)}")
+            tracing.count("grading_fallbacks_total", len(chunk), reason="llm_error")
+            return {index: self.fallback_grade(item[1], item[2]) for index, item in chunk}
         except Exception as e:
-            print(f"Error getting Mistral feedback: {str(e)}")
-            # Fallback to basic evaluation
-            return self.basic_evaluation(student_answer, ideal_answer)
+            print(f"Error getting batched Mistral feedback: {str(e)}")
+
+        if parsed is None:
+            if len(chunk) == 1:
+                # Last resort for a single item: the per-question prompt (with its own fallback)
+                index, item = chunk[0]
+                return {index: self.grade_answer(*item)}
+            print(f"Malformed batch output for {len(chunk)} questions; splitting the batch")
+            middle = len(chunk) // 2
+            graded = self._grade_chunk(chunk[:middle])
+            graded.update(self._grade_chunk(chunk[middle:]))
+            return graded
+
+        graded = {}
+        for number, (index, (question, student_answer, ideal_answer)) in enumerate(chunk, start=1):
+            score, feedback = parsed[number]
+            graded[index] = (score, feedback)
+            try:
+                cache_key = self.grading_cache.make_key(self.model, BATCH_PROMPT_VERSION,
+                                                        question, ideal_answer, student_answer)
+                self.grading_cache.put(cache_key, self.model, BATCH_PROMPT_VERSION, score, feedback)
+            except Exception as e:
+                print(f"Error writing grading cache: {str(e)}")
+        return graded
+
+    def grade_answers_batched(self, items: List[Tuple[str, str, str]],
+                              token_budget: int = BATCH_TOKEN_BUDGET) -> List[Tuple[float, str]]:
+        """Grade many answers with as few LLM round trips as the token budget allows.
+
+        Cached grades are reused; the rest are packed into chunks of at most
+        ``token_budget`` estimated tokens, each sent as one request constrained
+        to JSON output. Chunks whose output cannot be parsed are split in half
+        and retried. Results come back in the order of ``items``.
+        """
+        graded: Dict[int, Tuple[float, str]] = {}
+        pending = []
+        for index, (question, student_answer, ideal_answer) in enumerate(items):
+            try:
+                cached = self.grading_cache.get(self.grading_cache.make_key(
+                    self.model, BATCH_PROMPT_VERSION, question, ideal_answer, student_answer))
+            except Exception as e:
+                print(f"Error reading grading cache: {str(e)}")
+                cached = None
+            if cached is not None:
+                graded[index] = cached
+            else:
+                pending.append((index, (question, student_answer, ideal_answer)))
+
+        chunks = self._pack_batches(pending, token_budget)
+        if chunks:
+            workers = min(len(chunks), self.llm_client.max_concurrency)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for chunk_result in executor.map(tracing.propagate(self._grade_chunk), chunks):
+                    graded.update(chunk_result)
+        return [graded[index] for index in range(len(items))]
+
+    def _question_prefix(self, question: str, ideal_answer: str) -> str:
+        """Prompt text shared by every answer to one question; the student's answer is appended last."""
+        return f"""You are an expert teacher evaluating a student's answer. Compare it with the ideal answer below.
+
+Provide a score out of 10, detailed feedback on what was good and what could be improved, and specific suggestions for improvement.
+
+Format your response as JSON with these fields:
+{{
+    "score": <number between 0 and 10>,
+    "feedback": "<detailed feedback>",
+    "suggestions": ["<suggestion 1>", "<suggestion 2>", ...]
+}}
+
+Question: {question}
+Ideal Answer: {ideal_answer}
+"""
+
+    def _grade_question_group(self, group: List[Tuple[int, Tuple[str, str, str]]]) -> Dict[int, Tuple[float, str]]:
+        """Grade a run of answers to one question back to back, sharing the prompt prefix.
+
+        The requests go out one after another with the same prefix, the same
+        endpoint affinity and keep_alive, so the model server can reuse the
+        prefix it already evaluated and only process each student's answer.
+        """
+        question, _, ideal_answer = group[0][1]
+        prefix = self._question_prefix(question, ideal_answer)
+        graded = {}
+        for index, (question, student_answer, ideal_answer) in group:
+            cache_key = self.grading_cache.make_key(self.model, QUESTION_MAJOR_PROMPT_VERSION,
+                                                    question, ideal_answer, student_answer)
+            try:
+                cached = self.grading_cache.get(cache_key)
+            except Exception as e:
+                print(f"Error reading grading cache: {str(e)}")
+                cached = None
+            if cached is not None:
+                graded[index] = cached
+                continue
+
+            try:
+                result = self.llm_client.generate(self.model, f"{prefix}Student's Answer: {student_answer}\n",
+                                                  format="json", keep_alive=LLM_KEEP_ALIVE, affinity=prefix)
+                evaluation = json.loads(result['response'])
+                score, feedback = evaluation['score'], evaluation['feedback']
+            except CircuitOpenError:
+                graded[index] = self.fallback_grade(student_answer, ideal_answer, "circuit_open")
+                continue
+            except Exception as e:
+                print(f"Error getting Mistral feedback: {str(e)}")
+                graded[index] = self.fallback_grade(student_answer, ideal_answer, "llm_error")
+                continue
+
+            graded[index] = (score, feedback)
+            try:
+                self.grading_cache.put(cache_key, self.model, QUESTION_MAJOR_PROMPT_VERSION, score, feedback)
+            except Exception as e:
+                print(f"Error writing grading cache: {str(e)}")
+        return graded
+
+    def grade_answers_question_major(self, items: List[Tuple[str, str, str]]) -> List[Tuple[float, str]]:
+        """Grade answers grouped by question so consecutive requests share a prompt prefix.
+
+        Each (question, ideal answer) group is split into runs of at most
+        QUESTION_MAJOR_CHUNK_SIZE answers; a run is graded sequentially on one
+        worker, and up to the client's concurrency limit of runs go at once,
+        so a class answering few questions still fills every LLM slot.
+        Results come back in the order of ``items``.
+        """
+        groups: Dict[Tuple[str, str], List[Tuple[int, Tuple[str, str, str]]]] = {}
+        for index, item in enumerate(items):
+            groups.setdefault((item[0], item[2]), []).append((index, item))
+        chunk_size = max(1, QUESTION_MAJOR_CHUNK_SIZE)
+        runs = [group[start:start + chunk_size] for group in groups.values()
+                for start in range(0, len(group), chunk_size)]
+        graded: Dict[int, Tuple[float, str]] = {}
+        workers = min(len(runs), self.llm_client.max_concurrency)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for run_result in executor.map(tracing.propagate(self._grade_question_group), runs):
+                graded.update(run_result)
+        return [graded[index] for index in range(len(items))]
 
     def basic_evaluation(self, student_answer: str, ideal_answer: str) -> Tuple[float, str]:
         """Fallback evaluation method if Mistral is not available."""
@@ -103,130 +559,400 @@ Format your response as JSON with these fields:
 
         return score, feedback
 
-    def process_answer_sheet(self, pdf_path: str, answer_key_path: str, output_file: str) -> None:
-        """Process an answer sheet PDF and evaluate it against the answer key."""
-        # First, extract text from PDF
-        temp_text_file = "temp_extracted.txt"
-        process_pdf(pdf_path, temp_text_file)
-
-        # Read the extracted text
-        with open(temp_text_file, 'r', encoding='utf-8') as f:
-            extracted_text = f.read()
+    def basic_evaluation_batch(self, student_answer_lists: List[List[str]],
+                               answer_key_path: str) -> List[List[Tuple[float, str]]]:
+        """basic_evaluation for a whole class at once.
+
+        ``student_answer_lists`` holds each student's answers in question order
+        (as returned by extract_answers_from_text); missing answers are graded
+        as "No answer provided.". Scores are computed as one sparse matrix
+        product, so baseline grades for hundreds of sheets take milliseconds.
+        """
+        answer_key = get_answer_key(answer_key_path)
+        if answer_key is None:
+            return [[] for _ in student_answer_lists]
+        return batch_basic_evaluation(answer_key, student_answer_lists)
+
+    def extract_student_answers(self, pdf_path: str, extracted_text_file: Optional[str] = None) -> List[str]:
+        """Text of each answer on the sheet, in order.
+
+        Raises TextExtractionError when no text could be extracted, so the
+        sheet is reported as failed instead of graded as all unanswered.
+        """
+        # First, extract text from PDF (embedded text where usable, OCR elsewhere)
+        pages = process_pdf_hybrid(pdf_path, extracted_text_file, backend=self.ocr_backend)
+        if pages is None:
+            raise TextExtractionError(f"Could not extract text from {os.path.basename(pdf_path)}")
+        return self.answers_from_pages(pdf_path, pages)
+
+    def answers_from_pages(self, pdf_path: str, pages: List[Dict]) -> List[str]:
+        """Split a sheet's extracted page records into answers; raises TextExtractionError if every page is empty."""
+        extracted_text = join_page_texts(pages)
+        if not extracted_text.strip():
+            raise TextExtractionError(f"No text was extracted from any page of {os.path.basename(pdf_path)}")
 
         # Extract answers from the text, skipping the first line after each question
-        student_answers = self.extract_answers_from_text(extracted_text)
+        return self.extract_answers_from_text(extracted_text)
 
+    def pair_answers(self, student_answers: List[str], answer_key_path: str) -> List[Tuple[str, str, str]]:
+        """Pair answers with the key by order as (question, student_answer, ideal_answer)."""
         # Load questions and ideal answers from the answer key
         questions, ideal_answers = self.load_answer_key(answer_key_path)
 
-        results = []
-        num_questions = len(questions)
         num_answers = len(student_answers)
-
+        items = []
         for idx, question in enumerate(questions):
             ideal_answer = ideal_answers[idx] if idx < len(ideal_answers) else ""
             # Map answer by order if available
             if idx < num_answers:
                 student_answer = student_answers[idx]
             else:
-                student_answer = "No answer provided."
-
-            # Evaluate answer
-            try:
-                score, feedback = self.get_mistral_feedback(question, student_answer, ideal_answer)
-            except Exception:
-                score, feedback = self.fallback_evaluate(question, student_answer, ideal_answer)
-
+                student_answer = MISSING_ANSWER
+            items.append((question, student_answer, ideal_answer))
+        return items
+
+    def prepare_answer_sheet(self, pdf_path: str, answer_key_path: str,
+                             extracted_text_file: Optional[str] = None) -> List[Tuple[str, str, str]]:
+        """Extract a sheet's answers and pair them with the key as (question, student_answer, ideal_answer)."""
+        return self.pair_answers(self.extract_student_answers(pdf_path, extracted_text_file), answer_key_path)
+
+    def ocr_settings(self) -> str:
+        """Everything that changes the text extracted from a sheet."""
+        return (f"{get_ocr_backend(self.ocr_backend).settings()}|embedded_text>={EMBEDDED_TEXT_MIN_CHARS}"
+                f"@{EMBEDDED_TEXT_MIN_QUALITY}")
+
+    def grader_version(self) -> str:
+        """Everything besides the texts that changes the grades."""
+        parts = [GRADER_VERSION, self.scorer]
+        if self.scorer == "llm":
+            parts += [self.model, self.grading_mode, GRADING_PROMPT_VERSION, BATCH_PROMPT_VERSION,
+                      QUESTION_MAJOR_PROMPT_VERSION, f"cascade={self.cascade}:{CASCADE_LOW}:{CASCADE_HIGH}"]
+        elif self.scorer == "embedding":
+            parts.append(EMBEDDING_MODEL)
+        return "|".join(parts)
+
+    def find_previous_results(self, pdf_path: str, answer_key_path: str,
+                              output_file: str) -> Tuple[Dict, Optional[Dict]]:
+        """The sheet's current inputs, and earlier results for the same sheet and OCR settings (or None).
+
+        Earlier results are looked up under ``output_file``'s name in the
+        results store, then by sheet content among every stored sheet, and
+        finally in a results file written before the store existed.
+        """
+        answer_key = get_answer_key(answer_key_path)
+        inputs = {
+            "sheet_sha256": file_sha256(pdf_path),
+            "answer_key_sha256": answer_key.key_id if answer_key is not None else None,
+            "ocr_settings": self.ocr_settings(),
+            "grader_version": self.grader_version(),
+        }
+        store = self.results_store
+        previous = store.load_sheet(store.sheet_name(output_file))
+        def same_sheet(data):
+            # A record without any extracted text (OCR failed) is a miss, so OCR is retried
+            return (data is not None and bool(data["inputs"]) and
+                    any((answer or "").strip() for answer in data["student_answers"] or ()) and
+                    data["inputs"].get("sheet_sha256") == inputs["sheet_sha256"] and
+                    data["inputs"].get("ocr_settings") == inputs["ocr_settings"])
+
+        if not same_sheet(previous):
+            other = store.find_sheet(inputs["sheet_sha256"], inputs["ocr_settings"])
+            previous = store.load_sheet(other) if other else None
+        if not same_sheet(previous):
+            previous = read_results_file(output_file)
+            if not same_sheet(previous):
+                previous = None
+        return inputs, previous
+
+    def build_plan(self, inputs: Dict, previous: Optional[Dict], student_answers: List[str],
+                   answer_key_path: str) -> Dict:
+        """Pair the answers with the key and pick out the grades that can be reused from ``previous``.
+
+        Fallback grades (the LLM was unavailable or failed) are never reused,
+        so the next run asks the model again.
+        """
+        items = self.pair_answers(student_answers, answer_key_path)
+        reused: Dict[int, Tuple[float, str, str]] = {}
+        if previous is not None and self.scorer == "llm" and \
+                previous["inputs"].get("grader_version") == inputs["grader_version"]:
+            earlier = {(result.get("question"), result.get("student_answer"), result.get("ideal_answer")): result
+                       for result in previous["results"]}
+            for position, item in enumerate(items):
+                result = earlier.get(item)
+                if result is not None and result.get("grading_tier", "llm") != "fallback":
+                    reused[position] = (result["score"], result["feedback"], result.get("grading_tier", "llm"))
+        return {"inputs": inputs, "student_answers": student_answers, "items": items, "reused": reused,
+                "ocr_reused": previous is not None}
+
+    def plan_answer_sheet(self, pdf_path: str, answer_key_path: str, output_file: str,
+                          extracted_text_file: Optional[str] = None) -> Dict:
+        """Work out what must be redone for a sheet, reusing earlier results where inputs match.
+
+        OCR is skipped when the sheet and OCR settings are unchanged; a
+        question keeps its earlier grade when its question, ideal answer and
+        student answer are unchanged and the grader version matches (LLM
+        scorer only; the offline scorers are cheap enough to rerun) and the
+        earlier grade was not a fallback.
+        """
+        inputs, previous = self.find_previous_results(pdf_path, answer_key_path, output_file)
+        if previous is not None:
+            student_answers = previous["student_answers"]
+        else:
+            student_answers = self.extract_student_answers(pdf_path, extracted_text_file)
+        return self.build_plan(inputs, previous, student_answers, answer_key_path)
+
+    @staticmethod
+    def pending_items(plan: Dict) -> List[Tuple[str, str, str]]:
+        """The plan's items that still need grading."""
+        return [item for position, item in enumerate(plan["items"]) if position not in plan["reused"]]
+
+    def finish_plan(self, plan: Dict, grades: List[Tuple[float, str, str]], output_file: str) -> List[Dict]:
+        """Merge new grades for the plan's pending questions with the reused ones and save."""
+        new_grades = iter(grades)
+        merged = [plan["reused"][position] if position in plan["reused"] else next(new_grades)
+                  for position in range(len(plan["items"]))]
+        return self.save_sheet_results(plan["items"], merged, output_file,
+                                       plan["inputs"], plan["student_answers"])
+
+    @staticmethod
+    def reuse_summary(plan: Dict) -> Dict:
+        reused = len(plan["reused"])
+        return {
+            "sheet_reused": plan["ocr_reused"] and reused == len(plan["items"]),
+            "ocr_reused": plan["ocr_reused"],
+            "questions_reused": reused,
+            "questions_graded": len(plan["items"]) - reused,
+        }
+
+    def grade_sheet_incremental(self, pdf_path: str, answer_key_path: str, output_file: str,
+                                extracted_text_file: Optional[str] = None) -> Tuple[List[Dict], Dict]:
+        """Grade a sheet, redoing only what changed since its results were last written.
+
+        Returns the results and a summary of what was reused.
+        """
+        with tracing.span("sheet", sheet=os.path.basename(pdf_path)):
+            plan = self.plan_answer_sheet(pdf_path, answer_key_path, output_file, extracted_text_file)
+            pending = self.pending_items(plan)
+            grades = self.grade_items(pending, answer_key_path) if pending else []
+            summary = self.reuse_summary(plan)
+            if summary["questions_reused"] or summary["ocr_reused"]:
+                print(f"Reused {summary['questions_reused']}/{len(plan['items'])} grades"
+                      f"{' and the extracted text' if summary['ocr_reused'] else ''} for {os.path.basename(pdf_path)}")
+            return self.finish_plan(plan, grades, output_file), summary
+
+    def grade_items(self, items: List[Tuple[str, str, str]], answer_key_path: str) -> List[Tuple[float, str, str]]:
+        """(score, feedback, tier) for one or more sheets' items with the configured scorer."""
+        with tracing.span("grade", scorer=self.scorer, questions=len(items)):
+            # With the LLM scorer only uncertain answers reach the model
+            if self.scorer == "llm":
+                return self.grade_answers_cascade(items)
+            num_questions = len(get_answer_key(answer_key_path) or ())
+            grades = []
+            for start in range(0, len(items), num_questions or 1):
+                sheet_items = items[start:start + num_questions]
+                grades.extend(self.grade_answers_offline(answer_key_path, [item[1] for item in sheet_items]))
+            return grades
+
+    def save_sheet_results(self, items: List[Tuple[str, str, str]], grades: List[Tuple[float, str, str]],
+                           output_file: str, inputs: Optional[Dict] = None,
+                           student_answers: Optional[List[str]] = None) -> List[Dict]:
+        """Combine items with their grades, save them under ``output_file`` and return them.
+
+        The grades go straight into the results store; ``output_file`` itself
+        is only written when ``write_result_files`` is set. ``inputs`` and
+        ``student_answers`` are stored alongside the results so a later
+        regrade can tell what changed (see plan_answer_sheet).
+        """
+        results = []
+        for (question, student_answer, ideal_answer), (score, feedback, tier) in zip(items, grades):
             results.append({
                 "question": question,
                 "student_answer": student_answer,
                 "ideal_answer": ideal_answer,
                 "score": score,
-                "feedback": feedback
+                "feedback": feedback,
+                "grading_tier": tier
             })
 
         # Remove or comment out the old evaluation function call
         # results = evaluate_student_answers(answer_key_path, student_answers)
         # Save results
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
-
-        # Clean up temporary file
-        os.remove(temp_text_file)
-
-        print(f"Evaluation complete. Results saved to: {output_file}")
+        with tracing.span("persist", questions=len(results)):
+            self.results_store.save_sheet(self.results_store.sheet_name(output_file), items, grades,
+                                          inputs, student_answers)
+            if self.write_result_files:
+                write_results_file(output_file, results, inputs, student_answers)
+
+        stats = self.grading_cache.stats()
+        print(f"Grading cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+        if self.scorer == "llm":
+            tiers = Counter(result["grading_tier"] for result in results)
+            print("Grading tiers: " + ", ".join(
+                f"{tier} {tiers[tier] / len(results) if results else 0:.0%}" for tier in CASCADE_TIERS))
+        print(f"Evaluation complete. Results saved to: "
+              f"{output_file if self.write_result_files else self.results_store.path}")
+        return results
+
+    def process_answer_sheet(self, pdf_path: str, answer_key_path: str, output_file: str,
+                             extracted_text_file: Optional[str] = None) -> List[Dict]:
+        """Process an answer sheet PDF and evaluate it against the answer key.
+
+        The extracted text is handed over in memory, so several sheets can be
+        graded concurrently; pass ``extracted_text_file`` to also keep it on disk.
+        Unchanged sheets and questions reuse their earlier results (see
+        grade_sheet_incremental). Returns the per-question results that are
+        also saved under ``output_file``.
+        """
+        results, _ = self.grade_sheet_incremental(pdf_path, answer_key_path, output_file, extracted_text_file)
+        return results
+
+    def grade_sheets(self, sheets: List[Dict[str, str]], answer_key_path: str,
+                     max_workers: int = SHEET_MAX_WORKERS,
+                     on_sheet_started: Optional[Callable[[str], None]] = None,
+                     on_sheet_done: Optional[Callable[[str, List[Dict], Dict], None]] = None,
+                     on_sheet_failed: Optional[Callable[[str, str], None]] = None,
+                     should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+        """Grade ``sheets`` (dicts with "pdf_path" and "output_file"), reporting each as it finishes.
+
+        In "question_major" grading mode every sheet is extracted first and
+        all answers are graded together, grouped by question. Otherwise the
+        sheets go through GradingPipeline when GRADING_PIPELINE is set, or are
+        graded each on its own thread. A sheet that fails (or is skipped
+        because ``should_stop`` returned True, reported as SHEET_CANCELLED)
+        goes to ``on_sheet_failed`` instead of ``on_sheet_done``. Returns
+        {"results": {pdf_path: results}, "reuse": {pdf_path: summary},
+        "errors": {pdf_path: message}} like GradingPipeline.run.
+        """
+        if GRADING_PIPELINE and self.grading_mode != "question_major":
+            pipeline = GradingPipeline(self, answer_key_path, on_sheet_started=on_sheet_started,
+                                       on_sheet_done=on_sheet_done, on_sheet_failed=on_sheet_failed,
+                                       should_stop=should_stop)
+            return pipeline.run(sheets)
+        report = {"results": {}, "reuse": {}, "errors": {}}
+        lock = threading.Lock()
+
+        def begin(sheet) -> bool:
+            if should_stop is not None and should_stop():
+                fail(sheet, SHEET_CANCELLED)
+                return False
+            if on_sheet_started is not None:
+                on_sheet_started(sheet["pdf_path"])
+            return True
+
+        def fail(sheet, error):
+            if error != SHEET_CANCELLED:
+                print(f"Error grading {sheet['pdf_path']}: {error}")
+            with lock:
+                report["errors"][sheet["pdf_path"]] = error
+            if on_sheet_failed is not None:
+                on_sheet_failed(sheet["pdf_path"], error)
+
+        def finish(sheet, results, summary):
+            with lock:
+                report["results"][sheet["pdf_path"]] = results
+                report["reuse"][sheet["pdf_path"]] = summary
+            if on_sheet_done is not None:
+                on_sheet_done(sheet["pdf_path"], results, summary)
+
+        def run(sheet):
+            if not begin(sheet):
+                return
+            try:
+                results, summary = self.grade_sheet_incremental(sheet["pdf_path"], answer_key_path,
+                                                                sheet["output_file"])
+            except Exception as e:
+                fail(sheet, str(e))
+                return
+            finish(sheet, results, summary)
 
-    def load_answer_key(self, answer_key_path):
-        """Load questions and ideal answers from a .docx answer key file."""
-        import os
-        questions = []
-        ideal_answers = []
-        
-        if answer_key_path.lower().endswith('.docx'):
+        def plan(sheet):
+            if not begin(sheet):
+                return None
             try:
-                from docx import Document
-                doc = Document(answer_key_path)
-                q = None
-                a = []
-                print("\nLoading answer key from .docx file:")
-                for para in doc.paragraphs:
-                    text = para.text.strip()
-                    if not text:
-                        # Blank line: treat as delimiter between Q&A pairs
-                        if q and a:
-                            questions.append(q)
-                            ideal_answers.append('\n'.join(a).strip())
-                            print(f"\nQuestion: {q}")
-                            print(f"Answer: {ideal_answers[-1]}")
-                            q = None
-                            a = []
-                        continue
-                    if q is None:
-                        q = text
-                    else:
-                        a.append(text)
-                # Add last Q&A if present
-                if q and a:
-                    questions.append(q)
-                    ideal_answers.append('\n'.join(a).strip())
-                    print(f"\nQuestion: {q}")
-                    print(f"Answer: {ideal_answers[-1]}")
-                print(f"\nLoaded {len(questions)} questions from docx answer key.")
-                return questions, ideal_answers
+                # The sheet's answers are graded with the others, so its spans are the plan and finish steps
+                with tracing.span("plan", sheet=os.path.basename(sheet["pdf_path"])):
+                    return self.plan_answer_sheet(sheet["pdf_path"], answer_key_path, sheet["output_file"])
             except Exception as e:
-                print(f"Error loading .docx answer key: {e}")
-                return [], []
-        else:
-            # Fallback to text file logic
-            encodings = ['utf-8', 'latin1', 'cp1252']
-            for encoding in encodings:
-                try:
-                    with open(answer_key_path, 'r', encoding=encoding) as f:
-                        content = f.read()
-                        sections = content.split('\n\n')
-                        for section in sections:
-                            lines = section.strip().split('\n')
-                            if not lines:
-                                continue
-                            question = lines[0].strip()
-                            if not question:
-                                continue
-                            ideal_answer = '\n'.join(lines[1:]).strip()
-                            questions.append(question)
-                            ideal_answers.append(ideal_answer)
-                        print(f"Successfully loaded answer key using {encoding} encoding")
-                        return questions, ideal_answers
-                except UnicodeDecodeError:
-                    continue
-                except Exception as e:
-                    print(f"Error loading answer key with {encoding} encoding: {str(e)}")
-                    continue
-            print("Failed to load answer key with any encoding")
+                fail(sheet, str(e))
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            if self.grading_mode != "question_major" or self.scorer != "llm":
+                list(executor.map(tracing.propagate(run), sheets))
+                return report
+            plans = list(executor.map(tracing.propagate(plan), sheets))
+
+        planned = [(sheet, sheet_plan) for sheet, sheet_plan in zip(sheets, plans) if sheet_plan is not None]
+        pending = [self.pending_items(sheet_plan) for _, sheet_plan in planned]
+        grades = self.grade_items([item for items in pending for item in items], answer_key_path)
+        offset = 0
+        for (sheet, sheet_plan), items in zip(planned, pending):
+            sheet_grades = grades[offset:offset + len(items)]
+            offset += len(items)
+            try:
+                with tracing.span("finish", sheet=os.path.basename(sheet["pdf_path"])):
+                    results = self.finish_plan(sheet_plan, sheet_grades, sheet["output_file"])
+            except Exception as e:
+                fail(sheet, str(e))
+                continue
+            finish(sheet, results, self.reuse_summary(sheet_plan))
+        return report
+
+    def process_answer_sheets(self, sheet_paths: List[str], answer_key_path: str, results_dir: str,
+                              max_workers: int = SHEET_MAX_WORKERS) -> Dict[str, List[Dict]]:
+        """Grade several answer sheets at once, saving each under ``<results_dir>/<sheet>_results.json``.
+
+        Sheets are graded with grade_sheets; their questions all share the
+        Ollama client's in-flight limit. Returns results keyed by sheet path;
+        a sheet that could not be graded gets an empty list and its error is
+        kept in ``self.last_errors``. What was reused is tallied in
+        ``self.last_reuse``.
+        """
+        os.makedirs(results_dir, exist_ok=True)
+        sheets = [{"pdf_path": path, "output_file": os.path.join(
+                      results_dir, f"{os.path.splitext(os.path.basename(path))[0]}_results.json")}
+                  for path in sheet_paths]
+        report = self.grade_sheets(sheets, answer_key_path, max_workers)
+        self.last_reuse = self.tally_reuse(list(report["reuse"].values()))
+        self.last_errors = report["errors"]
+        return {path: report["results"].get(path, []) for path in sheet_paths}
+
+    @staticmethod
+    def tally_reuse(summaries: List[Dict]) -> Dict:
+        """Totals of grade_sheet_incremental summaries across sheets."""
+        return {
+            "sheets_reused": sum(1 for summary in summaries if summary["sheet_reused"]),
+            "ocr_reused": sum(1 for summary in summaries if summary["ocr_reused"]),
+            "questions_reused": sum(summary["questions_reused"] for summary in summaries),
+            "questions_graded": sum(summary["questions_graded"] for summary in summaries),
+        }
+
+    def load_answer_key(self, answer_key_path):
+        """Load questions and ideal answers from a .docx/.pdf/.txt answer key.
+
+        The key is compiled once per content and shared by every evaluator and
+        sheet in the process (see scan.answer_key.get_answer_key).
+        """
+        answer_key = get_answer_key(answer_key_path)
+        if answer_key is None:
             return [], []
+        return list(answer_key.questions), list(answer_key.ideal_answers)
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        # Whole directory across a process pool, resumable via a checkpoint manifest
+        from scan.batch_grading import main as batch_main
+        batch_main(sys.argv[2:])
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--purge-grading-cache":
+        EnhancedEvaluator().purge_stale_grades()
+        return
+
     if len(sys.argv) < 4:
         print("Usage: python enhanced_evaluator.py <pdf_path> <answer_key_path> <output_file>")
+        print("       python enhanced_evaluator.py --batch <sheets_dir> <answer_key_path> <results_dir> [workers]")
+        print("       python enhanced_evaluator.py --purge-grading-cache")
         return
 
     pdf_path = sys.argv[1]
@@ -242,7 +968,12 @@ def main():
         return
 
     evaluator = EnhancedEvaluator()
-    evaluator.process_answer_sheet(pdf_path, answer_key_path, output_file)
+    # The output file was asked for explicitly, so write it as well as the store
+    evaluator.write_result_files = True
+    try:
+        evaluator.process_answer_sheet(pdf_path, answer_key_path, output_file)
+    except TextExtractionError as e:
+        print(f"Error: {str(e)}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
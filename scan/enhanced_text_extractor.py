@@ -1,13 +1,15 @@
 import os
-from google.cloud import vision
-from pdf2image import convert_from_path
 from PIL import Image
-import io
 import sys
 import json
 import requests
 from typing import Dict, List, Tuple
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scan.pdf_text_extractor import (get_pdf_page_count, iter_pdf_pages, map_pages_in_order,
+                                     OCR_MAX_WORKERS)
+from scan.ocr_backends import get_ocr_backend, get_vision_client
+
 # Configure Poppler path - Update this path to where you extracted Poppler
 POPPLER_PATH = r"C:\Program Files\poppler-24.08.0\Library\bin"
 
@@ -17,8 +19,8 @@ class EnhancedTextExtractor:
         if not self.verify_credentials():
             raise Exception("Google Cloud credentials not properly configured")
             
-        # Initialize Vision API client
-        self.vision_client = vision.ImageAnnotatorClient()
+        # Reuse the process-wide Vision client (one gRPC channel for all pages)
+        self.vision_client = get_vision_client()
         
         # Mistral API configuration
         self.mistral_api_endpoint = os.getenv("MISTRAL_API_ENDPOINT", "YOUR_MISTRAL_API_ENDPOINT")
@@ -46,24 +48,7 @@ class EnhancedTextExtractor:
     def extract_text_from_image(self, image: Image.Image) -> str:
         """Extract text from an image using Google Cloud Vision API."""
         try:
-            # Convert PIL Image to bytes
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='PNG')
-            img_byte_arr = img_byte_arr.getvalue()
-            
-            # Create Vision API image object
-            vision_image = vision.Image(content=img_byte_arr)
-            
-            # Perform text detection
-            response = self.vision_client.document_text_detection(image=vision_image)
-            
-            if response.error.message:
-                raise Exception(
-                    '{}\nFor more info on error messages, check: '
-                    'https://cloud.google.com/apis/design/errors'.format(
-                        response.error.message))
-            
-            return response.full_text_annotation.text
+            return get_ocr_backend("vision").recognize_image(image)
         except Exception as e:
             print(f"Error in text extraction: {str(e)}")
             return ""
@@ -125,8 +110,32 @@ Corrected text (only fix obvious errors):"""
             print(f"Error calling Mistral API: {str(e)}")
             return text  # Return original text if API call fails
 
-    def process_pdf(self, pdf_path: str, output_file: str, correct_text: bool = True) -> None:
-        """Process PDF and extract text from each page, with optional Mistral correction."""
+    def _process_page(self, page_number: int, image: Image.Image, page_count: int, correct_text: bool) -> str:
+        """OCR one page and optionally correct it; runs inside the page worker pool."""
+        print(f"Processing page {page_number}/{page_count}")
+        try:
+            # Extract text using Vision API
+            text = self.extract_text_from_image(image)
+            if not text:
+                print(f"No text detected on page {page_number}")
+                return ""
+            if correct_text:
+                print(f"Correcting text for page {page_number}...")
+                text = self.correct_text_with_mistral(text)
+            return text
+        except Exception as e:
+            print(f"Error processing page {page_number}: {str(e)}")
+            return ""
+        finally:
+            image.close()
+
+    def process_pdf(self, pdf_path: str, output_file: str, correct_text: bool = True,
+                    max_workers: int = OCR_MAX_WORKERS) -> None:
+        """Process PDF and extract text from each page, with optional Mistral correction.
+
+        Pages are rasterized a window at a time and up to ``max_workers`` pages are
+        processed concurrently; page order is preserved.
+        """
         # Convert PDF to images
         print(f"Converting PDF to images: {pdf_path}")
         try:
@@ -136,30 +145,26 @@ Corrected text (only fix obvious errors):"""
                 print("Extract it to C:\\Program Files\\poppler-24.08.0\\")
                 return
                 
-            images = convert_from_path(pdf_path, poppler_path=POPPLER_PATH)
+            page_count = get_pdf_page_count(pdf_path, poppler_path=POPPLER_PATH)
         except Exception as e:
             print(f"Error converting PDF to images: {str(e)}")
             print("Please make sure Poppler is installed at the correct path")
             return
         
-        # Extract and process text from each page
+        # Extract and process text from each page as it is rendered
         all_text = []
-        for i, image in enumerate(images):
-            print(f"Processing page {i+1}/{len(images)}")
-            try:
-                # Extract text using Vision API
-                text = self.extract_text_from_image(image)
+        try:
+            pages = iter_pdf_pages(pdf_path, page_count, poppler_path=POPPLER_PATH)
+            for page_number, text in map_pages_in_order(
+                    lambda n, image: self._process_page(n, image, page_count, correct_text),
+                    pages, max_workers):
                 if text:
-                    if correct_text:
-                        print(f"Correcting text for page {i+1}...")
-                        text = self.correct_text_with_mistral(text)
-                    
-                    all_text.append(f"\n--- Page {i+1} ---\n")
+                    all_text.append(f"\n--- Page {page_number} ---\n")
                     all_text.append(text)
-                else:
-                    print(f"No text detected on page {i+1}")
-            except Exception as e:
-                print(f"Error processing page {i+1}: {str(e)}")
+        except Exception as e:
+            print(f"Error converting PDF to images: {str(e)}")
+            print("Please make sure Poppler is installed at the correct path")
+            return
         
         if not all_text:
             print("No text was extracted from any page.")
@@ -0,0 +1,214 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+from scan.tracing import count
+
+# SQLite file holding LLM grades, and how many grades to keep
+GRADING_CACHE_PATH = os.getenv(
+    "GRADING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "grading.sqlite3"))
+GRADING_CACHE_MAX_ENTRIES = int(os.getenv("GRADING_CACHE_MAX_ENTRIES", "100000"))
+# Set GRADING_CACHE_BYPASS=1 to always ask the model
+GRADING_CACHE_BYPASS = os.getenv("GRADING_CACHE_BYPASS", "0") == "1"
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace so OCR line breaks do not defeat the cache."""
+    return re.sub(r'\s+', ' ', (text or '').strip().lower())
+
+class GradingCache:
+    """Persistent cache of LLM grades keyed on model, prompt version and normalized texts.
+
+    Entries are evicted least-recently-used once the table grows past
+    ``max_entries``. Use ``invalidate`` when the model or prompt changes.
+    """
+
+    def __init__(self, path: str = GRADING_CACHE_PATH, max_entries: int = GRADING_CACHE_MAX_ENTRIES,
+                 bypass: bool = GRADING_CACHE_BYPASS):
+        self.path = path
+        self.max_entries = max_entries
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._puts_since_evict = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS grades (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_grades_last_used ON grades (last_used)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_grades_version ON grades (model, prompt_version)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (and per process, since the cache is reset after fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model: str, prompt_version: str, question: str, ideal_answer: str,
+                 student_answer: str) -> str:
+        """Hash the model, prompt version and normalized question/ideal/student texts."""
+        digest = hashlib.sha256()
+        for part in (model, prompt_version, normalize_text(question),
+                     normalize_text(ideal_answer), normalize_text(student_answer)):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        """Return a cached (score, feedback) or None."""
+        if self.bypass:
+            return None
+        conn = self._conn()
+        row = conn.execute("SELECT result FROM grades WHERE cache_key = ?", (key,)).fetchone()
+        count("grading_cache_lookups_total", result="hit" if row is not None else "miss")
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        conn.execute("UPDATE grades SET last_used = ? WHERE cache_key = ?", (time.time(), key))
+        conn.commit()
+        result = json.loads(row[0])
+        return result["score"], result["feedback"]
+
+    def put(self, key: str, model: str, prompt_version: str, score, feedback: str) -> None:
+        """Store a grade returned by the model."""
+        if self.bypass:
+            return
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO grades (cache_key, model, prompt_version, result, created, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, prompt_version, json.dumps({"score": score, "feedback": feedback}), now, now))
+        conn.commit()
+        with self._lock:
+            self._puts_since_evict += 1
+            check = self._puts_since_evict >= 100
+            if check:
+                self._puts_since_evict = 0
+        if check:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete least-recently-used rows beyond max_entries."""
+        conn = self._conn()
+        rows = conn.execute("SELECT COUNT(*) FROM grades").fetchone()[0]
+        excess = rows - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM grades WHERE cache_key IN "
+                "(SELECT cache_key FROM grades ORDER BY last_used LIMIT ?)", (excess,))
+            conn.commit()
+            with self._lock:
+                self.evictions += excess
+
+    def invalidate(self, model: Optional[str] = None,
+                   prompt_version: Union[None, str, Sequence[str]] = None,
+                   keep_current: bool = False) -> int:
+        """Delete cached grades and return how many were removed.
+
+        With ``keep_current=True`` the given model's grades from every *other*
+        prompt version are removed, which is how stale grades are purged after
+        a prompt change; other models' grades are left alone, since another
+        process may be grading with them. Otherwise rows matching the given
+        filters are removed (all rows if no filter is given).
+        """
+        conn = self._conn()
+        versions = None
+        if prompt_version is not None:
+            versions = [prompt_version] if isinstance(prompt_version, str) else list(prompt_version)
+        if keep_current:
+            if model is None or not versions:
+                raise ValueError("keep_current needs the current model and prompt version(s)")
+            placeholders = ', '.join('?' for _ in versions)
+            cursor = conn.execute(
+                f"DELETE FROM grades WHERE model = ? AND prompt_version NOT IN ({placeholders})",
+                [model] + versions)
+        elif model is None and versions is None:
+            cursor = conn.execute("DELETE FROM grades")
+        else:
+            clauses, params = [], []
+            if model is not None:
+                clauses.append("model = ?")
+                params.append(model)
+            if versions is not None:
+                clauses.append(f"prompt_version IN ({', '.join('?' for _ in versions)})")
+                params.extend(versions)
+            cursor = conn.execute(f"DELETE FROM grades WHERE {' AND '.join(clauses)}", params)
+        conn.commit()
+        return cursor.rowcount
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and the number of stored grades."""
+        entries = self._conn().execute("SELECT COUNT(*) FROM grades").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "bypass": self.bypass,
+            }
+
+_grading_cache = None
+_grading_cache_lock = threading.Lock()
+
+def get_grading_cache() -> GradingCache:
+    """Return the process-wide grading cache."""
+    global _grading_cache
+    if _grading_cache is None:
+        with _grading_cache_lock:
+            if _grading_cache is None:
+                _grading_cache = GradingCache()
+    return _grading_cache
+
+def purge_stale_grades(model: str, prompt_versions: Sequence[str]) -> int:
+    """Drop ``model``'s grades from prompt versions other than ``prompt_versions``.
+
+    Run explicitly after changing a prompt (stale rows are never looked up
+    again, and LRU eviction removes them eventually anyway); it is not run on
+    start-up, so processes grading with other models or prompt versions
+    against the same cache keep their grades. Returns the number removed.
+    """
+    try:
+        removed = get_grading_cache().invalidate(model, list(prompt_versions), keep_current=True)
+        print(f"Grading cache: removed {removed} grades from older {model} prompts")
+        return removed
+    except sqlite3.Error as e:
+        print(f"Error purging grading cache: {str(e)}")
+        return 0
+
+def _reset_grading_cache():
+    """SQLite connections must not be shared with forked children."""
+    global _grading_cache, _grading_cache_lock
+    _grading_cache = None
+    _grading_cache_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_grading_cache)
@@ -0,0 +1,400 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scan.results_store import get_results_store
+
+# SQLite file holding grading jobs, so their state survives a restart of the web process
+GRADING_JOBS_DB = os.getenv(
+    "GRADING_JOBS_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "jobs.sqlite3"))
+# Jobs run at the same time; sheets within a job are graded like process_answer_sheets
+GRADING_JOB_WORKERS = int(os.getenv("GRADING_JOB_WORKERS", "1"))
+# A queued or running job is owned by one job manager, which renews its lease
+# every JOB_LEASE_SECONDS / 3; a job whose lease has run out (its process is
+# gone, e.g. after a container restart) is taken over by another manager
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Finished jobs kept per results directory; each job stores its own copy of every
+# sheet's results, so older jobs (and their rows in the results store) are purged
+# once this many newer ones have finished. 0 keeps every job.
+GRADING_JOB_RETENTION = int(os.getenv("GRADING_JOB_RETENTION", "5"))
+
+def summarize_sheet(student_file: str, student_results: List[Dict]) -> Dict:
+    """The per-student entry returned by /generate_results."""
+    # Calculate total score
+    total_score = sum(float(result['score']) for result in student_results)
+    max_score = len(student_results) * 10  # Assuming each question is out of 10
+    return {
+        'student_file': student_file,
+        'total_score': f"{total_score}/{max_score}",
+        'detailed_results': student_results
+    }
+
+class GradingJobManager:
+    """Runs answer-sheet grading jobs in the background and tracks them in SQLite.
+
+    A job is every sheet of one upload graded against one answer key. Each
+    sheet's result is stored as soon as it is graded, so status() can report
+    progress, an ETA and partial results, and a job interrupted by a restart
+    resumes with the sheets that were not finished. Ownership is a lease held
+    by a per-instance token rather than a PID, since a restarted server often
+    gets the same PID as the one that died. Old finished jobs are purged
+    with their stored results (see prune_superseded and purge).
+    """
+
+    def __init__(self, path: str = GRADING_JOBS_DB, max_workers: int = GRADING_JOB_WORKERS,
+                 lease_seconds: float = JOB_LEASE_SECONDS, retention: int = GRADING_JOB_RETENTION):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.retention = retention
+        self.owner = uuid.uuid4().hex
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="grading-job")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                answer_key_path TEXT NOT NULL,
+                results_dir TEXT NOT NULL,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                owner_pid INTEGER,
+                error TEXT,
+                owner TEXT,
+                lease_expires REAL
+            );
+            CREATE TABLE IF NOT EXISTS job_sheets (
+                job_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                sheet_path TEXT NOT NULL,
+                student_file TEXT NOT NULL,
+                status TEXT NOT NULL,
+                started REAL,
+                finished REAL,
+                results TEXT,
+                error TEXT,
+                sheet_reused INTEGER NOT NULL DEFAULT 0,
+                questions_reused INTEGER NOT NULL DEFAULT 0,
+                total_score REAL,
+                max_score INTEGER,
+                results_name TEXT,
+                PRIMARY KEY (job_id, position)
+            );
+        """)
+        # Databases created by earlier versions lack the newer columns
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(job_sheets)")}
+        for column, definition in (("sheet_reused", "INTEGER NOT NULL DEFAULT 0"),
+                                   ("questions_reused", "INTEGER NOT NULL DEFAULT 0"),
+                                   ("total_score", "REAL"), ("max_score", "INTEGER"),
+                                   ("results_name", "TEXT")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE job_sheets ADD COLUMN {column} {definition}")
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in (("owner", "TEXT"), ("lease_expires", "REAL")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        conn.commit()
+        self._resume_interrupted()
+        threading.Thread(target=self._renew_leases, name="grading-job-lease", daemon=True).start()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, params=()) -> None:
+        conn = self._conn()
+        conn.execute(sql, params)
+        conn.commit()
+
+    def _renew_leases(self) -> None:
+        """Keep this manager's jobs leased, and take over jobs whose owner stopped renewing."""
+        while True:
+            time.sleep(max(1.0, self.lease_seconds / 3))
+            try:
+                self._execute("UPDATE jobs SET lease_expires = ? WHERE owner = ? AND status IN ('queued', 'running')",
+                              (time.time() + self.lease_seconds, self.owner))
+                self._resume_interrupted()
+            except Exception as e:
+                print(f"Error renewing grading job leases: {str(e)}")
+
+    def _resume_interrupted(self) -> None:
+        """Requeue jobs that were queued or running under a manager whose lease has expired.
+
+        Jobs leased by another live manager are left alone; claiming a job is
+        a conditional UPDATE, so two managers starting together cannot both take it.
+        """
+        conn = self._conn()
+        now = time.time()
+        rows = conn.execute("SELECT job_id, owner, lease_expires FROM jobs WHERE status IN ('queued', 'running') "
+                            "AND (owner IS NULL OR owner != ?) AND (lease_expires IS NULL OR lease_expires < ?)",
+                            (self.owner, now)).fetchall()
+        for row in rows:
+            cursor = conn.execute("UPDATE jobs SET status = 'queued', owner = ?, owner_pid = ?, lease_expires = ? "
+                                  "WHERE job_id = ? AND owner IS ? AND lease_expires IS ?",
+                                  (self.owner, os.getpid(), now + self.lease_seconds, row["job_id"],
+                                   row["owner"], row["lease_expires"]))
+            if cursor.rowcount == 0:
+                conn.commit()
+                continue
+            conn.execute("UPDATE job_sheets SET status = 'pending', started = NULL "
+                         "WHERE job_id = ? AND status = 'running'", (row["job_id"],))
+            conn.commit()
+            print(f"Resuming grading job {row['job_id']}")
+            self._executor.submit(self._run, row["job_id"])
+
+    def submit(self, sheet_paths: List[str], answer_key_path: str, results_dir: str) -> str:
+        """Queue a grading job and return its id immediately."""
+        job_id = uuid.uuid4().hex
+        conn = self._conn()
+        now = time.time()
+        conn.execute("INSERT INTO jobs (job_id, status, answer_key_path, results_dir, created, owner_pid, "
+                     "owner, lease_expires) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                     (job_id, answer_key_path, results_dir, now, os.getpid(), self.owner,
+                      now + self.lease_seconds))
+        conn.executemany(
+            "INSERT INTO job_sheets (job_id, position, sheet_path, student_file, status) "
+            "VALUES (?, ?, ?, ?, 'pending')",
+            [(job_id, position, path, os.path.basename(path)) for position, path in enumerate(sheet_paths)])
+        conn.commit()
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """Ask a job to stop; sheets already being graded finish, pending ones are skipped."""
+        conn = self._conn()
+        cursor = conn.execute("UPDATE jobs SET cancel_requested = 1 "
+                              "WHERE job_id = ? AND status IN ('queued', 'running')", (job_id,))
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        row = self._conn().execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row is None or bool(row["cancel_requested"])
+
+    def _run(self, job_id: str) -> None:
+        from scan.enhanced_evaluator import EnhancedEvaluator, SHEET_CANCELLED
+        try:
+            job = self._conn().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            self._execute("UPDATE jobs SET status = 'running', started = COALESCE(started, ?) WHERE job_id = ?",
+                          (time.time(), job_id))
+            rows = self._conn().execute(
+                "SELECT position, sheet_path FROM job_sheets WHERE job_id = ? AND status = 'pending' "
+                "ORDER BY position", (job_id,)).fetchall()
+            evaluator = EnhancedEvaluator()
+            # Results are named per job, so a later job grading a sheet with the same file
+            # name does not overwrite the rows this job's status and sheet pages point at
+            # (unchanged sheets are still reused, since earlier results are also found by content)
+            results_dir = os.path.join(job["results_dir"], job_id)
+            if evaluator.write_result_files:
+                os.makedirs(results_dir, exist_ok=True)
+            positions = {row["sheet_path"]: row["position"] for row in rows}
+            sheets = [{"pdf_path": row["sheet_path"], "output_file": os.path.join(
+                          results_dir, f"{os.path.splitext(os.path.basename(row['sheet_path']))[0]}_results.json")}
+                      for row in rows]
+            output_files = {sheet["pdf_path"]: sheet["output_file"] for sheet in sheets}
+
+            def started(sheet_path):
+                self._execute("UPDATE job_sheets SET status = 'running', started = ? "
+                              "WHERE job_id = ? AND position = ?", (time.time(), job_id, positions[sheet_path]))
+
+            def done(sheet_path, results, reuse):
+                # The per-question results live in the results store; only the totals are kept here
+                self._execute("UPDATE job_sheets SET status = 'done', finished = ?, results_name = ?, "
+                              "sheet_reused = ?, questions_reused = ?, total_score = ?, max_score = ? "
+                              "WHERE job_id = ? AND position = ?",
+                              (time.time(), get_results_store().sheet_name(output_files[sheet_path]),
+                               int(reuse["sheet_reused"]), reuse["questions_reused"],
+                               sum(float(result['score']) for result in results), len(results) * 10,
+                               job_id, positions[sheet_path]))
+
+            def failed(sheet_path, error):
+                if error == SHEET_CANCELLED:
+                    self._execute("UPDATE job_sheets SET status = 'cancelled' WHERE job_id = ? AND position = ?",
+                                  (job_id, positions[sheet_path]))
+                    return
+                self._execute("UPDATE job_sheets SET status = 'failed', finished = ?, error = ? "
+                              "WHERE job_id = ? AND position = ?",
+                              (time.time(), error, job_id, positions[sheet_path]))
+
+            # Same path as process_answer_sheets (the pipeline, or question-major grading across the job)
+            evaluator.grade_sheets(sheets, job["answer_key_path"], on_sheet_started=started,
+                                   on_sheet_done=done, on_sheet_failed=failed,
+                                   should_stop=lambda: self._cancel_requested(job_id))
+            status = 'cancelled' if self._cancel_requested(job_id) else 'completed'
+            self._execute("UPDATE jobs SET status = ?, finished = ? WHERE job_id = ?", (status, time.time(), job_id))
+        except Exception as e:
+            print(f"Error running grading job {job_id}: {str(e)}")
+            self._execute("UPDATE jobs SET status = 'failed', finished = ?, error = ? WHERE job_id = ?",
+                          (time.time(), str(e), job_id))
+        try:
+            self.prune_superseded(job_id)
+        except Exception as e:
+            print(f"Error purging old grading jobs: {str(e)}")
+
+    def purge(self, job_id: str) -> bool:
+        """Delete a finished job with its stored results and result files; False if unknown or still active."""
+        conn = self._conn()
+        job = conn.execute("SELECT results_dir, status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if job is None or job["status"] in ('queued', 'running'):
+            return False
+        names = [row["results_name"] for row in conn.execute(
+            "SELECT results_name FROM job_sheets WHERE job_id = ? AND results_name IS NOT NULL", (job_id,))]
+        get_results_store().delete_sheets(names)
+        with conn:
+            conn.execute("DELETE FROM job_sheets WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        shutil.rmtree(os.path.join(job["results_dir"], job_id), ignore_errors=True)
+        return True
+
+    def prune_superseded(self, job_id: str) -> int:
+        """Purge finished jobs of the same results directory beyond the newest ``retention``; returns how many."""
+        if self.retention <= 0:
+            return 0
+        conn = self._conn()
+        job = conn.execute("SELECT results_dir FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if job is None:
+            return 0
+        old = conn.execute(
+            "SELECT job_id FROM jobs WHERE results_dir = ? AND status IN ('completed', 'cancelled', 'failed') "
+            "ORDER BY created DESC LIMIT -1 OFFSET ?", (job["results_dir"], self.retention)).fetchall()
+        purged = sum(1 for row in old if self.purge(row["job_id"]))
+        if purged:
+            print(f"Purged {purged} superseded grading job(s) for {job['results_dir']}")
+        return purged
+
+    def job_state(self, job_id: str) -> Optional[str]:
+        row = self._conn().execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row["status"] if row is not None else None
+
+    def finished_sheets(self, job_id: str) -> List[Dict]:
+        """Summaries (no per-question detail) of the sheets that are no longer pending or running."""
+        rows = self._conn().execute(
+            "SELECT position, student_file, status, error, sheet_reused, total_score, max_score "
+            "FROM job_sheets WHERE job_id = ? AND status IN ('done', 'failed', 'cancelled') "
+            "ORDER BY finished, position", (job_id,)).fetchall()
+        return [{
+            'position': row["position"],
+            'student_file': row["student_file"],
+            'status': row["status"],
+            'error': row["error"],
+            'reused': bool(row["sheet_reused"]),
+            'total_score': f"{row['total_score']}/{row['max_score']}" if row["status"] == 'done' else None,
+        } for row in rows]
+
+    def iter_finished_sheets(self, job_id: str, poll_seconds: float = 0.5) -> Iterator[Dict]:
+        """Yield each sheet's summary once it finishes, until the job ends.
+
+        Only summaries are held in memory, so streaming a large class costs
+        the same as streaming a small one. Works from any process sharing the
+        jobs database.
+        """
+        seen = set()
+        while True:
+            state = self.job_state(job_id)
+            for sheet in self.finished_sheets(job_id):
+                if sheet['position'] not in seen:
+                    seen.add(sheet['position'])
+                    yield sheet
+            if state not in ('queued', 'running'):
+                return
+            time.sleep(poll_seconds)
+
+    @staticmethod
+    def _stored_results(sheet: sqlite3.Row) -> List[Dict]:
+        """A done sheet's per-question results, from the results store (or the row, for older jobs)."""
+        if sheet["results_name"]:
+            data = get_results_store().load_sheet(sheet["results_name"])
+            return data["results"] if data is not None else []
+        return json.loads(sheet["results"]) if sheet["results"] else []
+
+    def sheet_results(self, job_id: str, position: int) -> Optional[Dict]:
+        """Per-question results of one finished sheet; None if it is unknown or not done."""
+        row = self._conn().execute(
+            "SELECT student_file, results, results_name FROM job_sheets "
+            "WHERE job_id = ? AND position = ? AND status = 'done'", (job_id, position)).fetchone()
+        if row is None:
+            return None
+        return summarize_sheet(row["student_file"], self._stored_results(row))
+
+    def status(self, job_id: str, include_results: bool = True) -> Optional[Dict]:
+        """Progress, ETA and results of the sheets graded so far; None for an unknown job.
+
+        With ``include_results=False`` the per-question results are left out.
+        """
+        conn = self._conn()
+        job = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        columns = "*" if include_results else ("position, student_file, status, started, finished, error, "
+                                               "sheet_reused, questions_reused")
+        sheets = conn.execute(f"SELECT {columns} FROM job_sheets WHERE job_id = ? ORDER BY position",
+                              (job_id,)).fetchall()
+
+        finished = [sheet for sheet in sheets if sheet["status"] in ('done', 'failed')]
+        remaining = sum(1 for sheet in sheets if sheet["status"] in ('pending', 'running'))
+        eta = None
+        if job["status"] == 'running' and finished and job["started"]:
+            # Sheets finish at the rate observed so far
+            elapsed = max(sheet["finished"] for sheet in finished) - job["started"]
+            eta = elapsed / len(finished) * remaining
+        return {
+            'job_id': job_id,
+            'status': job["status"],
+            'cancel_requested': bool(job["cancel_requested"]),
+            'error': job["error"],
+            'progress': {
+                'total': len(sheets),
+                'done': sum(1 for sheet in sheets if sheet["status"] == 'done'),
+                'failed': sum(1 for sheet in sheets if sheet["status"] == 'failed'),
+                'remaining': remaining,
+            },
+            # Results carried over unchanged from an earlier run
+            'reused': {
+                'sheets': sum(1 for sheet in sheets if sheet["status"] == 'done' and sheet["sheet_reused"]),
+                'questions': sum(sheet["questions_reused"] for sheet in sheets if sheet["status"] == 'done'),
+            },
+            'eta_seconds': eta,
+            'sheets': [{'student_file': sheet["student_file"], 'status': sheet["status"], 'error': sheet["error"],
+                        'reused': bool(sheet["sheet_reused"])} for sheet in sheets],
+            'results': [summarize_sheet(sheet["student_file"], self._stored_results(sheet))
+                        for sheet in sheets if sheet["status"] == 'done'] if include_results else None,
+        }
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+def get_job_manager() -> GradingJobManager:
+    """Return the process-wide job manager; creating it resumes interrupted jobs (admin.py does so at start-up)."""
+    global _job_manager
+    if _job_manager is None:
+        with _job_manager_lock:
+            if _job_manager is None:
+                _job_manager = GradingJobManager()
+    return _job_manager
+
+def _reset_job_manager():
+    """Worker threads and SQLite connections do not survive fork."""
+    global _job_manager, _job_manager_lock
+    _job_manager = None
+    _job_manager_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_job_manager)
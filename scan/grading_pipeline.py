@@ -0,0 +1,354 @@
+import os
+import sys
+import time
+import queue
+import threading
+from typing import Callable, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scan.pdf_text_extractor import (route_pdf_pages, print_routing_report, check_poppler, iter_pdf_pages,
+                                     OCR_MAX_WORKERS)
+from scan.ocr_backends import get_ocr_backend
+from scan.tracing import span
+
+# Worker threads per stage and how many items may wait between stages. The
+# queue bound is what applies backpressure: rendering pauses while OCR is
+# behind, and OCR pauses while grading is behind.
+PIPELINE_RASTER_WORKERS = int(os.getenv("PIPELINE_RASTER_WORKERS", "2"))
+PIPELINE_OCR_WORKERS = int(os.getenv("PIPELINE_OCR_WORKERS", str(OCR_MAX_WORKERS)))
+PIPELINE_SEGMENT_WORKERS = int(os.getenv("PIPELINE_SEGMENT_WORKERS", "1"))
+PIPELINE_GRADE_WORKERS = int(os.getenv("PIPELINE_GRADE_WORKERS", "2"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+# Reported to on_sheet_failed for sheets skipped because the job was cancelled
+SHEET_CANCELLED = "cancelled"
+
+_DONE = object()
+
+class _Stage:
+    """Worker threads reading one bounded queue, with busy/blocked time accounting.
+
+    An exception from ``handler`` goes to ``on_error`` (item, exception) and the
+    worker moves on, so the stage always shuts down cleanly. With ``batch_size``
+    above 1 a worker takes whatever is queued, up to that many items, and
+    passes them to ``handler`` as one list.
+    """
+
+    def __init__(self, name: str, workers: int, handler: Callable, queue_size: int,
+                 sheet_of: Callable = lambda item: item,
+                 on_error: Optional[Callable[[object, Exception], None]] = None,
+                 batch_size: int = 1):
+        self.name = name
+        self.sheet_of = sheet_of
+        self.on_error = on_error
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.max_depth = 0
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._local = threading.local()
+
+    def start(self, on_exit: Callable[[], None]) -> None:
+        remaining = [self.workers]
+
+        def run():
+            done = False
+            while not done:
+                item = self.queue.get()
+                if item is _DONE:
+                    break
+                batch = [item]
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        # This worker's shutdown marker: finish the batch, then exit
+                        done = True
+                        break
+                    batch.append(item)
+                self._local.blocked = 0.0
+                start = time.perf_counter()
+                sheets = {os.path.basename(self.sheet_of(item).pdf_path) for item in batch}
+                # Traced so a sheet's time in each stage shows up in the trace log and /metrics
+                attributes = {"sheet": sheets.pop()} if len(sheets) == 1 else {"sheets": len(sheets)}
+                try:
+                    with span(f"pipeline_{self.name}", items=len(batch), **attributes):
+                        self.handler(batch if self.batch_size > 1 else batch[0])
+                except Exception as e:
+                    print(f"Error in pipeline {self.name} stage: {str(e)}")
+                    if self.on_error is not None:
+                        for item in batch:
+                            try:
+                                self.on_error(item, e)
+                            except Exception as error:
+                                print(f"Error in pipeline {self.name} stage: {str(error)}")
+                finally:
+                    elapsed = time.perf_counter() - start
+                    with self._lock:
+                        self.items += len(batch)
+                        self.busy += elapsed - self._local.blocked
+                        self.blocked += self._local.blocked
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                on_exit()
+
+        for number in range(self.workers):
+            thread = threading.Thread(target=run, name=f"pipeline-{self.name}-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, item) -> None:
+        """Enqueue work for this stage; time spent waiting for space counts against the caller."""
+        start = time.perf_counter()
+        self.queue.put(item)
+        waited = time.perf_counter() - start
+        caller = _current_stage.get()
+        if caller is not None:
+            caller._local.blocked = getattr(caller._local, "blocked", 0.0) + waited
+        with self._lock:
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def close(self) -> None:
+        for _ in range(self.workers):
+            self.queue.put(_DONE)
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def report(self, wall: float) -> Dict:
+        with self._lock:
+            capacity = self.workers * wall
+            return {
+                "workers": self.workers,
+                "items": self.items,
+                "busy_seconds": round(self.busy, 3),
+                "blocked_seconds": round(self.blocked, 3),
+                "utilization": self.busy / capacity if capacity else 0.0,
+                "max_queue_depth": self.max_depth,
+            }
+
+class _StageContext:
+    """Which stage the current thread works for (to charge backpressure waits to it)."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self) -> Optional[_Stage]:
+        return getattr(self._local, "stage", None)
+
+    def set(self, stage: _Stage) -> None:
+        self._local.stage = stage
+
+_current_stage = _StageContext()
+
+class _Sheet:
+    """One sheet's state as it moves through the stages."""
+
+    def __init__(self, pdf_path: str, output_file: str):
+        self.pdf_path = pdf_path
+        self.output_file = output_file
+        self.inputs = None
+        self.previous = None
+        self.pages = None
+        self.student_answers = None
+        self.ocr_remaining = 0
+        self.failed = False
+        self.lock = threading.Lock()
+
+class GradingPipeline:
+    """Grade a batch of sheets with rasterize -> OCR -> segment -> grade stages running at once.
+
+    - rasterize: checks for reusable earlier results, reads the embedded text
+      layer and renders only the pages that need OCR (Poppler, CPU bound);
+    - ocr: recognizes the rendered pages waiting in its queue, up to the
+      backend's batch size per call (Vision or PaddleOCR);
+    - segment: joins a sheet's page texts, splits the answers and pairs them
+      with the key;
+    - grade: grades a sheet's pending answers and writes its results.
+
+    Stages are connected by bounded queues, so a slow stage holds back the ones
+    before it instead of letting rendered pages pile up in memory. ``run``
+    returns per-stage utilization alongside the results.
+    """
+
+    def __init__(self, evaluator, answer_key_path: str,
+                 raster_workers: int = PIPELINE_RASTER_WORKERS, ocr_workers: int = PIPELINE_OCR_WORKERS,
+                 segment_workers: int = PIPELINE_SEGMENT_WORKERS, grade_workers: int = PIPELINE_GRADE_WORKERS,
+                 queue_size: int = PIPELINE_QUEUE_SIZE,
+                 on_sheet_started: Optional[Callable[[str], None]] = None,
+                 on_sheet_done: Optional[Callable[[str, List[Dict], Dict], None]] = None,
+                 on_sheet_failed: Optional[Callable[[str, str], None]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None):
+        self.evaluator = evaluator
+        self.answer_key_path = answer_key_path
+        self.backend = get_ocr_backend(evaluator.ocr_backend)
+        self.on_sheet_started = on_sheet_started
+        self.on_sheet_done = on_sheet_done
+        self.on_sheet_failed = on_sheet_failed
+        self.should_stop = should_stop
+        self.results: Dict[str, List[Dict]] = {}
+        self.summaries: Dict[str, Dict] = {}
+        self.errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.stages = [
+            _Stage("rasterize", raster_workers, self._rasterize, queue_size,
+                   on_error=lambda sheet, e: self._fail(sheet, str(e))),
+            _Stage("ocr", self.backend.worker_count(ocr_workers), self._ocr, queue_size,
+                   sheet_of=lambda task: task[0], on_error=lambda task, e: self._fail(task[0], str(e)),
+                   batch_size=self.backend.batch_size),
+            _Stage("segment", segment_workers, self._segment, queue_size,
+                   on_error=lambda sheet, e: self._fail(sheet, str(e))),
+            _Stage("grade", grade_workers, self._grade, queue_size,
+                   sheet_of=lambda task: task[0], on_error=lambda task, e: self._fail(task[0], str(e))),
+        ]
+        self.raster_stage, self.ocr_stage, self.segment_stage, self.grade_stage = self.stages
+
+    def _fail(self, sheet: _Sheet, error: str) -> None:
+        with sheet.lock:
+            if sheet.failed:
+                return
+            sheet.failed = True
+        if error != SHEET_CANCELLED:
+            print(f"Error grading {sheet.pdf_path}: {error}")
+        with self._lock:
+            self.errors[sheet.pdf_path] = error
+        if self.on_sheet_failed is not None:
+            self.on_sheet_failed(sheet.pdf_path, error)
+
+    def _rasterize(self, sheet: _Sheet) -> None:
+        _current_stage.set(self.raster_stage)
+        if self.should_stop is not None and self.should_stop():
+            self._fail(sheet, SHEET_CANCELLED)
+            return
+        try:
+            if self.on_sheet_started is not None:
+                self.on_sheet_started(sheet.pdf_path)
+            sheet.inputs, sheet.previous = self.evaluator.find_previous_results(
+                sheet.pdf_path, self.answer_key_path, sheet.output_file)
+            if sheet.previous is not None:
+                # Same sheet and OCR settings as an earlier run: skip straight to segmenting
+                sheet.student_answers = sheet.previous["student_answers"]
+                self.segment_stage.put(sheet)
+                return
+            sheet.pages = route_pdf_pages(sheet.pdf_path)
+            if sheet.pages is None:
+                self._fail(sheet, "could not read PDF")
+                return
+            ocr_pages = [page["page"] for page in sheet.pages if page["route"] == "ocr"]
+            if not ocr_pages:
+                self.segment_stage.put(sheet)
+                return
+            if not check_poppler():
+                self._fail(sheet, "Poppler not found")
+                return
+            sheet.ocr_remaining = len(ocr_pages)
+            for page_number, image in iter_pdf_pages(sheet.pdf_path, len(sheet.pages), page_numbers=ocr_pages):
+                if sheet.failed:
+                    image.close()
+                    continue
+                self.ocr_stage.put((sheet, page_number, image))
+        except Exception as e:
+            self._fail(sheet, str(e))
+
+    def _ocr(self, tasks) -> None:
+        _current_stage.set(self.ocr_stage)
+        if self.ocr_stage.batch_size == 1:
+            tasks = [tasks]
+        try:
+            live = [(sheet, page_number, image) for sheet, page_number, image in tasks if not sheet.failed]
+            if live:
+                start = time.perf_counter()
+                try:
+                    texts = self.backend.recognize([image for _, _, image in live])
+                except Exception as e:
+                    print(f"Error processing pages as a batch: {str(e)}")
+                    texts = None
+                if texts is None:
+                    # Page by page, so one bad page does not blank the others
+                    texts = []
+                    for _, page_number, image in live:
+                        try:
+                            texts.append(self.backend.recognize([image])[0])
+                        except Exception as e:
+                            print(f"Error processing page {page_number}: {str(e)}")
+                            texts.append("")
+                seconds = (time.perf_counter() - start) / len(live)
+                for (sheet, page_number, _), text in zip(live, texts):
+                    page = sheet.pages[page_number - 1]
+                    page["text"] = text
+                    page["seconds"] += seconds
+        finally:
+            for _, _, image in tasks:
+                image.close()
+        for sheet, _, _ in tasks:
+            with sheet.lock:
+                sheet.ocr_remaining -= 1
+                complete = sheet.ocr_remaining == 0 and not sheet.failed
+            if complete:
+                self.segment_stage.put(sheet)
+
+    def _segment(self, sheet: _Sheet) -> None:
+        _current_stage.set(self.segment_stage)
+        try:
+            if sheet.student_answers is None:
+                print_routing_report(sheet.pdf_path, sheet.pages)
+                sheet.student_answers = self.evaluator.answers_from_pages(sheet.pdf_path, sheet.pages)
+                sheet.pages = None
+            plan = self.evaluator.build_plan(sheet.inputs, sheet.previous, sheet.student_answers,
+                                             self.answer_key_path)
+            self.grade_stage.put((sheet, plan))
+        except Exception as e:
+            self._fail(sheet, str(e))
+
+    def _grade(self, task) -> None:
+        _current_stage.set(self.grade_stage)
+        sheet, plan = task
+        try:
+            pending = self.evaluator.pending_items(plan)
+            grades = self.evaluator.grade_items(pending, self.answer_key_path) if pending else []
+            results = self.evaluator.finish_plan(plan, grades, sheet.output_file)
+            summary = self.evaluator.reuse_summary(plan)
+        except Exception as e:
+            self._fail(sheet, str(e))
+            return
+        with self._lock:
+            self.results[sheet.pdf_path] = results
+            self.summaries[sheet.pdf_path] = summary
+        if self.on_sheet_done is not None:
+            self.on_sheet_done(sheet.pdf_path, results, summary)
+
+    def run(self, sheets: List[Dict[str, str]]) -> Dict:
+        """Grade ``sheets`` (dicts with "pdf_path" and "output_file") and report per-stage utilization.
+
+        Returns {"results": {pdf_path: results}, "reuse": {pdf_path: summary},
+        "errors": {pdf_path: message}, "stages": {...}, "seconds": wall time}.
+        """
+        start = time.perf_counter()
+        # Each stage shuts down once every worker of the stage feeding it has exited
+        for stage, downstream in zip(self.stages, self.stages[1:]):
+            stage.start(downstream.close)
+        self.grade_stage.start(lambda: None)
+        for sheet in sheets:
+            self.raster_stage.put(_Sheet(sheet["pdf_path"], sheet["output_file"]))
+        self.raster_stage.close()
+        for stage in self.stages:
+            stage.join()
+        wall = time.perf_counter() - start
+
+        stages = {stage.name: stage.report(wall) for stage in self.stages}
+        print(f"Pipeline graded {len(self.results)}/{len(sheets)} sheets in {wall:.1f}s")
+        for name, report in stages.items():
+            print(f"  {name:<9} {report['workers']} workers, {report['items']} items, "
+                  f"{report['utilization']:.0%} busy, {report['blocked_seconds']:.1f}s blocked by next stage, "
+                  f"max queue {report['max_queue_depth']}")
+        return {"results": self.results, "reuse": self.summaries, "errors": self.errors,
+                "stages": stages, "seconds": wall}
@@ -0,0 +1,351 @@
+import os
+import time
+import zlib
+import threading
+from typing import Dict, Optional, Sequence, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from scan.tracing import span
+
+# Ollama generate endpoint and client limits
+OLLAMA_ENDPOINT = os.getenv("OLLAMA_ENDPOINT", "http://localhost:11434/api/generate")
+# Comma-separated generate endpoints to balance grading across (defaults to OLLAMA_ENDPOINT)
+OLLAMA_ENDPOINTS = [endpoint.strip() for endpoint in os.getenv("OLLAMA_ENDPOINTS", OLLAMA_ENDPOINT).split(",")
+                    if endpoint.strip()]
+# Requests allowed in flight at once per endpoint, across every sheet in the process
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+# Circuit breaker: open after this many consecutive failures (a call slower than
+# LLM_SLOW_CALL_SECONDS counts as one), then probe the server every
+# LLM_PROBE_INTERVAL seconds until it answers again
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_SLOW_CALL_SECONDS = float(os.getenv("LLM_SLOW_CALL_SECONDS", "90"))
+LLM_PROBE_INTERVAL = float(os.getenv("LLM_PROBE_INTERVAL", "10"))
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling the model while the endpoint's circuit is open."""
+
+class CircuitBreaker:
+    """Failure and latency tracker that stops calls to an unhealthy endpoint.
+
+    closed: calls go through. open: calls fail fast with CircuitOpenError while
+    a background thread probes the server. half_open: the probe succeeded and
+    one trial call at a time is let through; its success closes the circuit,
+    its failure opens it again.
+    """
+
+    def __init__(self, name: str, probe, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 slow_call_seconds: float = LLM_SLOW_CALL_SECONDS,
+                 probe_interval: float = LLM_PROBE_INTERVAL):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = max(1, failure_threshold)
+        self.slow_call_seconds = slow_call_seconds
+        self.probe_interval = probe_interval
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened_at = None
+        self.last_error = None
+        self.latency_avg = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go ahead now."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"Circuit open for {self.name}: {self.last_error}")
+
+    def record_success(self, seconds: float) -> None:
+        if seconds > self.slow_call_seconds:
+            self.record_failure(f"slow response ({seconds:.1f}s)")
+            return
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            # Exponentially weighted average latency of successful calls
+            self.latency_avg = seconds if self.latency_avg is None else 0.8 * self.latency_avg + 0.2 * seconds
+            self._trial_in_flight = False
+            if self.state != "closed":
+                self.state = "closed"
+                self.opened_at = None
+                print(f"LLM circuit for {self.name} closed")
+
+    def record_failure(self, error: str) -> None:
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+            self._trial_in_flight = False
+            trip = self.state == "half_open" or (
+                self.state == "closed" and self.consecutive_failures >= self.failure_threshold)
+            if trip:
+                self.state = "open"
+                self.opened_at = time.time()
+        if trip:
+            print(f"LLM circuit for {self.name} opened after {self.consecutive_failures} failures: {error}")
+            threading.Thread(target=self._probe_until_healthy, name=f"llm-probe-{self.name}",
+                             daemon=True).start()
+
+    def _probe_until_healthy(self) -> None:
+        while True:
+            time.sleep(self.probe_interval)
+            with self._lock:
+                if self.state != "open":
+                    return
+            try:
+                healthy = self.probe()
+            except Exception:
+                healthy = False
+            if healthy:
+                with self._lock:
+                    if self.state == "open":
+                        self.state = "half_open"
+                print(f"LLM endpoint {self.name} answered a health probe; trying it again")
+                return
+
+    def status(self) -> Dict:
+        """Snapshot of the breaker for logs and health endpoints."""
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "successes": self.successes,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "open_for_seconds": time.time() - self.opened_at if self.opened_at else 0.0,
+                "avg_latency_seconds": self.latency_avg,
+                "last_error": self.last_error,
+            }
+
+class OllamaClient:
+    """Keep-alive HTTP client for an Ollama endpoint with bounded in-flight requests."""
+
+    def __init__(self, endpoint: str = OLLAMA_ENDPOINT, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 timeout: Tuple[float, float] = (LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT)):
+        self.endpoint = endpoint
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.session = requests.Session()
+        # One pooled connection per in-flight slot so connections are reused, not reopened
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        parts = urlsplit(endpoint)
+        # Ollama lists installed models here; it answers quickly once the server is up
+        self.health_url = f"{parts.scheme}://{parts.netloc}/api/tags"
+        self.breaker = CircuitBreaker(parts.netloc or endpoint, self.probe)
+
+    def available(self) -> bool:
+        """False while the circuit is open and calls would fail fast."""
+        return self.breaker.state != "open"
+
+    def probe(self) -> bool:
+        """True if the server answers its health URL."""
+        response = self.session.get(self.health_url, timeout=(self.timeout[0], self.timeout[0]))
+        return response.ok
+
+    def generate(self, model: str, prompt: str, affinity: Optional[str] = None, **options) -> Dict:
+        """Call /api/generate without streaming and return the decoded JSON body.
+
+        ``affinity`` only matters for OllamaPool and is ignored here.
+
+        Blocks while ``max_concurrency`` requests are already in flight. Raises
+        requests exceptions on connection errors, timeouts and HTTP errors, and
+        CircuitOpenError straight away while the endpoint is considered down.
+        """
+        payload = {"model": model, "prompt": prompt, "stream": False}
+        payload.update(options)
+        with self._slots:
+            self.breaker.before_call()
+            start = time.perf_counter()
+            try:
+                with span("llm", endpoint=self.breaker.name, model=model):
+                    response = self.session.post(self.endpoint, json=payload, timeout=self.timeout)
+                    response.raise_for_status()
+                    body = response.json()
+            except Exception as e:
+                self.breaker.record_failure(str(e))
+                raise
+        self.breaker.record_success(time.perf_counter() - start)
+        return body
+
+    def health(self) -> Dict:
+        """Endpoint and circuit breaker state, for operators."""
+        return {"endpoint": self.endpoint, "max_concurrency": self.max_concurrency, **self.breaker.status()}
+
+    def close(self) -> None:
+        self.session.close()
+
+class OllamaPool:
+    """Spread generate calls over several Ollama endpoints.
+
+    Each call goes to the healthy endpoint with the fewest requests in flight
+    that is below its own ``max_concurrency``; callers wait when every
+    endpoint is full. Endpoints whose circuit is open are ejected until their
+    health probe succeeds. A call that cannot reach its endpoint is retried
+    on another one.
+    """
+
+    def __init__(self, clients: Sequence[OllamaClient]):
+        if not clients:
+            raise ValueError("OllamaPool needs at least one endpoint")
+        self.clients = list(clients)
+        self.endpoint = ",".join(client.endpoint for client in self.clients)
+        self.max_concurrency = sum(client.max_concurrency for client in self.clients)
+        self._outstanding = {client.endpoint: 0 for client in self.clients}
+        self._dispatched = {client.endpoint: 0 for client in self.clients}
+        self._retried = {client.endpoint: 0 for client in self.clients}
+        self._ready = threading.Condition()
+
+    def available(self) -> bool:
+        return any(client.available() for client in self.clients)
+
+    def _acquire(self, exclude, preferred: Optional[str] = None) -> Optional[OllamaClient]:
+        """Reserve a slot on the preferred or least-loaded healthy endpoint; None if none is healthy."""
+        with self._ready:
+            while True:
+                healthy = [client for client in self.clients
+                           if client.endpoint not in exclude and client.available()]
+                if not healthy:
+                    return None
+                free = [client for client in healthy
+                        if self._outstanding[client.endpoint] < client.max_concurrency]
+                if free:
+                    preferred_free = [client for client in free if client.endpoint == preferred]
+                    client = preferred_free[0] if preferred_free else min(
+                        free, key=lambda c: self._outstanding[c.endpoint] / c.max_concurrency)
+                    self._outstanding[client.endpoint] += 1
+                    self._dispatched[client.endpoint] += 1
+                    return client
+                # Re-check health periodically in case the busy endpoints were ejected meanwhile
+                self._ready.wait(timeout=1.0)
+
+    def _release(self, client: OllamaClient) -> None:
+        with self._ready:
+            self._outstanding[client.endpoint] -= 1
+            self._ready.notify()
+
+    def generate(self, model: str, prompt: str, affinity: Optional[str] = None, **options) -> Dict:
+        """Same contract as OllamaClient.generate, on the least-loaded healthy endpoint.
+
+        Requests with the same ``affinity`` (e.g. a shared prompt prefix) go to
+        the same endpoint whenever it is healthy and has a free slot, so that
+        server can reuse its prompt cache. Raises CircuitOpenError when every
+        endpoint's circuit is open.
+        """
+        preferred = None
+        if affinity is not None:
+            preferred = self.clients[zlib.crc32(affinity.encode('utf-8')) % len(self.clients)].endpoint
+        tried = set()
+        last_error = None
+        while True:
+            client = self._acquire(tried, preferred)
+            if client is None:
+                if last_error is not None:
+                    raise last_error
+                raise CircuitOpenError(f"No healthy LLM endpoint among {self.endpoint}")
+            try:
+                return client.generate(model, prompt, **options)
+            except (requests.ConnectionError, CircuitOpenError) as e:
+                # Nothing reached the model, so another endpoint can safely take the request
+                tried.add(client.endpoint)
+                last_error = e
+                with self._ready:
+                    self._retried[client.endpoint] += 1
+            finally:
+                self._release(client)
+
+    def health(self) -> Dict:
+        """Per-endpoint load, dispatch counts and circuit breaker state."""
+        with self._ready:
+            load = {endpoint: (self._outstanding[endpoint], self._dispatched[endpoint], self._retried[endpoint])
+                    for endpoint in self._outstanding}
+        endpoints = {}
+        for client in self.clients:
+            outstanding, dispatched, retried = load[client.endpoint]
+            endpoints[client.endpoint] = {**client.health(), "outstanding": outstanding,
+                                          "dispatched": dispatched, "retried_elsewhere": retried}
+        return {"endpoint": self.endpoint, "max_concurrency": self.max_concurrency,
+                "state": "closed" if all(client.available() for client in self.clients) else
+                         ("degraded" if self.available() else "open"),
+                "endpoints": endpoints}
+
+    def close(self) -> None:
+        for client in self.clients:
+            client.close()
+
+_clients: Dict[str, OllamaClient] = {}
+_clients_lock = threading.Lock()
+
+def get_ollama_client(endpoint: Optional[str] = None) -> OllamaClient:
+    """Return the process-wide client for ``endpoint`` so every grader shares its pool."""
+    endpoint = endpoint or OLLAMA_ENDPOINT
+    with _clients_lock:
+        if endpoint not in _clients:
+            _clients[endpoint] = OllamaClient(endpoint)
+        return _clients[endpoint]
+
+_pools: Dict[Tuple[str, ...], OllamaPool] = {}
+
+def get_llm_client(endpoints: Union[None, str, Sequence[str]] = None) -> Union[OllamaClient, OllamaPool]:
+    """Return the shared client for one endpoint, or a shared pool for several.
+
+    ``endpoints`` is a URL, a comma-separated string or a list of URLs; it
+    defaults to OLLAMA_ENDPOINTS. Pool members are the per-endpoint clients
+    from get_ollama_client, so their limits and breakers are shared too.
+    """
+    if endpoints is None:
+        endpoints = OLLAMA_ENDPOINTS
+    elif isinstance(endpoints, str):
+        endpoints = [endpoint.strip() for endpoint in endpoints.split(",") if endpoint.strip()]
+    endpoints = tuple(dict.fromkeys(endpoints)) or (OLLAMA_ENDPOINT,)
+    if len(endpoints) == 1:
+        return get_ollama_client(endpoints[0])
+    clients = [get_ollama_client(endpoint) for endpoint in endpoints]
+    with _clients_lock:
+        if endpoints not in _pools:
+            _pools[endpoints] = OllamaPool(clients)
+        return _pools[endpoints]
+
+def llm_health() -> Dict[str, Dict]:
+    """Health of every Ollama endpoint used in this process.
+
+    Endpoints that belong to a pool also report the pool's per-endpoint
+    ``outstanding``, ``dispatched`` and ``retried_elsewhere`` counts (summed
+    when an endpoint is shared by several pools).
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+        pools = list(_pools.values())
+    # Pool members are also in _clients, so every pooled endpoint already has an entry
+    health = {client.endpoint: client.health() for client in clients}
+    for pool in pools:
+        for endpoint, status in pool.health()["endpoints"].items():
+            entry = health[endpoint]
+            for name in ("outstanding", "dispatched", "retried_elsewhere"):
+                entry[name] = entry.get(name, 0) + status[name]
+    return health
+
+def _reset_clients():
+    """Forked children must not reuse the parent's pooled sockets."""
+    global _clients_lock
+    _clients.clear()
+    _pools.clear()
+    _clients_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clients)
@@ -0,0 +1,124 @@
+import os
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+# Bundled model files for offline use. Put PaddleOCR inference models in
+# det/, rec/, cls/ and (optionally) rec_handwritten/ under this directory;
+# missing sub-directories fall back to PaddleOCR's own download.
+PADDLE_MODEL_DIR = os.getenv(
+    "PADDLE_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "paddleocr"))
+
+class _ModelSpec:
+    def __init__(self, loader: Callable, fork_safe: bool, warm_up: Optional[Callable]):
+        self.loader = loader
+        self.fork_safe = fork_safe
+        self.warm_up = warm_up
+
+_specs: Dict[str, _ModelSpec] = {}
+_models: Dict[str, object] = {}
+_lock = threading.RLock()
+
+def register_model(name: str, loader: Callable, fork_safe: bool = False,
+                   warm_up: Optional[Callable] = None) -> None:
+    """Register how to build a model; nothing is loaded until get_model or warm_up.
+
+    ``fork_safe`` models survive fork and are shared copy-on-write with child
+    processes. Anything holding native threads or handles (Paddle predictors,
+    gRPC channels) must stay False and is rebuilt once in each child.
+    """
+    with _lock:
+        _specs[name] = _ModelSpec(loader, fork_safe, warm_up)
+
+def get_model(name: str):
+    """Return the process-wide instance of a registered model, loading it on first use."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _lock:
+        if name not in _models:
+            if name not in _specs:
+                raise KeyError(f"Model '{name}' is not registered")
+            print(f"Loading model {name} (pid {os.getpid()})...")
+            _models[name] = _specs[name].loader()
+        return _models[name]
+
+def warm_up(names: Optional[Iterable[str]] = None) -> None:
+    """Load models now (all registered ones by default) and run their warm-up step.
+
+    Call this at worker start-up, or in the parent before forking for fork-safe
+    models, so the first request does not pay the load cost.
+    """
+    with _lock:
+        names = list(names) if names is not None else list(_specs)
+    for name in names:
+        model = get_model(name)
+        spec = _specs[name]
+        if spec.warm_up is not None:
+            try:
+                spec.warm_up(model)
+            except Exception as e:
+                print(f"Error warming up model {name}: {str(e)}")
+
+def loaded_models() -> Dict[str, bool]:
+    """Map each registered model name to whether it is loaded in this process."""
+    with _lock:
+        return {name: name in _models for name in _specs}
+
+def _drop_fork_unsafe_models():
+    """Forget models that cannot be used across fork; children reload them lazily."""
+    global _lock
+    _lock = threading.RLock()
+    for name in list(_models):
+        spec = _specs.get(name)
+        if spec is None or not spec.fork_safe:
+            del _models[name]
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_drop_fork_unsafe_models)
+
+def _bundled_dir(name: str) -> Optional[str]:
+    path = os.path.join(PADDLE_MODEL_DIR, name)
+    return path if os.path.isdir(path) else None
+
+def _load_paddle_ocr(use_angle_cls: bool, cpu_threads: int, rec_batch_num: int, handwritten: bool):
+    from paddleocr import PaddleOCR
+    rec_model_dir = _bundled_dir("rec_handwritten") if handwritten else None
+    if handwritten and rec_model_dir is None:
+        print(f"Handwriting model not found in {PADDLE_MODEL_DIR}; using the default recognizer")
+    return PaddleOCR(
+        use_angle_cls=use_angle_cls,
+        lang="en",
+        use_gpu=False,
+        cpu_threads=cpu_threads,
+        rec_batch_num=rec_batch_num,
+        det_model_dir=_bundled_dir("det"),
+        rec_model_dir=rec_model_dir or _bundled_dir("rec"),
+        cls_model_dir=_bundled_dir("cls"),
+        show_log=False,
+    )
+
+def _warm_up_paddle_ocr(ocr):
+    import numpy as np
+    # A blank strip is enough to initialize every predictor
+    ocr.ocr(np.full((48, 320, 3), 255, dtype=np.uint8), cls=False)
+
+def paddle_ocr_model_name(use_angle_cls: bool = True, cpu_threads: int = os.cpu_count() or 4,
+                          rec_batch_num: int = 6, handwritten: bool = False) -> str:
+    """Register (if needed) and return the registry name for a PaddleOCR configuration."""
+    name = (f"paddleocr:angle_cls={use_angle_cls}:threads={cpu_threads}:"
+            f"rec_batch={rec_batch_num}:handwritten={handwritten}")
+    with _lock:
+        if name not in _specs:
+            register_model(
+                name,
+                lambda: _load_paddle_ocr(use_angle_cls, cpu_threads, rec_batch_num, handwritten),
+                fork_safe=False,
+                warm_up=_warm_up_paddle_ocr,
+            )
+    return name
+
+def get_paddle_ocr(use_angle_cls: bool = True, cpu_threads: int = os.cpu_count() or 4,
+                   rec_batch_num: int = 6, handwritten: bool = False):
+    """Return the shared PaddleOCR instance for this configuration."""
+    return get_model(paddle_ocr_model_name(use_angle_cls, cpu_threads, rec_batch_num, handwritten))
@@ -0,0 +1,268 @@
+import os
+import io
+import sys
+import threading
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scan.ocr_cache import get_ocr_cache
+from scan import model_registry
+from scan.model_registry import get_paddle_ocr, paddle_ocr_model_name
+from scan.tracing import span, count
+
+# Which OCR engine process_pdf and EnhancedEvaluator use unless told otherwise
+OCR_BACKEND = os.getenv("OCR_BACKEND", "vision")
+
+# PaddleOCR batching and CPU settings
+PADDLE_BATCH_SIZE = int(os.getenv("PADDLE_BATCH_SIZE", "4"))
+PADDLE_REC_BATCH_NUM = int(os.getenv("PADDLE_REC_BATCH_NUM", "32"))
+PADDLE_CPU_THREADS = int(os.getenv("PADDLE_CPU_THREADS", str(os.cpu_count() or 4)))
+
+# Send Vision requests to this endpoint over REST, without credentials, instead of to
+# Google (e.g. an emulator, or the fake server in benchmarks/fake_services.py)
+VISION_API_ENDPOINT = os.getenv("VISION_API_ENDPOINT", "")
+
+_vision_client = None
+_vision_client_lock = threading.Lock()
+
+def get_vision_client():
+    """Return the process-wide Vision client, creating it on first use.
+
+    The client owns a gRPC channel that is thread-safe, so every page and every
+    sheet processed by this process shares the same connection and auth session.
+    """
+    global _vision_client
+    if _vision_client is None:
+        with _vision_client_lock:
+            if _vision_client is None:
+                from google.cloud import vision
+                if VISION_API_ENDPOINT:
+                    from google.auth.credentials import AnonymousCredentials
+                    _vision_client = vision.ImageAnnotatorClient(
+                        credentials=AnonymousCredentials(), transport="rest",
+                        client_options={"api_endpoint": VISION_API_ENDPOINT})
+                else:
+                    _vision_client = vision.ImageAnnotatorClient()
+    return _vision_client
+
+def _reset_vision_client():
+    """Drop the inherited client in a forked child; gRPC channels do not survive fork."""
+    global _vision_client, _vision_client_lock
+    _vision_client = None
+    _vision_client_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_vision_client)
+
+def image_to_png_bytes(image: Image.Image) -> bytes:
+    """Encode a PIL image as PNG; this is also what OCR cache keys are built from."""
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='PNG')
+    return img_byte_arr.getvalue()
+
+class OCRBackend:
+    """Common interface for OCR engines.
+
+    Subclasses implement ``_recognize_batch``; ``recognize`` adds OCR cache
+    lookups around it so every backend gets caching for free. Each page is
+    PNG-encoded once, for its cache key, and the encoded bytes are handed to
+    ``_recognize_batch`` for backends that upload them.
+    """
+
+    name = "base"
+    # Pages handed to one _recognize_batch call
+    batch_size = 1
+    # Upper bound on concurrent recognize() calls (None = no limit)
+    max_concurrency: Optional[int] = None
+
+    def settings(self) -> str:
+        """Identify the backend and its feature settings for OCR cache keys."""
+        return self.name
+
+    def worker_count(self, requested: int) -> int:
+        """Clamp a requested worker count to what this backend can run in parallel."""
+        if self.max_concurrency is None:
+            return max(1, requested)
+        return max(1, min(requested, self.max_concurrency))
+
+    def warm_up(self) -> None:
+        """Load clients/models now so the first page does not pay for it."""
+
+    def recognize(self, images: List[Image.Image]) -> List[str]:
+        """Return the text of each image, in order."""
+        cache = get_ocr_cache()
+        settings = self.settings()
+        texts: List[Optional[str]] = []
+        keys = []
+        encoded = []
+        missing = []
+        for image in images:
+            png_bytes = image_to_png_bytes(image)
+            key = cache.make_key(png_bytes, settings)
+            text = cache.get(key)
+            keys.append(key)
+            encoded.append(png_bytes)
+            texts.append(text)
+            if text is None:
+                missing.append(len(texts) - 1)
+        count("ocr_cache_lookups_total", len(images) - len(missing), result="hit")
+        count("ocr_cache_lookups_total", len(missing), result="miss")
+        if missing:
+            with span("ocr", backend=self.name, pages=len(missing)):
+                recognized = self._recognize_batch([images[i] for i in missing], [encoded[i] for i in missing])
+            for i, text in zip(missing, recognized):
+                texts[i] = text
+                cache.put(keys[i], text)
+        return texts
+
+    def recognize_image(self, image: Image.Image) -> str:
+        """Return the text of a single image."""
+        return self.recognize([image])[0]
+
+    def _recognize_batch(self, images: List[Image.Image], png_bytes: List[bytes]) -> List[str]:
+        """Text of each image; ``png_bytes`` holds the same images already PNG-encoded."""
+        raise NotImplementedError
+
+class VisionBackend(OCRBackend):
+    """Google Cloud Vision document text detection over the shared client."""
+
+    name = "vision"
+
+    def settings(self) -> str:
+        return "google-vision:document_text_detection"
+
+    def warm_up(self) -> None:
+        get_vision_client()
+
+    def _recognize_batch(self, images: List[Image.Image], png_bytes: List[bytes]) -> List[str]:
+        from google.cloud import vision
+        client = get_vision_client()
+        texts = []
+        for content in png_bytes:
+            # Create Vision API image object (from the bytes the cache key was built from)
+            vision_image = vision.Image(content=content)
+
+            # Perform text detection
+            response = client.document_text_detection(image=vision_image)
+
+            if response.error.message:
+                raise Exception(
+                    '{}\nFor more info on error messages, check: '
+                    'https://cloud.google.com/apis/design/errors'.format(
+                        response.error.message))
+
+            texts.append(response.full_text_annotation.text)
+        return texts
+
+class PaddleOCRBackend(OCRBackend):
+    """Offline PaddleOCR on CPU with batched text recognition.
+
+    Text regions are detected page by page, then the crops of every page in the
+    batch go through the recognizer together so it runs full
+    ``rec_batch_num``-sized batches. The Paddle predictor is not thread-safe,
+    so calls are serialized and throughput is scaled with ``cpu_threads``.
+    """
+
+    name = "paddle"
+    max_concurrency = 1
+
+    def __init__(self, batch_size: int = PADDLE_BATCH_SIZE, rec_batch_num: int = PADDLE_REC_BATCH_NUM,
+                 cpu_threads: int = PADDLE_CPU_THREADS, use_angle_cls: bool = True):
+        self.batch_size = max(1, batch_size)
+        self.rec_batch_num = rec_batch_num
+        self.cpu_threads = cpu_threads
+        self.use_angle_cls = use_angle_cls
+        self._lock = threading.Lock()
+
+    def settings(self) -> str:
+        return f"paddleocr:en:angle_cls={self.use_angle_cls}"
+
+    def model_name(self) -> str:
+        """Registry name of the PaddleOCR model this backend uses (for model_registry.warm_up)."""
+        return paddle_ocr_model_name(self.use_angle_cls, self.cpu_threads, self.rec_batch_num)
+
+    def warm_up(self) -> None:
+        model_registry.warm_up([self.model_name()])
+
+    def _get_ocr(self):
+        # Loaded once per process by the model registry, shared by every sheet
+        return get_paddle_ocr(self.use_angle_cls, self.cpu_threads, self.rec_batch_num)
+
+    def _recognize_batch(self, images: List[Image.Image], png_bytes: List[bytes]) -> List[str]:
+        import numpy as np
+        # PaddleOCR expects BGR arrays like cv2.imread returns
+        arrays = [np.array(image.convert('RGB'))[:, :, ::-1].copy() for image in images]
+        with self._lock:
+            ocr = self._get_ocr()
+            try:
+                return self._recognize_crops_batched(ocr, arrays)
+            except (ImportError, AttributeError):
+                # Older/newer PaddleOCR layouts: fall back to one call per page
+                return [self._lines_to_text(ocr.ocr(array, cls=self.use_angle_cls)) for array in arrays]
+
+    def _recognize_crops_batched(self, ocr, arrays) -> List[str]:
+        from paddleocr.tools.infer.predict_system import sorted_boxes
+        from paddleocr.tools.infer.utility import get_rotate_crop_image
+
+        crops = []
+        owners = []
+        for page_index, array in enumerate(arrays):
+            dt_boxes, _ = ocr.text_detector(array)
+            if dt_boxes is None:
+                continue
+            for box in sorted_boxes(dt_boxes):
+                crops.append(get_rotate_crop_image(array, box.copy().astype('float32')))
+                owners.append(page_index)
+
+        lines: List[List[str]] = [[] for _ in arrays]
+        if not crops:
+            return ["" for _ in arrays]
+        if self.use_angle_cls and getattr(ocr, "text_classifier", None) is not None:
+            crops, _, _ = ocr.text_classifier(crops)
+        rec_results, _ = ocr.text_recognizer(crops)
+        for page_index, (text, score) in zip(owners, rec_results):
+            if text and score >= ocr.drop_score:
+                lines[page_index].append(text)
+        return ['\n'.join(page_lines) for page_lines in lines]
+
+    @staticmethod
+    def _lines_to_text(result) -> str:
+        extracted = []
+        if result and result[0]:
+            for line in result[0]:
+                if line[1][0]:  # Check if text was detected
+                    extracted.append(line[1][0])
+        return '\n'.join(extracted)
+
+OCR_BACKENDS = {
+    "vision": VisionBackend,
+    "paddle": PaddleOCRBackend,
+}
+
+_backends: Dict[str, OCRBackend] = {}
+_backends_lock = threading.Lock()
+
+def get_ocr_backend(backend=None) -> OCRBackend:
+    """Resolve a backend name (or instance) to a shared OCRBackend instance.
+
+    ``None`` selects OCR_BACKEND. Instances are created once per process so the
+    Vision channel and Paddle model are reused across sheets.
+    """
+    if isinstance(backend, OCRBackend):
+        return backend
+    name = (backend or OCR_BACKEND).lower()
+    if name not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend '{name}'. Choose one of: {', '.join(OCR_BACKENDS)}")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = OCR_BACKENDS[name]()
+        return _backends[name]
+
+def warm_up_ocr_backend(backend=None) -> None:
+    """Load the configured backend's client or model in this process."""
+    try:
+        get_ocr_backend(backend).warm_up()
+    except Exception as e:
+        print(f"Error warming up OCR backend: {str(e)}")
@@ -0,0 +1,157 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Where cached OCR text lives and how much of it we keep
+OCR_CACHE_DIR = os.getenv(
+    "OCR_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "ocr"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Set OCR_CACHE_BYPASS=1 to always call the OCR backend (reads and writes are skipped)
+OCR_CACHE_BYPASS = os.getenv("OCR_CACHE_BYPASS", "0") == "1"
+
+class OCRCache:
+    """Content-addressed on-disk cache of OCR results.
+
+    Entries are keyed by a SHA-256 of the page image bytes plus the OCR backend
+    settings, stored one file per page and evicted least-recently-used once the
+    directory grows past ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: str = OCR_CACHE_DIR, max_bytes: int = OCR_CACHE_MAX_BYTES,
+                 bypass: bool = OCR_CACHE_BYPASS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> size in bytes, oldest first
+        self._total_bytes = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU order from file modification times."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.txt'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.txt")
+
+    @staticmethod
+    def make_key(image_bytes: bytes, settings: str) -> str:
+        """Build a cache key from the encoded page image and the OCR settings."""
+        digest = hashlib.sha256()
+        digest.update(settings.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return cached text for ``key`` or None on a miss."""
+        if self.bypass:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+                if key in self._index:
+                    self._total_bytes -= self._index.pop(key)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            if key in self._index:
+                self._index.move_to_end(key)
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        """Store OCR text for ``key`` and evict old entries if over budget."""
+        if self.bypass:
+            return
+        data = text.encode('utf-8')
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing OCR cache entry: {str(e)}")
+            return
+        with self._lock:
+            if key in self._index:
+                self._total_bytes -= self._index.pop(key)
+            self._index[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        """Remove every cached entry."""
+        with self._lock:
+            for key in list(self._index):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._index.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "bypass": self.bypass,
+            }
+
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
+
+def get_ocr_cache() -> OCRCache:
+    """Return the process-wide OCR cache."""
+    global _ocr_cache
+    if _ocr_cache is None:
+        with _ocr_cache_lock:
+            if _ocr_cache is None:
+                _ocr_cache = OCRCache()
+    return _ocr_cache
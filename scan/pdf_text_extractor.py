@@ -2,16 +2,39 @@ import os
 # Set Google Cloud Vision API credentials automatically
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.join(os.path.dirname(__file__), "enhanced-oasis-461811-s7-669a06266020.json")
 
-from google.cloud import vision
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
-import io
 import sys
 import json
+import string
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import PyPDF2
 
-# Configure Poppler path - Update this path to where you extracted Poppler
-POPPLER_PATH = r"C:\Program Files\poppler-24.08.0\Library\bin"
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scan.ocr_cache import get_ocr_cache
+from scan.ocr_backends import get_ocr_backend
+from scan.tracing import span, count, propagate
+
+# Configure Poppler path - Update this path to where you extracted Poppler (or set POPPLER_PATH)
+POPPLER_PATH = os.getenv("POPPLER_PATH", r"C:\Program Files\poppler-24.08.0\Library\bin")
+
+# Number of OCR calls in flight at the same time (1 = strictly sequential);
+# backends that cannot run concurrently (PaddleOCR) clamp this further
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", "4"))
+
+# Pages rasterized per Poppler call; peak memory is roughly
+# (RASTER_WINDOW + OCR_MAX_WORKERS) page images regardless of document length
+RASTER_WINDOW = int(os.getenv("RASTER_WINDOW", "2"))
+
+# A page's embedded text layer is trusted (and OCR skipped) when it has at
+# least this many non-space characters and this fraction of sane glyphs
+EMBEDDED_TEXT_MIN_CHARS = int(os.getenv("EMBEDDED_TEXT_MIN_CHARS", "40"))
+EMBEDDED_TEXT_MIN_QUALITY = float(os.getenv("EMBEDDED_TEXT_MIN_QUALITY", "0.9"))
+
+class TextExtractionError(Exception):
+    """A sheet yielded no text: unreadable PDF, Poppler missing, or OCR/text layer empty on every page."""
 
 def verify_credentials():
     """Verify that the Google Cloud credentials are properly set up."""
@@ -32,35 +55,152 @@ def verify_credentials():
         print(f"Error setting up credentials: {str(e)}")
         return False
 
-def extract_text_from_image(image):
-    """Extract text from an image using Google Cloud Vision API."""
+def extract_text_from_image(image, backend="vision"):
+    """Extract text from an image using the given OCR backend (Google Cloud Vision by default)."""
     try:
-        client = vision.ImageAnnotatorClient()
-        
-        # Convert PIL Image to bytes
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-        
-        # Create Vision API image object
-        vision_image = vision.Image(content=img_byte_arr)
-        
-        # Perform text detection
-        response = client.document_text_detection(image=vision_image)
-        
-        if response.error.message:
-            raise Exception(
-                '{}\nFor more info on error messages, check: '
-                'https://cloud.google.com/apis/design/errors'.format(
-                    response.error.message))
-        
-        return response.full_text_annotation.text
+        return get_ocr_backend(backend).recognize_image(image)
     except Exception as e:
         print(f"Error in text extraction: {str(e)}")
         return ""
 
-def process_pdf(pdf_path, output_file):
-    """Process PDF and extract text from each page."""
+def get_pdf_page_count(pdf_path, poppler_path=POPPLER_PATH):
+    """Return the number of pages in a PDF without rasterizing it."""
+    return int(pdfinfo_from_path(pdf_path, poppler_path=poppler_path)["Pages"])
+
+def _page_windows(page_numbers, window):
+    """Group sorted page numbers into contiguous (first, last) runs of at most ``window`` pages."""
+    run_start = run_end = None
+    for page_number in sorted(page_numbers):
+        if run_start is not None and page_number == run_end + 1 and page_number - run_start < window:
+            run_end = page_number
+            continue
+        if run_start is not None:
+            yield run_start, run_end
+        run_start = run_end = page_number
+    if run_start is not None:
+        yield run_start, run_end
+
+def iter_pdf_pages(pdf_path, page_count=None, window=RASTER_WINDOW, poppler_path=POPPLER_PATH,
+                   page_numbers=None):
+    """Yield (page_number, image) pairs, rendering ``window`` pages per Poppler call.
+
+    Only the current window is held by the generator, so callers that drop each
+    image after use keep memory bounded no matter how long the document is.
+    Pass ``page_numbers`` to render only a subset of pages.
+    """
+    if page_numbers is None:
+        if page_count is None:
+            page_count = get_pdf_page_count(pdf_path, poppler_path)
+        page_numbers = range(1, page_count + 1)
+    for first_page, last_page in _page_windows(page_numbers, max(1, window)):
+        with span("rasterize", sheet=os.path.basename(pdf_path), pages=last_page - first_page + 1):
+            images = convert_from_path(pdf_path, poppler_path=poppler_path,
+                                       first_page=first_page, last_page=last_page)
+        page_number = first_page
+        while images:
+            yield page_number, images.pop(0)
+            page_number += 1
+
+def map_pages_in_order(worker, pages, max_workers=OCR_MAX_WORKERS):
+    """Run ``worker(key, item)`` over a stream of (key, item) pairs on a thread pool.
+
+    At most ``max_workers`` items are in flight; results are yielded as
+    (key, result) in input order as soon as each head item completes, so
+    page 1 is processed before later pages have been rendered.
+    """
+    # Workers run under the caller's span, so their ocr/llm spans keep their parent
+    worker = propagate(worker)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pending = deque()
+        for key, item in pages:
+            pending.append((key, executor.submit(worker, key, item)))
+            del item
+            if len(pending) >= max_workers:
+                head_key, future = pending.popleft()
+                yield head_key, future.result()
+        while pending:
+            head_key, future = pending.popleft()
+            yield head_key, future.result()
+
+def batch_pages(pages, batch_size):
+    """Group a (page_number, image) stream into (page_numbers, images) batches."""
+    page_numbers, images = [], []
+    for page_number, image in pages:
+        page_numbers.append(page_number)
+        images.append(image)
+        if len(images) >= batch_size:
+            yield tuple(page_numbers), images
+            page_numbers, images = [], []
+    if images:
+        yield tuple(page_numbers), images
+
+def _ocr_batch(page_numbers, images, page_count, backend):
+    """OCR a batch of rasterized pages; used as the worker function in process_pdf."""
+    for page_number in page_numbers:
+        print(f"Processing page {page_number}/{page_count}")
+    start = time.perf_counter()
+    try:
+        texts = backend.recognize(images)
+    except Exception as e:
+        print(f"Error processing page(s) {', '.join(map(str, page_numbers))}: {str(e)}")
+        texts = ["" for _ in page_numbers]
+    finally:
+        for image in images:
+            image.close()
+    elapsed = time.perf_counter() - start
+    for page_number, text in zip(page_numbers, texts):
+        if not text:
+            print(f"No text detected on page {page_number}")
+    return texts, elapsed / len(page_numbers)
+
+def ocr_pdf_pages(pdf_path, page_count, backend, max_workers=OCR_MAX_WORKERS, page_numbers=None):
+    """Yield (page_number, text, seconds) for a PDF's pages in order, OCR'd with ``backend``.
+
+    ``seconds`` is the OCR time of the page's batch divided by the batch size.
+    """
+    pages = iter_pdf_pages(pdf_path, page_count, page_numbers=page_numbers)
+    batches = batch_pages(pages, backend.batch_size)
+    for batch_numbers, (texts, seconds) in map_pages_in_order(
+            lambda numbers, images: _ocr_batch(numbers, images, page_count, backend),
+            batches, backend.worker_count(max_workers)):
+        for page_number, text in zip(batch_numbers, texts):
+            yield page_number, text, seconds
+
+def join_page_texts(pages):
+    """Join page records into the "--- Page N ---" text layout used for answer extraction."""
+    all_text = []
+    for page in pages:
+        if page["text"]:
+            all_text.append(f"\n--- Page {page['page']} ---\n")
+            all_text.append(page["text"])
+    return '\n'.join(all_text)
+
+def _save_text(pages, output_file):
+    """Write the joined page text to ``output_file`` (the optional on-disk artifact)."""
+    try:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(join_page_texts(pages))
+        print(f"Text extraction complete. Results saved to: {output_file}")
+    except Exception as e:
+        print(f"Error saving results: {str(e)}")
+
+def process_pdf(pdf_path, output_file=None, max_workers=OCR_MAX_WORKERS, backend=None):
+    """Process PDF and extract text from each page.
+
+    Pages are rasterized a window at a time and OCR'd by a pool of at most
+    ``max_workers`` threads using ``backend`` (a name from OCR_BACKENDS, an
+    OCRBackend instance, or None for the configured OCR_BACKEND).
+
+    Returns a list of page records ``{"page", "text", "route", "seconds"}`` in
+    page order, or None if the PDF could not be processed. The joined text is
+    also written to ``output_file`` when one is given.
+    """
+    try:
+        backend = get_ocr_backend(backend)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        return None
+    
     # Convert PDF to images
     print(f"Converting PDF to images: {pdf_path}")
     try:
@@ -68,39 +208,32 @@ def process_pdf(pdf_path, output_file):
             print(f"Error: Poppler not found at {POPPLER_PATH}")
             print("Please download Poppler from: https://github.com/oschwartz10612/poppler-windows/releases/")
             print("Extract it to C:\\Program Files\\poppler-24.08.0\\")
-            return
+            return None
             
-        images = convert_from_path(pdf_path, poppler_path=POPPLER_PATH)
+        page_count = get_pdf_page_count(pdf_path)
     except Exception as e:
         print(f"Error converting PDF to images: {str(e)}")
         print("Please make sure Poppler is installed at the correct path")
-        return
+        return None
     
-    # Extract text from each page
-    all_text = []
-    for i, image in enumerate(images):
-        print(f"Processing page {i+1}/{len(images)}")
-        try:
-            text = extract_text_from_image(image)
-            if text:
-                all_text.append(f"\n--- Page {i+1} ---\n")
-                all_text.append(text)
-            else:
-                print(f"No text detected on page {i+1}")
-        except Exception as e:
-            print(f"Error processing page {i+1}: {str(e)}")
-    
-    if not all_text:
-        print("No text was extracted from any page.")
-        return
-    
-    # Save extracted text to file
+    # Extract text from each page while later pages are still being rendered
+    pages = []
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(all_text))
-        print(f"Text extraction complete. Results saved to: {output_file}")
+        for page_number, text, seconds in ocr_pdf_pages(pdf_path, page_count, backend, max_workers):
+            pages.append({"page": page_number, "text": text, "route": "ocr", "seconds": seconds})
     except Exception as e:
-        print(f"Error saving results: {str(e)}")
+        print(f"Error converting PDF to images: {str(e)}")
+        print("Please make sure Poppler is installed at the correct path")
+        return None
+    
+    stats = get_ocr_cache().stats()
+    print(f"OCR cache: {stats['hits']} hits, {stats['misses']} misses")
+    
+    if not any(page["text"] for page in pages):
+        print("No text was extracted from any page.")
+    elif output_file:
+        _save_text(pages, output_file)
+    return pages
 
 def main():
     # Verify credentials first
@@ -116,7 +249,7 @@ def main():
     
     # Get output file path
     output_file = "output.txt"
-    if len(sys.argv) > 2:
+    if len(sys.argv) > 2 and not sys.argv[2].startswith("--"):
         output_file = sys.argv[2]
     
     if not os.path.exists(pdf_path):
@@ -124,7 +257,10 @@ def main():
         return
     
     try:
-        process_pdf(pdf_path, output_file)
+        if "--hybrid" in sys.argv:
+            process_pdf_hybrid(pdf_path, output_file)
+        else:
+            process_pdf(pdf_path, output_file)
     except Exception as e:
         print(f"An error occurred: {str(e)}")
 
@@ -136,5 +272,126 @@ def process_pdf_pypdf2(pdf_path):
             text += page.extract_text()
     return text
 
+def embedded_text_quality(text):
+    """Return the fraction of non-space characters that look like real glyphs.
+
+    Broken text layers show up as replacement characters, ``(cid:N)`` escapes or
+    control/private-use codepoints; each of those counts against the page.
+    """
+    chars = ''.join(text.split())
+    if not chars:
+        return 0.0
+    bad = chars.count('\ufffd') + 5 * chars.count('(cid:')
+    good = sum(1 for ch in chars if ch.isalnum() or ch in string.punctuation)
+    return max(0, good - bad) / len(chars)
+
+def is_embedded_text_usable(text):
+    """Decide whether a page's embedded text can be used instead of OCR."""
+    if len(''.join(text.split())) < EMBEDDED_TEXT_MIN_CHARS:
+        return False
+    return embedded_text_quality(text) >= EMBEDDED_TEXT_MIN_QUALITY
+
+def route_pdf_pages(pdf_path):
+    """Read each page's embedded text and decide whether the page needs OCR.
+
+    Returns page records ``{"page", "text", "route", "seconds",
+    "embedded_chars", "embedded_quality"}`` where pages routed to "ocr" have
+    empty text, or None if the PDF cannot be read.
+    """
+    print(f"Reading embedded text: {pdf_path}")
+    try:
+        with open(pdf_path, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            embedded = []
+            for page in reader.pages:
+                start = time.perf_counter()
+                try:
+                    text = page.extract_text() or ""
+                except Exception as e:
+                    print(f"Error reading embedded text: {str(e)}")
+                    text = ""
+                embedded.append((text, time.perf_counter() - start))
+    except Exception as e:
+        print(f"Error opening PDF: {str(e)}")
+        return None
+
+    pages = []
+    for page_number, (text, elapsed) in enumerate(embedded, start=1):
+        page = {
+            "page": page_number,
+            "text": text,
+            "route": "text",
+            "seconds": elapsed,
+            "embedded_chars": len(''.join(text.split())),
+            "embedded_quality": round(embedded_text_quality(text), 3),
+        }
+        if not is_embedded_text_usable(text):
+            page["route"] = "ocr"
+            page["text"] = ""
+        count("pdf_pages_total", route=page["route"])
+        pages.append(page)
+    return pages
+
+def print_routing_report(pdf_path, pages):
+    ocr_count = sum(1 for page in pages if page["route"] == "ocr")
+    print(f"Page routing for {pdf_path}:")
+    for page in pages:
+        print(f"  Page {page['page']}: {page['route']} "
+              f"({page['embedded_chars']} embedded chars, quality {page['embedded_quality']}, "
+              f"{page['seconds']:.3f}s)")
+    print(f"{len(pages) - ocr_count} page(s) used embedded text, {ocr_count} page(s) OCR'd")
+
+def check_poppler():
+    """True if Poppler is installed where pdf2image is told to look; prints help otherwise."""
+    if os.path.exists(POPPLER_PATH):
+        return True
+    print(f"Error: Poppler not found at {POPPLER_PATH}")
+    print("Please download Poppler from: https://github.com/oschwartz10612/poppler-windows/releases/")
+    print("Extract it to C:\\Program Files\\poppler-24.08.0\\")
+    return False
+
+def process_pdf_hybrid(pdf_path, output_file=None, max_workers=OCR_MAX_WORKERS, backend=None):
+    """Extract text using the PDF's own text layer where it is good enough.
+
+    Every page's embedded text is checked with is_embedded_text_usable; only the
+    pages that fail are rasterized and OCR'd with ``backend``. Returns page
+    records like process_pdf, with ``route`` set to "text" or "ocr" and the
+    embedded-text statistics that drove the decision; the routing report is
+    also printed. Returns None if the PDF cannot be read.
+    """
+    try:
+        backend = get_ocr_backend(backend)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        return None
+
+    pages = route_pdf_pages(pdf_path)
+    if pages is None:
+        return None
+    page_count = len(pages)
+    ocr_pages = [page["page"] for page in pages if page["route"] == "ocr"]
+
+    if ocr_pages:
+        if not check_poppler():
+            return None
+
+        try:
+            for page_number, text, seconds in ocr_pdf_pages(pdf_path, page_count, backend, max_workers,
+                                                            page_numbers=ocr_pages):
+                pages[page_number - 1]["text"] = text
+                pages[page_number - 1]["seconds"] += seconds
+        except Exception as e:
+            print(f"Error converting PDF to images: {str(e)}")
+            print("Please make sure Poppler is installed at the correct path")
+            return None
+
+    print_routing_report(pdf_path, pages)
+
+    if not any(page["text"] for page in pages):
+        print("No text was extracted from any page.")
+    elif output_file:
+        _save_text(pages, output_file)
+    return pages
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,45 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_results_file(path: str) -> Optional[Dict]:
+    """Load a ``*_results.json`` as {"inputs", "student_answers", "results"}.
+
+    Files written before inputs were recorded (a bare list of results) load
+    with ``inputs`` and ``student_answers`` set to None, so nothing is reused
+    from them. Returns None if the file is missing or unreadable.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if isinstance(data, list):
+        return {"inputs": None, "student_answers": None, "results": data}
+    if not isinstance(data, dict) or not isinstance(data.get("results"), list):
+        return None
+    return {"inputs": data.get("inputs"), "student_answers": data.get("student_answers"),
+            "results": data["results"]}
+
+def write_results_file(path: str, results: List[Dict], inputs: Optional[Dict] = None,
+                       student_answers: Optional[List[str]] = None) -> None:
+    """Write results together with the inputs they were computed from.
+
+    ``inputs`` holds the hashes of the sheet and answer key plus the OCR and
+    grader settings; ``student_answers`` the answers extracted from the sheet,
+    so a later regrade with a different key or grader can skip OCR.
+    """
+    data = {"inputs": inputs, "student_answers": student_answers, "results": results}
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
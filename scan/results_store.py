@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# SQLite file holding graded sheets; replaces one indented JSON file per sheet
+RESULTS_DB = os.getenv(
+    "RESULTS_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "results.sqlite3"))
+
+def _items_key_id(items: Sequence[Tuple[str, str, str]]) -> str:
+    """Stand-in answer-key id for results saved without one: a hash of the questions and ideal answers."""
+    digest = hashlib.sha256()
+    for question, _, ideal_answer in items:
+        digest.update(f"{question}\0{ideal_answer}\0".encode('utf-8'))
+    return digest.hexdigest()
+
+class ResultsStore:
+    """Graded sheets in SQLite, normalized against the answer key.
+
+    Questions and ideal answers are stored once per answer key (by its
+    content hash), a sheet's extracted answers once per sheet, and each
+    graded answer as a (score, feedback, tier) row. A sheet is identified by
+    the name its results were saved under (the old ``*_results.json`` path).
+    Sheets can be looked up by name, by content (sheet hash and OCR
+    settings, for reuse across re-uploads), by answer key (the test) and by
+    question, all through indexes.
+    """
+
+    def __init__(self, path: str = RESULTS_DB):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS key_questions (
+                key_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                ideal_answer TEXT NOT NULL,
+                PRIMARY KEY (key_id, position)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS sheets (
+                sheet_id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE,
+                key_id TEXT NOT NULL,
+                sheet_sha256 TEXT,
+                ocr_settings TEXT,
+                grader_version TEXT,
+                student_answers TEXT NOT NULL,
+                total_score REAL NOT NULL,
+                max_score INTEGER NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sheets_content ON sheets (sheet_sha256, ocr_settings);
+            CREATE INDEX IF NOT EXISTS idx_sheets_key ON sheets (key_id);
+            CREATE TABLE IF NOT EXISTS answers (
+                sheet_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                score REAL NOT NULL,
+                feedback TEXT NOT NULL,
+                tier TEXT,
+                -- Only set when it differs from the sheet's extracted answer at this position
+                student_answer TEXT,
+                PRIMARY KEY (sheet_id, position)
+            ) WITHOUT ROWID;
+        """)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (and per process, since the store is reset after fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def sheet_name(path: str) -> str:
+        return os.path.abspath(path)
+
+    def save_sheet(self, name: str, items: Sequence[Tuple[str, str, str]],
+                   grades: Sequence[Tuple[float, str, str]], inputs: Optional[Dict] = None,
+                   student_answers: Optional[List[str]] = None) -> None:
+        """Store a sheet's (question, student_answer, ideal_answer) items and their grades, replacing earlier ones."""
+        inputs = inputs or {}
+        key_id = inputs.get("answer_key_sha256") or _items_key_id(items)
+        if student_answers is None:
+            student_answers = [item[1] for item in items]
+        total_score = sum(float(score) for score, _, _ in grades)
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO key_questions (key_id, position, question, ideal_answer) VALUES (?, ?, ?, ?)",
+                [(key_id, position, question, ideal_answer)
+                 for position, (question, _, ideal_answer) in enumerate(items)])
+            conn.execute(
+                "INSERT INTO sheets (name, key_id, sheet_sha256, ocr_settings, grader_version, student_answers, "
+                "total_score, max_score, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET key_id = excluded.key_id, sheet_sha256 = excluded.sheet_sha256, "
+                "ocr_settings = excluded.ocr_settings, grader_version = excluded.grader_version, "
+                "student_answers = excluded.student_answers, total_score = excluded.total_score, "
+                "max_score = excluded.max_score, updated = excluded.updated",
+                (name, key_id, inputs.get("sheet_sha256"), inputs.get("ocr_settings"), inputs.get("grader_version"),
+                 json.dumps(student_answers, ensure_ascii=False, separators=(',', ':')),
+                 total_score, len(items) * 10, time.time()))
+            sheet_id = conn.execute("SELECT sheet_id FROM sheets WHERE name = ?", (name,)).fetchone()[0]
+            conn.execute("DELETE FROM answers WHERE sheet_id = ?", (sheet_id,))
+            conn.executemany(
+                "INSERT INTO answers (sheet_id, position, score, feedback, tier, student_answer) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(sheet_id, position, score, feedback, tier,
+                  None if position < len(student_answers) and student_answers[position] == item[1] else item[1])
+                 for position, (item, (score, feedback, tier)) in enumerate(zip(items, grades))])
+
+    def _results(self, sheet: sqlite3.Row, student_answers: List[str]) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT a.position, a.score, a.feedback, a.tier, a.student_answer, q.question, q.ideal_answer "
+            "FROM answers a JOIN key_questions q ON q.key_id = ? AND q.position = a.position "
+            "WHERE a.sheet_id = ? ORDER BY a.position", (sheet["key_id"], sheet["sheet_id"])).fetchall()
+        return [{
+            "question": row["question"],
+            "student_answer": row["student_answer"] if row["student_answer"] is not None
+                              else student_answers[row["position"]],
+            "ideal_answer": row["ideal_answer"],
+            "score": row["score"],
+            "feedback": row["feedback"],
+            "grading_tier": row["tier"],
+        } for row in rows]
+
+    def load_sheet(self, name: str) -> Optional[Dict]:
+        """A sheet as {"inputs", "student_answers", "results"} (like read_results_file), or None."""
+        sheet = self._conn().execute("SELECT * FROM sheets WHERE name = ?", (name,)).fetchone()
+        if sheet is None:
+            return None
+        student_answers = json.loads(sheet["student_answers"])
+        inputs = None
+        if sheet["sheet_sha256"] is not None:
+            inputs = {"sheet_sha256": sheet["sheet_sha256"], "answer_key_sha256": sheet["key_id"],
+                      "ocr_settings": sheet["ocr_settings"], "grader_version": sheet["grader_version"]}
+        return {"inputs": inputs, "student_answers": student_answers,
+                "results": self._results(sheet, student_answers)}
+
+    def delete_sheets(self, names: Sequence[str]) -> int:
+        """Remove the named sheets and their graded answers; returns how many sheets were removed."""
+        conn = self._conn()
+        removed = 0
+        with conn:
+            for name in names:
+                row = conn.execute("SELECT sheet_id FROM sheets WHERE name = ?", (name,)).fetchone()
+                if row is None:
+                    continue
+                conn.execute("DELETE FROM answers WHERE sheet_id = ?", (row["sheet_id"],))
+                conn.execute("DELETE FROM sheets WHERE sheet_id = ?", (row["sheet_id"],))
+                removed += 1
+        return removed
+
+    def has_sheet(self, name: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM sheets WHERE name = ?", (name,)).fetchone() is not None
+
+    def find_sheet(self, sheet_sha256: str, ocr_settings: str) -> Optional[str]:
+        """Name of the most recently saved sheet with this content and OCR settings."""
+        row = self._conn().execute(
+            "SELECT name FROM sheets WHERE sheet_sha256 = ? AND ocr_settings = ? ORDER BY updated DESC LIMIT 1",
+            (sheet_sha256, ocr_settings)).fetchone()
+        return row["name"] if row is not None else None
+
+    def sheet_total(self, name: str) -> Optional[Tuple[float, int]]:
+        """(total score, maximum score) of a sheet without loading its answers."""
+        row = self._conn().execute("SELECT total_score, max_score FROM sheets WHERE name = ?", (name,)).fetchone()
+        return (row["total_score"], row["max_score"]) if row is not None else None
+
+    def test_sheets(self, key_id: str) -> List[Dict]:
+        """Totals of every sheet graded against one answer key."""
+        rows = self._conn().execute(
+            "SELECT name, total_score, max_score, updated FROM sheets WHERE key_id = ? ORDER BY name",
+            (key_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def question_results(self, key_id: str, position: int) -> List[Dict]:
+        """Every sheet's answer to one question of an answer key (0-based position)."""
+        rows = self._conn().execute(
+            "SELECT s.name, s.student_answers, a.score, a.feedback, a.tier, a.student_answer "
+            "FROM sheets s JOIN answers a ON a.sheet_id = s.sheet_id AND a.position = ? "
+            "WHERE s.key_id = ? ORDER BY s.name", (position, key_id)).fetchall()
+        results = []
+        for row in rows:
+            student_answer = row["student_answer"]
+            if student_answer is None:
+                student_answer = json.loads(row["student_answers"])[position]
+            results.append({"name": row["name"], "student_answer": student_answer, "score": row["score"],
+                            "feedback": row["feedback"], "grading_tier": row["tier"]})
+        return results
+
+_results_store = None
+_results_store_lock = threading.Lock()
+
+def get_results_store() -> ResultsStore:
+    """Return the process-wide results store."""
+    global _results_store
+    if _results_store is None:
+        with _results_store_lock:
+            if _results_store is None:
+                _results_store = ResultsStore()
+    return _results_store
+
+def _reset_results_store():
+    """SQLite connections must not be shared with forked children."""
+    global _results_store, _results_store_lock
+    _results_store = None
+    _results_store_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_results_store)
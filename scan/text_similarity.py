@@ -0,0 +1,59 @@
+import string
+import threading
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+_stopwords = None
+_stopwords_lock = threading.Lock()
+
+def english_stopwords() -> frozenset:
+    """NLTK's English stopwords, downloading the corpus on first use if it is missing."""
+    global _stopwords
+    if _stopwords is None:
+        with _stopwords_lock:
+            if _stopwords is None:
+                import nltk
+                from nltk.corpus import stopwords
+                try:
+                    words = stopwords.words("english")
+                except LookupError:
+                    nltk.download("stopwords", quiet=True)
+                    words = stopwords.words("english")
+                _stopwords = frozenset(words)
+    return _stopwords
+
+def preprocess_text(text):
+    # Convert to lowercase
+    text = text.lower()
+    # Remove punctuation
+    text = text.translate(str.maketrans('', '', string.punctuation))
+    # Remove stopwords
+    en_stopwords = english_stopwords()
+    words = text.split()
+    words = [word for word in words if word not in en_stopwords]
+    return ' '.join(words)
+
+def enhanced_sentence_match(expected_answer, student_answer):
+    """Calculate similarity between expected and student answers using TF-IDF and cosine similarity"""
+    # Preprocess both answers
+    expected_processed = preprocess_text(expected_answer)
+    student_processed = preprocess_text(student_answer)
+
+    # Create TF-IDF vectorizer
+    vectorizer = TfidfVectorizer()
+
+    try:
+        # Create TF-IDF matrix
+        tfidf_matrix = vectorizer.fit_transform([expected_processed, student_processed])
+
+        # Calculate cosine similarity
+        similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
+
+        # Convert similarity to a score out of 10
+        score = similarity * 10
+
+        return score
+    except Exception as e:
+        print(f"Error in similarity calculation: {str(e)}")
+        return 0.0
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Append one JSON line per finished span to this file (unset to keep tracing in memory only)
+TRACE_LOG = os.getenv("TRACE_LOG", "")
+# Histogram buckets for stage durations, in seconds: from a cached page to a slow LLM call
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Metric name -> (type, help) for the /metrics exposition
+METRICS = {
+    "grading_stage_seconds": ("histogram", "Time spent in each grading stage (rasterize, ocr, segment, grade, llm, persist, sheet; plan and finish in question-major runs)"),
+    "grading_errors_total": ("counter", "Errors raised or swallowed, by stage"),
+    "grading_fallbacks_total": ("counter", "Answers graded by basic_evaluation instead of the LLM, by reason"),
+    "grading_answers_total": ("counter", "Graded answers by cascade tier or offline scorer"),
+    "grading_cache_lookups_total": ("counter", "LLM grading cache lookups by result"),
+    "ocr_cache_lookups_total": ("counter", "OCR cache lookups by result"),
+    "pdf_pages_total": ("counter", "PDF pages by route: embedded text layer or OCR"),
+}
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Metrics:
+    """In-process counters and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        # name -> labels -> [bucket counts..., +Inf count, sum]
+        self._histograms: Dict[str, Dict[tuple, List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            values[bisect.bisect_left(self.buckets, value)] += 1
+            values[-1] += value
+
+    def snapshot(self) -> Dict:
+        """Counters and histogram count/sum per label set, for tests and reports."""
+        with self._lock:
+            return {
+                "counters": {name: {labels: value for labels, value in series.items()}
+                             for name, series in self._counters.items()},
+                "histograms": {name: {labels: {"count": sum(values[:-1]), "sum": values[-1]}
+                                      for labels, values in series.items()}
+                               for name, series in self._histograms.items()},
+            }
+
+    def render(self) -> str:
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {labels: list(values) for labels, values in series.items()}
+                          for name, series in self._histograms.items()}
+        lines = []
+        for name in sorted(set(counters) | set(histograms)):
+            kind, description = METRICS.get(name, ("counter" if name in counters else "histogram", name))
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(counters.get(name, {}).items()):
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+            for labels, values in sorted(histograms.get(name, {}).items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, values):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', f'{bound:g}'))} {cumulative}")
+                cumulative += values[len(self.buckets)]
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+class Tracer:
+    """Timed spans per sheet, page and question.
+
+    Every span feeds the ``grading_stage_seconds`` histogram; a span that
+    raises also counts towards ``grading_errors_total``. With a trace log
+    path, each finished span is appended to it as one JSON line holding its
+    name, ids, parent, start time, duration, status and attributes. Spans
+    nest per thread, and attributes such as ``sheet`` are inherited by child
+    spans so a sheet's spans can be collected from the log. Work handed to a
+    thread pool keeps its parent span when wrapped with ``propagate``.
+    """
+
+    def __init__(self, metrics: Metrics, log_path: str = TRACE_LOG):
+        self.metrics = metrics
+        self.log_path = log_path
+        self._local = threading.local()
+        self._log_lock = threading.Lock()
+        self._log = None
+
+    def _stack(self) -> List[Dict]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Dict]:
+        """Time the enclosed block as stage ``name``; yields the span's attribute dict for extra fields."""
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        inherited = dict(parent["attributes"]) if parent else {}
+        inherited.update(attributes)
+        current = {
+            "name": name,
+            "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent["span_id"] if parent else None,
+            "attributes": inherited,
+        }
+        stack.append(current)
+        start_time = time.time()
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield current["attributes"]
+        except BaseException as e:
+            status = "error"
+            current["error"] = str(e)
+            self.metrics.count("grading_errors_total", stage=name)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            self.metrics.observe("grading_stage_seconds", duration, stage=name)
+            if self.log_path:
+                record = {"name": name, "trace_id": current["trace_id"], "span_id": current["span_id"],
+                          "parent_id": current["parent_id"], "start": start_time,
+                          "duration": round(duration, 6), "status": status,
+                          "attributes": current["attributes"]}
+                if status == "error":
+                    record["error"] = current["error"]
+                self._write(record)
+
+    def propagate(self, function: Callable) -> Callable:
+        """Wrap ``function`` to run under the calling thread's current span, e.g. on a thread pool."""
+        stack = self._stack()
+        if not stack:
+            return function
+        parent = stack[-1]
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            worker_stack = self._stack()
+            worker_stack.append(parent)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                worker_stack.pop()
+        return wrapper
+
+    def _write(self, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._log_lock:
+                if self._log is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+                    self._log = open(self.log_path, 'a', encoding='utf-8')
+                self._log.write(line)
+                self._log.flush()
+        except OSError as e:
+            print(f"Error writing trace log: {str(e)}")
+
+_metrics = Metrics()
+_tracer = Tracer(_metrics)
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+def span(name: str, **attributes):
+    """Context manager timing one stage; see Tracer.span."""
+    return _tracer.span(name, **attributes)
+
+def traced(name: str):
+    """Decorator form of span() for functions that make up a whole stage."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _tracer.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def propagate(function: Callable) -> Callable:
+    """``function`` bound to the current span, for tasks submitted to a thread pool; see Tracer.propagate."""
+    return _tracer.propagate(function)
+
+def count(name: str, amount: float = 1, **labels) -> None:
+    _metrics.count(name, amount, **labels)
+
+def render_metrics() -> str:
+    """All metrics of this process in the Prometheus text exposition format."""
+    return _metrics.render()
+
+def render_gauge(name: str, description: str, samples: List[Tuple[Dict[str, str], float]],
+                 kind: str = "gauge") -> str:
+    """A value read at scrape time (e.g. circuit breaker state), in the same format as render_metrics.
+
+    ``kind`` is the Prometheus type, e.g. "counter" for totals kept elsewhere.
+    """
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_format_labels(_label_key(labels))} {value:g}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+def _reset_trace_log():
+    """Each forked worker opens its own handle on the trace log."""
+    global _tracer
+    _tracer = Tracer(_metrics, _tracer.log_path)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_trace_log)
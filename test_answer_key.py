@@ -0,0 +1,62 @@
+import os
+import re
+import sys
+import tempfile
+
+from docx import Document
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ml_project.test import load_answer_key
+
+def regex_answer_key(docx_path):
+    """The original ml_project parser: one regex over the whole document text."""
+    full_text = "\n".join(p.text for p in Document(docx_path).paragraphs)
+    qa_pairs = re.findall(r"Q\d+\.\s*(.*?)\nA\d+\.\s*(.*?)(?=\nQ\d+\.|\Z)", full_text, re.DOTALL)
+    return {q.strip(): a.strip() for q, a in qa_pairs}
+
+def write_docx(path, paragraphs):
+    document = Document()
+    for text in paragraphs:
+        document.add_paragraph(text)
+    document.save(path)
+
+KEYS = {
+    "no_separators": ["Q1. What is photosynthesis?", "A1. Plants turning light into energy.",
+                      "Q2. What is osmosis?", "A2. Water moving through a membrane."],
+    "blank_separators": ["Q1. What is photosynthesis?", "A1. Plants turning light into energy.", "",
+                         "Q2. What is osmosis?", "A2. Water moving through a membrane."],
+    "title_and_multiline": ["Biology answer key", "Q1. What is photosynthesis?",
+                            "A1. Plants turning light into energy.", "It happens in chloroplasts.",
+                            "Q2. What is osmosis?", "A2. Water moving through a membrane.", "",
+                            "Q3. Name a gas plants release.", "A3. Oxygen."],
+}
+
+def test_keys_match_the_regex_parser():
+    with tempfile.TemporaryDirectory() as directory:
+        for name, paragraphs in KEYS.items():
+            path = os.path.join(directory, f"{name}.docx")
+            write_docx(path, paragraphs)
+            expected = regex_answer_key(path)
+            assert load_answer_key(path) == expected, name
+            assert len(expected) == sum(1 for text in paragraphs if text.startswith("Q")), name
+
+def test_key_without_separators():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "key.docx")
+        write_docx(path, KEYS["no_separators"])
+        assert load_answer_key(path) == {
+            "What is photosynthesis?": "Plants turning light into energy.",
+            "What is osmosis?": "Water moving through a membrane.",
+        }
+
+def test_bundled_key_matches_the_regex_parser():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "answer_key.docx")
+    assert load_answer_key(path) == regex_answer_key(path)
+
+if __name__ == "__main__":
+    test_keys_match_the_regex_parser()
+    test_key_without_separators()
+    test_bundled_key_matches_the_regex_parser()
+    print("All answer key tests passed")
@@ -0,0 +1,88 @@
+import os
+import sys
+import random
+import tempfile
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Keep the evaluator's grading cache and results store out of the working tree
+_store_dir = tempfile.mkdtemp(prefix="batch_scorer_test_")
+os.environ.setdefault("GRADING_CACHE_PATH", os.path.join(_store_dir, "grading.sqlite3"))
+os.environ.setdefault("RESULTS_DB", os.path.join(_store_dir, "results.sqlite3"))
+
+from scan.answer_key import compile_answer_key
+from scan.batch_scorer import batch_basic_evaluation, MISSING_ANSWER
+from scan.enhanced_evaluator import EnhancedEvaluator
+
+ANSWER_KEY = """Q1. What is photosynthesis?
+Plants use sunlight, water and carbon dioxide to make glucose and oxygen.
+
+Q2. Name the powerhouse of the cell.
+The mitochondria
+
+Q3. A question whose ideal answer was left empty
+
+Q4. What does DNA stand for?
+Deoxyribonucleic acid, the molecule carrying genetic information.
+"""
+
+STUDENTS = [
+    ["Plants use sunlight and water to make glucose", "the MITOCHONDRIA", "anything", "deoxyribonucleic acid"],
+    ["", "", "", ""],
+    ["plants plants plants", "The mitochondria The mitochondria"],  # fewer answers than questions
+    [],
+    ["Plants use sunlight, water and carbon dioxide to make glucose and oxygen. Extra words here.",
+     "nucleus", "", "Deoxyribonucleic acid, the molecule carrying genetic information."],
+]
+
+def compile_key(text):
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as f:
+        f.write(text)
+    try:
+        return compile_answer_key(f.name)
+    finally:
+        os.remove(f.name)
+
+def expected_grades(evaluator, answer_key, student_answers):
+    """basic_evaluation one answer at a time, the way the evaluator grades a single sheet."""
+    return [[evaluator.basic_evaluation(answers[q] if q < len(answers) else MISSING_ANSWER, ideal)
+             for q, ideal in enumerate(answer_key.ideal_answers)]
+            for answers in student_answers]
+
+def assert_same_grades(batch, expected):
+    assert len(batch) == len(expected)
+    for batch_row, expected_row in zip(batch, expected):
+        assert len(batch_row) == len(expected_row)
+        for (score, feedback), (expected_score, expected_feedback) in zip(batch_row, expected_row):
+            assert abs(score - expected_score) < 1e-9, (score, expected_score)
+            assert feedback == expected_feedback
+
+def test_batch_matches_basic_evaluation():
+    answer_key = compile_key(ANSWER_KEY)
+    assert len(answer_key) == 4
+    assert_same_grades(batch_basic_evaluation(answer_key, STUDENTS),
+                       expected_grades(EnhancedEvaluator(), answer_key, STUDENTS))
+
+def test_batch_matches_basic_evaluation_on_random_answers():
+    answer_key = compile_key(ANSWER_KEY)
+    words = sorted({word for answer in answer_key.ideal_answers for word in answer.lower().split()})
+    words += ["unrelated", "Words", "GLUCOSE", ""]
+    rng = random.Random(0)
+    students = [[" ".join(rng.choice(words) for _ in range(rng.randint(0, 12)))
+                 for _ in range(rng.randint(0, len(answer_key)))]
+                for _ in range(200)]
+    assert_same_grades(batch_basic_evaluation(answer_key, students),
+                       expected_grades(EnhancedEvaluator(), answer_key, students))
+
+def test_empty_answer_key():
+    answer_key = compile_key("")
+    assert len(answer_key) == 0
+    assert batch_basic_evaluation(answer_key, STUDENTS) == [[] for _ in STUDENTS]
+    assert batch_basic_evaluation(answer_key, []) == []
+
+if __name__ == "__main__":
+    test_batch_matches_basic_evaluation()
+    test_batch_matches_basic_evaluation_on_random_answers()
+    test_empty_answer_key()
+    print("All batch scorer tests passed")
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Grade with the offline keyword scorer, and keep every store in a scratch directory
+_work_dir = tempfile.mkdtemp(prefix="grading_jobs_test_")
+for _name, _value in (("GRADING_SCORER", "lexical"),
+                      ("GRADING_CACHE_PATH", os.path.join(_work_dir, "grading.sqlite3")),
+                      ("RESULTS_DB", os.path.join(_work_dir, "results.sqlite3")),
+                      ("OCR_CACHE_DIR", os.path.join(_work_dir, "ocr"))):
+    os.environ.setdefault(_name, _value)
+
+from benchmarks.generate_sheets import generate_sheets
+from scan.grading_jobs import GradingJobManager
+from scan.results_store import get_results_store
+
+ANSWER_KEY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "answer_key.docx")
+
+def make_sheets(directory, count=2):
+    return generate_sheets(os.path.join(directory, "generated"), count, ANSWER_KEY, kind="digital")["sheets"]
+
+def run_job(manager, upload_dir, source, results_dir):
+    """Grade ``source`` uploaded as student.pdf, like a re-upload with the same file name."""
+    os.makedirs(upload_dir, exist_ok=True)
+    sheet_path = os.path.join(upload_dir, "student.pdf")
+    shutil.copy(source, sheet_path)
+    job_id = manager.submit([sheet_path], ANSWER_KEY, results_dir)
+    deadline = time.time() + 60
+    while manager.job_state(job_id) in ('queued', 'running'):
+        assert time.time() < deadline, "grading job did not finish"
+        time.sleep(0.05)
+    assert manager.job_state(job_id) == 'completed'
+    return job_id
+
+def stored_names(manager, job_id):
+    conn = manager._conn()
+    return [row["results_name"] for row in conn.execute(
+        "SELECT results_name FROM job_sheets WHERE job_id = ?", (job_id,))]
+
+def test_purge_removes_a_job_and_its_results():
+    directory = tempfile.mkdtemp(dir=_work_dir)
+    first, second = make_sheets(directory)
+    manager = GradingJobManager(os.path.join(directory, "jobs.sqlite3"), retention=0)
+    store = get_results_store()
+    results_dir = os.path.join(directory, "results")
+    old_job = run_job(manager, os.path.join(directory, "uploads"), first, results_dir)
+    old_answers = manager.sheet_results(old_job, 0)
+    new_job = run_job(manager, os.path.join(directory, "uploads"), second, results_dir)
+
+    # Same file name, different sheet: the older job still shows its own answers
+    assert manager.sheet_results(old_job, 0) == old_answers
+    assert manager.sheet_results(new_job, 0) != old_answers
+
+    old_names = stored_names(manager, old_job)
+    assert old_names and all(store.has_sheet(name) for name in old_names)
+    assert manager.purge(old_job)
+    assert manager.status(old_job) is None
+    assert not any(store.has_sheet(name) for name in old_names)
+    assert all(store.has_sheet(name) for name in stored_names(manager, new_job))
+    assert manager.sheet_results(new_job, 0) is not None
+    assert not manager.purge(old_job)
+
+def test_finished_jobs_beyond_retention_are_purged():
+    directory = tempfile.mkdtemp(dir=_work_dir)
+    first, second = make_sheets(directory)
+    manager = GradingJobManager(os.path.join(directory, "jobs.sqlite3"), retention=2)
+    store = get_results_store()
+    results_dir = os.path.join(directory, "results")
+    jobs = [run_job(manager, os.path.join(directory, "uploads"), source, results_dir)
+            for source in (first, second, first, second)]
+    names = {job_id: stored_names(manager, job_id) for job_id in jobs[2:]}
+
+    # Only the two newest jobs (and their results-store rows) are left
+    assert [manager.status(job_id) is not None for job_id in jobs] == [False, False, True, True]
+    assert all(store.has_sheet(name) for job_names in names.values() for name in job_names)
+    with store._conn() as conn:
+        stored = conn.execute("SELECT COUNT(*) FROM sheets WHERE name LIKE ?",
+                              (os.path.abspath(results_dir) + "%",)).fetchone()[0]
+    assert stored == 2
+
+if __name__ == "__main__":
+    test_purge_removes_a_job_and_its_results()
+    test_finished_jobs_beyond_retention_are_purged()
+    print("All grading job tests passed")